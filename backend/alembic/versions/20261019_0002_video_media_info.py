@@ -0,0 +1,16 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0002_video_media_info"
+down_revision = "20250828_0001_init"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("videos", sa.Column("media_info", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("videos", "media_info")
@@ -0,0 +1,31 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0003_worker_nodes"
+down_revision = "20261019_0002_video_media_info"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "worker_nodes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(length=255), nullable=False, unique=True),
+        sa.Column("url", sa.String(length=1024), nullable=False),
+        sa.Column("capacity", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("active_sessions", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("load", sa.String(length=50), nullable=True),
+        sa.Column("last_heartbeat", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+    )
+    op.add_column(
+        "stream_sessions",
+        sa.Column("worker_id", sa.Integer(), sa.ForeignKey("worker_nodes.id", ondelete="SET NULL"), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "worker_id")
+    op.drop_table("worker_nodes")
@@ -0,0 +1,39 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261019_0004_stream_schedules"
+down_revision = "20261019_0003_worker_nodes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stream_schedules",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("name", sa.String(length=255), nullable=False),
+        sa.Column("source_type", postgresql.ENUM("video", "playlist", name="streamsourcetype", create_type=False), nullable=False),
+        sa.Column("source_id", sa.Integer(), nullable=False),
+        sa.Column("destination", sa.String(length=1024), nullable=False),
+        sa.Column("mode", postgresql.ENUM("once", "loop_video", "loop_playlist", name="streammode", create_type=False), nullable=False),
+        sa.Column("kind", sa.Enum("once", "cron", "recurring", name="schedulekind"), nullable=False),
+        sa.Column("run_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("interval_seconds", sa.Integer(), nullable=True),
+        sa.Column("cron", sa.String(length=255), nullable=True),
+        sa.Column("duration_seconds", sa.Integer(), nullable=True),
+        sa.Column("next_run_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_run_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_session_id", sa.Integer(), sa.ForeignKey("stream_sessions.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("enabled", sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+    )
+    op.create_index("ix_stream_schedules_next_run_at", "stream_schedules", ["next_run_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stream_schedules_next_run_at", table_name="stream_schedules")
+    op.drop_table("stream_schedules")
+    op.execute("DROP TYPE IF EXISTS schedulekind")
@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0005_session_hls_mode"
+down_revision = "20261019_0004_stream_schedules"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    hls_mode = sa.Enum("hls", "cmaf", name="hlsmode")
+    hls_mode.create(op.get_bind(), checkfirst=True)
+    op.add_column("stream_sessions", sa.Column("hls_mode", hls_mode, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "hls_mode")
+    op.execute("DROP TYPE IF EXISTS hlsmode")
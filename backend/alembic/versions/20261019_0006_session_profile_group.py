@@ -0,0 +1,20 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0006_session_profile_group"
+down_revision = "20261019_0005_session_hls_mode"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stream_sessions", sa.Column("profile", sa.String(length=32), nullable=True))
+    op.add_column("stream_sessions", sa.Column("group_id", sa.String(length=64), nullable=True))
+    op.create_index("ix_stream_sessions_group_id", "stream_sessions", ["group_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stream_sessions_group_id", table_name="stream_sessions")
+    op.drop_column("stream_sessions", "group_id")
+    op.drop_column("stream_sessions", "profile")
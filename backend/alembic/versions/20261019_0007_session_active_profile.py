@@ -0,0 +1,16 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0007_session_active_profile"
+down_revision = "20261019_0006_session_profile_group"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stream_sessions", sa.Column("active_profile", sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "active_profile")
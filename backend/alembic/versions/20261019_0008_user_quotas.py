@@ -0,0 +1,26 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0008_user_quotas"
+down_revision = "20261019_0007_session_active_profile"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("videos", sa.Column("size_bytes", sa.BigInteger(), nullable=True))
+    op.create_table(
+        "user_quotas",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("max_streams", sa.Integer(), nullable=True),
+        sa.Column("max_encode_seconds", sa.BigInteger(), nullable=True),
+        sa.Column("max_storage_bytes", sa.BigInteger(), nullable=True),
+        sa.Column("encode_seconds_used", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_quotas")
+    op.drop_column("videos", "size_bytes")
@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0009_video_tiering"
+down_revision = "20261019_0008_user_quotas"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("videos", sa.Column("tier", sa.String(length=8), nullable=False, server_default="hot"))
+    op.add_column("videos", sa.Column("last_streamed_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("videos", "last_streamed_at")
+    op.drop_column("videos", "tier")
@@ -0,0 +1,16 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0010_session_overlays"
+down_revision = "20261019_0009_video_tiering"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stream_sessions", sa.Column("overlays", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "overlays")
@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0011_session_stream_type"
+down_revision = "20261019_0010_session_overlays"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    stream_type = sa.Enum("standard", "audio_only", "low_bandwidth", name="streamtype")
+    stream_type.create(op.get_bind(), checkfirst=True)
+    op.add_column("stream_sessions", sa.Column("stream_type", stream_type, nullable=False, server_default="standard"))
+    op.add_column("stream_sessions", sa.Column("image", sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "image")
+    op.drop_column("stream_sessions", "stream_type")
+    op.execute("DROP TYPE IF EXISTS streamtype")
@@ -0,0 +1,16 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0012_session_switchable"
+down_revision = "20261019_0011_session_stream_type"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stream_sessions", sa.Column("switchable", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "switchable")
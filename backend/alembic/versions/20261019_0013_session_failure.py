@@ -0,0 +1,20 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0013_session_failure"
+down_revision = "20261019_0012_session_switchable"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stream_sessions", sa.Column("failure_class", sa.String(length=32), nullable=True))
+    op.add_column("stream_sessions", sa.Column("failure_detail", sa.String(length=512), nullable=True))
+    op.add_column("stream_sessions", sa.Column("retry_count", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    op.drop_column("stream_sessions", "retry_count")
+    op.drop_column("stream_sessions", "failure_detail")
+    op.drop_column("stream_sessions", "failure_class")
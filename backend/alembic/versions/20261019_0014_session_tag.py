@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_0014_session_tag"
+down_revision = "20261019_0013_session_failure"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stream_sessions", sa.Column("tag", sa.String(length=64), nullable=True))
+    op.create_index("ix_stream_sessions_tag", "stream_sessions", ["tag"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stream_sessions_tag", table_name="stream_sessions")
+    op.drop_column("stream_sessions", "tag")
@@ -16,16 +16,140 @@ class Settings:
             "DATABASE_URL",
             "postgresql+psycopg2://postgres:postgres@db:5432/cloud_rtmp",
         )
+        self.db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+        # connections opened at startup so the first requests and stream recovery
+        # do not pay for connection setup
+        self.db_pool_prewarm: int = int(os.getenv("DB_POOL_PREWARM", "4"))
 
         # File storage
         self.videos_dir: Path = Path(os.getenv("VIDEOS_DIR", "/videos"))
 
+        # Derived media (pre-encoded segments, renditions)
+        self.cache_dir: Path = Path(os.getenv("CACHE_DIR", "/cache"))
+        # Storage tiering: videos idle for COLD_AFTER_DAYS (or least recently streamed ones once
+        # HOT_TIER_MAX_BYTES is exceeded) move to COLD_VIDEOS_DIR and are copied back before
+        # they are streamed; derived files in cache_dir are evicted LRU above CACHE_MAX_BYTES
+        self.cold_videos_dir: Path | None = Path(os.environ["COLD_VIDEOS_DIR"]) if os.getenv("COLD_VIDEOS_DIR") else None
+        self.cold_after_days: int = int(os.getenv("COLD_AFTER_DAYS", "14"))
+        self.hot_tier_max_bytes: int = int(os.getenv("HOT_TIER_MAX_BYTES", "0"))
+        self.cache_max_bytes: int = int(os.getenv("CACHE_MAX_BYTES", "0"))
+        self.storage_sweep_interval: int = int(os.getenv("STORAGE_SWEEP_INTERVAL", "3600"))
+        # partial files and orphaned session logs older than this are removed by the sweeper
+        self.temp_file_max_age: int = int(os.getenv("TEMP_FILE_MAX_AGE", "3600"))
+
+        # Local HLS output (tmpfs-backed); segments beyond the list size are deleted by ffmpeg
+        self.hls_dir: Path = Path(os.getenv("HLS_DIR", "/dev/shm/cloudrtmp-hls"))
+        self.hls_segment_seconds: int = int(os.getenv("HLS_SEGMENT_SECONDS", "2"))
+        self.hls_list_size: int = int(os.getenv("HLS_LIST_SIZE", "6"))
+
         # CORS
         self.cors_origins: str = os.getenv("CORS_ORIGINS", "*")
 
         # Streaming behavior
         self.auto_restart_streams: bool = os.getenv("AUTO_RESTART_STREAMS", "1") not in ("0", "false", "False")
 
+        # Content-aware pacing: "auto" detects still / low-motion sources from probe data and
+        # encodes them at reduced fps (or loops a pre-encoded segment); "realtime" always re-encodes
+        self.pacing_mode: str = os.getenv("PACING_MODE", "auto")
+        self.still_fps: int = int(os.getenv("STILL_FPS", "2"))
+        self.still_segment_seconds: int = int(os.getenv("STILL_SEGMENT_SECONDS", "10"))
+        self.low_motion_fps: int = int(os.getenv("LOW_MOTION_FPS", "15"))
+
+        # Loudness is measured once at ingest (loudnorm first pass) and applied as a fixed gain
+        self.loudnorm_enabled: bool = os.getenv("LOUDNORM_ENABLED", "1") not in ("0", "false", "False")
+        self.loudnorm_target: float = float(os.getenv("LOUDNORM_TARGET", "-16"))
+        self.loudnorm_true_peak: float = float(os.getenv("LOUDNORM_TRUE_PEAK", "-1.5"))
+
+        # Segment cache: each video is cut once at ingest into keyframe-aligned MPEG-TS segments
+        # in the default profile's encoding at its own size and frame rate, with its loudness
+        # gain applied; default-profile streams of them are stream copies
+        self.segment_cache_enabled: bool = os.getenv("SEGMENT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+        self.segment_seconds: int = int(os.getenv("SEGMENT_SECONDS", "4"))
+        # segmenting encodes running at once (ingest and background catch-up)
+        self.segment_concurrency: int = int(os.getenv("SEGMENT_CONCURRENCY", "1"))
+
+        # Switchable sessions: every source is normalized to this canvas / frame rate so it
+        # can replace the previous one mid-stream without restarting the encoder
+        self.switch_canvas: str = os.getenv("SWITCH_CANVAS", "1280x720")
+        self.switch_fps: int = int(os.getenv("SWITCH_FPS", "30"))
+
+        # Overlays: images are uploaded to OVERLAYS_DIR, text layers use OVERLAY_FONT
+        self.overlays_dir: Path = Path(os.getenv("OVERLAYS_DIR", "/videos/overlays"))
+        self.overlay_font: str = os.getenv("OVERLAY_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+
+        # Starts for the same source within this window share one ffmpeg process (0 disables)
+        self.shared_decode_window_ms: int = int(os.getenv("SHARED_DECODE_WINDOW_MS", "200"))
+        # process spawns / terminations running at once in a batch start, stop or restart
+        self.batch_concurrency: int = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+        # Adaptive bitrate: step a stream down the profile ladder when ffmpeg falls behind
+        # (speed / dropped frames) and back up to the requested profile once it keeps up again
+        self.abr_enabled: bool = os.getenv("ABR_ENABLED", "1") not in ("0", "false", "False")
+        self.abr_down_speed: float = float(os.getenv("ABR_DOWN_SPEED", "0.97"))
+        self.abr_up_speed: float = float(os.getenv("ABR_UP_SPEED", "1.0"))
+        self.abr_down_seconds: float = float(os.getenv("ABR_DOWN_SECONDS", "10"))
+        self.abr_up_seconds: float = float(os.getenv("ABR_UP_SECONDS", "120"))
+        self.abr_hold_seconds: float = float(os.getenv("ABR_HOLD_SECONDS", "20"))
+
+        # Failure analysis: the last STDERR_RING_LINES non-progress lines of each process are
+        # kept to classify why ffmpeg died; retries follow a per-class policy (services.health)
+        self.health_retry_enabled: bool = os.getenv("HEALTH_RETRY_ENABLED", "1") not in ("0", "false", "False")
+        self.stderr_ring_lines: int = int(os.getenv("STDERR_RING_LINES", "50"))
+        self.health_slow_speed: float = float(os.getenv("HEALTH_SLOW_SPEED", "0.8"))
+        # a run that stayed up this long starts its retry count over
+        self.health_stable_seconds: float = float(os.getenv("HEALTH_STABLE_SECONDS", "300"))
+
+        # ffmpeg processes run detached in their own process group and log to files under
+        # runtime_dir so a restarted backend can re-adopt them instead of cutting the stream
+        self.detach_streams: bool = os.getenv("DETACH_STREAMS", "1") not in ("0", "false", "False")
+        self.runtime_dir: Path = Path(os.getenv("RUNTIME_DIR", "/tmp/cloudrtmp"))
+        self.stream_log_max_bytes: int = int(os.getenv("STREAM_LOG_MAX_BYTES", str(1024 * 1024)))
+        self.stream_log_poll_interval: float = float(os.getenv("STREAM_LOG_POLL_INTERVAL", "0.25"))
+
+        # Quotas (0 = unlimited). Role defaults apply unless a user has an override row;
+        # usage is counted in memory and reconciled with the DB every QUOTA_RECONCILE_INTERVAL
+        self.quota_user_streams: int = int(os.getenv("QUOTA_USER_STREAMS", "0"))
+        self.quota_user_encode_seconds: int = int(os.getenv("QUOTA_USER_ENCODE_SECONDS", "0"))
+        self.quota_user_storage_bytes: int = int(os.getenv("QUOTA_USER_STORAGE_BYTES", "0"))
+        self.quota_admin_streams: int = int(os.getenv("QUOTA_ADMIN_STREAMS", "0"))
+        self.quota_admin_encode_seconds: int = int(os.getenv("QUOTA_ADMIN_ENCODE_SECONDS", "0"))
+        self.quota_admin_storage_bytes: int = int(os.getenv("QUOTA_ADMIN_STORAGE_BYTES", "0"))
+        # concurrent streams across all users on this deployment
+        self.host_max_streams: int = int(os.getenv("HOST_MAX_STREAMS", "0"))
+        self.quota_reconcile_interval: int = int(os.getenv("QUOTA_RECONCILE_INTERVAL", "30"))
+
+        # Destination preflight before a start: DNS (cached), TCP connect and optionally the
+        # RTMP handshake, per host:port; results are reused for PREFLIGHT_CACHE_SECONDS
+        self.preflight_enabled: bool = os.getenv("PREFLIGHT_ENABLED", "1") not in ("0", "false", "False")
+        self.preflight_handshake: bool = os.getenv("PREFLIGHT_HANDSHAKE", "1") not in ("0", "false", "False")
+        self.preflight_timeout: float = float(os.getenv("PREFLIGHT_TIMEOUT", "3"))
+        self.preflight_cache_seconds: float = float(os.getenv("PREFLIGHT_CACHE_SECONDS", "10"))
+        self.preflight_dns_ttl: float = float(os.getenv("PREFLIGHT_DNS_TTL", "300"))
+
+        # Scheduled streams: sources are probed and destinations checked this long before the slot
+        self.schedule_prewarm_seconds: int = int(os.getenv("SCHEDULE_PREWARM_SECONDS", "10"))
+        # a slot missed while the backend was down still starts if it is at most this late
+        self.schedule_missed_grace_seconds: int = int(os.getenv("SCHEDULE_MISSED_GRACE_SECONDS", "60"))
+
+        # Worker nodes: a shared token enables the worker API; sessions are then placed on
+        # the least-loaded registered worker and run locally only when none has room
+        self.worker_token: str = os.getenv("WORKER_TOKEN", "")
+        self.worker_heartbeat_timeout: int = int(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+        # worker agent side (python -m app.worker)
+        self.api_url: str = os.getenv("API_URL", "http://backend:8000")
+        self.worker_name: str = os.getenv("WORKER_NAME", os.getenv("HOSTNAME", "worker"))
+        self.worker_url: str = os.getenv("WORKER_URL", "http://localhost:8100")
+        self.worker_port: int = int(os.getenv("WORKER_PORT", "8100"))
+        self.worker_capacity: int = int(os.getenv("WORKER_CAPACITY", "4"))
+        self.worker_flush_interval: float = float(os.getenv("WORKER_FLUSH_INTERVAL", "1.0"))
+
+        # Diagnostics (opt-in)
+        self.profiling_enabled: bool = os.getenv("PROFILING_ENABLED", "0") not in ("0", "false", "False")
+        self.loop_lag_interval_ms: int = int(os.getenv("LOOP_LAG_INTERVAL_MS", "250"))
+        # asyncio debug mode with this slow-callback threshold; 0 disables
+        self.slow_callback_ms: int = int(os.getenv("SLOW_CALLBACK_MS", "0"))
+
 
 settings = Settings()
 
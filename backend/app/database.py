@@ -1,4 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from pathlib import Path
 from typing import Generator
 
 from sqlalchemy import create_engine
@@ -7,9 +9,15 @@ from sqlalchemy.orm import sessionmaker
 from .config import settings
 
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+_pool_args = {}
+if not settings.database_url.startswith("sqlite"):
+    _pool_args = {"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow}
+
+engine = create_engine(settings.database_url, pool_pre_ping=True, **_pool_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ALEMBIC_DIR = Path(__file__).resolve().parent.parent / "alembic"
+
 
 def get_db() -> Generator:
     db = SessionLocal()
@@ -19,3 +27,26 @@ def get_db() -> Generator:
         db.close()
 
 
+def schema_at_head() -> bool:
+    # true when Alembic already migrated the DB to the latest revision
+    try:
+        from alembic.runtime.migration import MigrationContext
+        from alembic.script import ScriptDirectory
+
+        heads = set(ScriptDirectory(str(ALEMBIC_DIR)).get_heads())
+        with engine.connect() as conn:
+            current = set(MigrationContext.configure(conn).get_current_heads())
+    except Exception:
+        return False
+    return bool(current) and current == heads
+
+
+def prewarm_pool(count: int) -> None:
+    # open the connections in parallel, then hand them back to the pool
+    count = min(count, settings.db_pool_size)
+    if count <= 0:
+        return
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        conns = list(pool.map(lambda _: engine.connect(), range(count)))
+    for conn in conns:
+        conn.close()
@@ -1,11 +1,13 @@
+import hmac
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
+from .config import settings
 from .database import get_db
-from .models import User
+from .models import User, UserRole
 from .utils.security import decode_token
 
 
@@ -32,3 +34,12 @@ def get_current_user(
     return user
 
 
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.role != UserRole.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return current_user
+
+
+def require_worker_token(x_worker_token: Annotated[str | None, Header()] = None) -> None:
+    if not settings.worker_token or not x_worker_token or not hmac.compare_digest(x_worker_token, settings.worker_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid worker token")
@@ -1,4 +1,6 @@
+import logging
 import os
+import time
 from pathlib import Path
 
 import asyncio
@@ -7,12 +9,26 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from .config import settings
-from .database import engine
+from .database import SessionLocal, engine, prewarm_pool, schema_at_head
 from .models import Base
 
 
+logger = logging.getLogger(__name__)
+
+
+def prepare_database() -> None:
+    # Alembic-managed databases skip the metadata reflection of create_all
+    if not schema_at_head():
+        # Create tables if not using Alembic yet (safe no-op if already exist)
+        Base.metadata.create_all(bind=engine)
+    prewarm_pool(settings.db_pool_prewarm)
+
+
 def create_app() -> FastAPI:
+    boot_started = time.perf_counter()
     app = FastAPI(title=settings.app_name)
+    # startup timings in seconds; stream downtime across a restart is roughly boot + recovery
+    app.state.startup = {}
 
     # CORS
     allow_origins = (
@@ -28,12 +44,11 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # Create tables if not using Alembic yet (safe no-op if already exist)
-    Base.metadata.create_all(bind=engine)
-
     # Ensure videos directory exists and mount static serving for preview
     Path(settings.videos_dir).mkdir(parents=True, exist_ok=True)
     app.mount("/videos", StaticFiles(directory=str(settings.videos_dir)), name="videos")
+    Path(settings.hls_dir).mkdir(parents=True, exist_ok=True)
+    app.mount("/hls", StaticFiles(directory=str(settings.hls_dir)), name="hls")
 
     # Routers
     from .routers import auth as auth_router
@@ -42,42 +57,100 @@ def create_app() -> FastAPI:
     from .routers import streams as streams_router
     from .routers import logs as logs_router
     from .routers import ws as ws_router
+    from .routers import diagnostics as diagnostics_router
+    from .routers import workers as workers_router
+    from .routers import schedules as schedules_router
+    from .routers import quotas as quotas_router
 
     app.include_router(auth_router.router, prefix="/api/auth", tags=["auth"])
     app.include_router(videos_router.router, prefix="/api/videos", tags=["videos"])
     app.include_router(playlists_router.router, prefix="/api/playlists", tags=["playlists"])
     app.include_router(streams_router.router, prefix="/api/streams", tags=["streams"])
     app.include_router(logs_router.router, prefix="/api/logs", tags=["logs"])
+    app.include_router(diagnostics_router.router, prefix="/api/diagnostics", tags=["diagnostics"])
+    app.include_router(workers_router.router, prefix="/api/workers", tags=["workers"])
+    app.include_router(schedules_router.router, prefix="/api/schedules", tags=["schedules"])
+    app.include_router(quotas_router.router, prefix="/api/quotas", tags=["quotas"])
     app.include_router(ws_router.router)
 
+    if settings.profiling_enabled:
+        from .services.profiling import profiler
+
+        @app.on_event("startup")
+        async def _startup_profiling():
+            profiler.start()
+
     @app.get("/api/health")
     def health() -> dict:
-        return {"status": "ok", "app": settings.app_name}
+        return {"status": "ok", "app": settings.app_name, "startup": app.state.startup}
 
-    if settings.auto_restart_streams:
-        from .database import SessionLocal
-        from .models import StreamSession, StreamStatus
-        from .services.ffmpeg_runner import start_ffmpeg
-
-        async def restart_running_streams() -> None:
-            db = SessionLocal()
-            try:
-                sessions = db.query(StreamSession).filter(StreamSession.status == StreamStatus.running).all()
-                for s in sessions:
-                    # reset pid to ensure fresh process
-                    s.pid = None
-                    db.commit()
-                    await start_ffmpeg(db, s)
-            finally:
-                db.close()
+    from .services import ffmpeg_runner
+    from .services.quotas import quotas
+    from .services.scheduler import scheduler
 
-        @app.on_event("startup")
-        async def _startup_restart():
+    @app.on_event("shutdown")
+    async def _shutdown_drain():
+        # leave detached ffmpeg processes running for the next instance to adopt
+        ffmpeg_runner.begin_drain()
+
+    def load_quotas() -> None:
+        db = SessionLocal()
+        try:
+            quotas.load(db)
+        finally:
+            db.close()
+
+    async def restart_running_streams() -> None:
+        from .models import StreamSession, StreamStatus
+        from .services.source_cache import source_cache
+
+        t0 = time.perf_counter()
+        db = SessionLocal()
+        try:
+            sessions = db.query(StreamSession).filter(StreamSession.status == StreamStatus.running).all()
+            restart = []
+            for s in sessions:
+                # sequential: members of a shared-decode group attach to the run adopted first
+                if await ffmpeg_runner.adopt_ffmpeg(db, s):
+                    continue
+                # reset pid to ensure fresh process
+                s.pid = None
+                restart.append(s)
+            db.commit()
+            source_cache.preload(db, {(s.source_type, s.source_id) for s in restart})
+            # started together so sessions of the same source share a decode again
+            await asyncio.gather(*(ffmpeg_runner.start_ffmpeg(db, s) for s in restart), return_exceptions=True)
+        finally:
+            db.close()
+        app.state.startup["recovery"] = round(time.perf_counter() - t0, 3)
+        logger.info("stream recovery finished in %.3fs", app.state.startup["recovery"])
+
+    @app.on_event("startup")
+    async def _startup():
+        t0 = time.perf_counter()
+        await asyncio.to_thread(prepare_database)
+        app.state.startup["database"] = round(time.perf_counter() - t0, 3)
+
+        # recovery goes first: it bounds how long running streams stay down
+        if settings.auto_restart_streams:
             asyncio.create_task(restart_running_streams())
+        # counters must be loaded before scheduled starts check them
+        await asyncio.to_thread(load_quotas)
+        scheduler.start()
+        asyncio.create_task(quotas.reconcile_loop(SessionLocal))
+        # always on: besides tiering and cache eviction it clears leftover temp files and logs
+        from .services.storage import storage_sweeper
 
-    return app
+        asyncio.create_task(storage_sweeper(SessionLocal))
+        if settings.worker_token:
+            from .services.workers import monitor_workers
 
+            asyncio.create_task(monitor_workers(SessionLocal))
 
-app = create_app()
+        app.state.startup["total"] = round(time.perf_counter() - boot_started, 3)
+        logger.info("startup finished in %.3fs", app.state.startup["total"])
+
+    return app
 
 
+app = create_app()
@@ -2,11 +2,13 @@ from datetime import datetime
 from enum import Enum
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     CheckConstraint,
     Column,
     DateTime,
     Enum as SAEnum,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -41,6 +43,31 @@ class StreamMode(str, Enum):
     loop_playlist = "loop_playlist"
 
 
+class StreamType(str, Enum):
+    standard = "standard"
+    # source audio over a looped still picture (no video encode)
+    audio_only = "audio_only"
+    low_bandwidth = "low_bandwidth"
+
+
+class HlsMode(str, Enum):
+    hls = "hls"
+    cmaf = "cmaf"
+
+
+class OverlayType(str, Enum):
+    image = "image"
+    text = "text"
+    clock = "clock"
+    ticker = "ticker"
+
+
+class ScheduleKind(str, Enum):
+    once = "once"
+    cron = "cron"
+    recurring = "recurring"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -63,12 +90,31 @@ class Video(Base):
     id = Column(Integer, primary_key=True)
     filename = Column(String(255), nullable=False)
     filepath = Column(String(1024), nullable=False)
+    # ffprobe output + content classification (JSON), filled at ingest
+    media_info = Column(Text, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    # "hot" (videos_dir) or "cold" (cold_videos_dir); see services.storage
+    tier = Column(String(8), nullable=False, default="hot", server_default="hot")
+    last_streamed_at = Column(DateTime(timezone=True), nullable=True)
     uploaded_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     uploader = relationship("User", back_populates="videos")
 
 
+class UserQuota(Base):
+    __tablename__ = "user_quotas"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # per-user overrides of the role defaults; NULL keeps the default, 0 means unlimited
+    max_streams = Column(Integer, nullable=True)
+    max_encode_seconds = Column(BigInteger, nullable=True)
+    max_storage_bytes = Column(BigInteger, nullable=True)
+    # accumulated encode time, flushed from the in-memory counters
+    encode_seconds_used = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
 class Playlist(Base):
     __tablename__ = "playlists"
 
@@ -105,13 +151,82 @@ class StreamSession(Base):
     source_id = Column(Integer, nullable=False)
     destination = Column(String(1024), nullable=False)
     mode = Column(SAEnum(StreamMode), nullable=False)
+    stream_type = Column(SAEnum(StreamType), nullable=False, default=StreamType.standard, server_default="standard")
+    # cover picture (file in overlays_dir) for audio_only streams
+    image = Column(String(255), nullable=True)
     status = Column(SAEnum(StreamStatus), nullable=False, default=StreamStatus.stopped)
     pid = Column(Integer, nullable=True)
     start_time = Column(DateTime(timezone=True), nullable=True)
     end_time = Column(DateTime(timezone=True), nullable=True)
     avg_bitrate = Column(String(50), nullable=True)
+    # set when the ffmpeg process runs on a remote worker node instead of the API host
+    worker_id = Column(Integer, ForeignKey("worker_nodes.id", ondelete="SET NULL"), nullable=True)
+    # optional local HLS / low-latency CMAF output next to the RTMP push
+    hls_mode = Column(SAEnum(HlsMode), nullable=True)
+    # encoder profile name (see services.profiles); None uses the default profile
+    profile = Column(String(32), nullable=True)
+    # profile currently encoded when adaptive bitrate stepped below `profile`
+    active_profile = Column(String(32), nullable=True)
+    # sessions sharing one ffmpeg process (one decode, one encoder per output) carry the same id
+    group_id = Column(String(64), nullable=True, index=True)
+    # fed through a long-lived encoder whose source can be switched while running
+    switchable = Column(Boolean, nullable=False, default=False)
+    # burned-in graphics layers (JSON list, see services.overlays)
+    overlays = Column(Text, nullable=True)
+    # why the last ffmpeg process died (see services.health) and retries since the last stable run
+    failure_class = Column(String(32), nullable=True)
+    failure_detail = Column(String(512), nullable=True)
+    retry_count = Column(Integer, nullable=False, default=0)
+    # free-form label for fleet operations (batch stop / restart by tag)
+    tag = Column(String(64), nullable=True, index=True)
 
     user = relationship("User", back_populates="stream_sessions")
+    worker = relationship("WorkerNode")
+
+    @property
+    def hls_url(self) -> str | None:
+        if self.hls_mode is None:
+            return None
+        playlist = "master.m3u8" if self.hls_mode == HlsMode.cmaf else "index.m3u8"
+        return f"/hls/{self.id}/{playlist}"
+
+
+class WorkerNode(Base):
+    __tablename__ = "worker_nodes"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), unique=True, nullable=False)
+    url = Column(String(1024), nullable=False)
+    capacity = Column(Integer, nullable=False, default=1)
+    active_sessions = Column(Integer, nullable=False, default=0)
+    load = Column(String(50), nullable=True)
+    last_heartbeat = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class StreamSchedule(Base):
+    __tablename__ = "stream_schedules"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(255), nullable=False)
+    source_type = Column(SAEnum(StreamSourceType), nullable=False)
+    source_id = Column(Integer, nullable=False)
+    destination = Column(String(1024), nullable=False)
+    mode = Column(SAEnum(StreamMode), nullable=False)
+    kind = Column(SAEnum(ScheduleKind), nullable=False)
+    # once: run_at; recurring: first run at run_at then every interval_seconds; cron: UTC cron expression
+    run_at = Column(DateTime(timezone=True), nullable=True)
+    interval_seconds = Column(Integer, nullable=True)
+    cron = Column(String(255), nullable=True)
+    duration_seconds = Column(Integer, nullable=True)
+    next_run_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    last_run_at = Column(DateTime(timezone=True), nullable=True)
+    last_session_id = Column(Integer, ForeignKey("stream_sessions.id", ondelete="SET NULL"), nullable=True)
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    user = relationship("User")
 
 
 class Log(Base):
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..dependencies import get_current_admin
+from ..models import User
+from ..services.ffmpeg_runner import runtime_stats
+from ..services.preflight import preflight
+from ..services.profiling import dump_stacks, process_memory, profile_event_loop, profiler
+from ..services.quotas import quotas
+from ..services.source_cache import source_cache
+from ..services.websocket_manager import ws_manager
+
+
+router = APIRouter()
+
+
+@router.get("/latency")
+def latency_report(current_user: User = Depends(get_current_admin)):
+    return profiler.report()
+
+
+@router.post("/profiling/{action}")
+async def toggle_profiling(action: str, current_user: User = Depends(get_current_admin)):
+    if action == "start":
+        profiler.start()
+    elif action == "stop":
+        profiler.stop()
+    else:
+        raise HTTPException(status_code=400, detail="Unknown action")
+    return {"enabled": profiler.enabled}
+
+
+@router.get("/profile")
+async def profile_snapshot(
+    seconds: float = Query(5.0, gt=0, le=60),
+    limit: int = Query(30, gt=0, le=200),
+    current_user: User = Depends(get_current_admin),
+):
+    return {"seconds": seconds, "report": await profile_event_loop(seconds, limit)}
+
+
+@router.get("/stacks")
+async def stack_snapshot(current_user: User = Depends(get_current_admin)):
+    return await dump_stacks()
+
+
+@router.get("/memory")
+def memory_report(current_user: User = Depends(get_current_admin)):
+    # long-lived in-process state; entries should track running sessions, not total ever started
+    return {
+        "process": process_memory(),
+        "components": {
+            "runner": runtime_stats(),
+            "websockets": ws_manager.stats(),
+            "source_cache": source_cache.stats(),
+            "quotas": quotas.stats(),
+            "profiler": profiler.stats(),
+            "preflight": preflight.stats(),
+        },
+    }
@@ -7,6 +7,7 @@ from ..database import get_db
 from ..dependencies import get_current_user
 from ..models import Log, Playlist, PlaylistItem, User, Video
 from ..schemas import PlaylistCreate, PlaylistOut
+from ..services.source_cache import source_cache
 
 
 router = APIRouter()
@@ -50,6 +51,7 @@ def add_item(playlist_id: int, video_id: int, db: Session = Depends(get_db), cur
     item = PlaylistItem(playlist_id=playlist_id, video_id=video_id, order_index=next_order)
     db.add(item)
     db.commit()
+    source_cache.invalidate_playlist(playlist_id)
     db.refresh(playlist)
     return playlist
 
@@ -66,6 +68,7 @@ def reorder_playlist(playlist_id: int, order: List[int], db: Session = Depends(g
     for idx, item_id in enumerate(order, start=1):
         id_to_item[item_id].order_index = idx
     db.commit()
+    source_cache.invalidate_playlist(playlist_id)
     return {"status": "ok"}
 
 
@@ -76,6 +79,7 @@ def delete_playlist(playlist_id: int, db: Session = Depends(get_db), current_use
         raise HTTPException(status_code=404, detail="Not found")
     db.delete(playlist)
     db.commit()
+    source_cache.invalidate_playlist(playlist_id)
     return {"status": "deleted"}
 
 
@@ -0,0 +1,40 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..dependencies import get_current_admin, get_current_user
+from ..models import User, UserQuota
+from ..schemas import QuotaUpdate, QuotaUsageOut
+from ..services.quotas import quotas
+
+
+router = APIRouter()
+
+
+@router.get("/me", response_model=QuotaUsageOut)
+def my_quota(current_user: User = Depends(get_current_user)):
+    return quotas.usage(current_user)
+
+
+@router.get("/", response_model=List[QuotaUsageOut])
+def list_quotas(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin)):
+    return [quotas.usage(user) for user in db.query(User).order_by(User.id.asc()).all()]
+
+
+@router.put("/{user_id}", response_model=QuotaUsageOut)
+def set_quota(user_id: int, payload: QuotaUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_admin)):
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    quota = db.query(UserQuota).filter(UserQuota.user_id == user_id).first()
+    if quota is None:
+        quota = UserQuota(user_id=user_id, encode_seconds_used=0)
+        db.add(quota)
+    quota.max_streams = payload.max_streams
+    quota.max_encode_seconds = payload.max_encode_seconds
+    quota.max_storage_bytes = payload.max_storage_bytes
+    db.commit()
+    quotas.set_override(quota)
+    return quotas.usage(user)
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..dependencies import get_current_user
+from ..models import Log, ScheduleKind, StreamSchedule, User
+from ..schemas import ScheduleCreate, ScheduleOut
+from ..services.cron import CronExpression
+from ..services.scheduler import compute_next_run, scheduler
+
+
+router = APIRouter()
+
+
+# a timed slot longer than this is almost certainly a unit mistake
+MAX_DURATION_SECONDS = 7 * 24 * 3600
+
+
+def _invalid(detail: str) -> HTTPException:
+    return HTTPException(status_code=422, detail=detail)
+
+
+def _validate(payload: ScheduleCreate) -> None:
+    if payload.kind in (ScheduleKind.once, ScheduleKind.recurring) and payload.run_at is None:
+        raise _invalid("run_at is required")
+    if payload.run_at is not None and payload.run_at.tzinfo is None:
+        raise _invalid("run_at must include a timezone")
+    if payload.kind == ScheduleKind.recurring and not payload.interval_seconds:
+        raise _invalid("interval_seconds is required")
+    if payload.interval_seconds is not None and payload.interval_seconds <= 0:
+        raise _invalid("interval_seconds must be positive")
+    if payload.duration_seconds is not None:
+        if not 0 < payload.duration_seconds <= MAX_DURATION_SECONDS:
+            raise _invalid(f"duration_seconds must be between 1 and {MAX_DURATION_SECONDS}")
+        if payload.kind == ScheduleKind.recurring and payload.duration_seconds > payload.interval_seconds:
+            raise _invalid("duration_seconds must not exceed interval_seconds")
+    if payload.kind == ScheduleKind.cron:
+        try:
+            # also rejects expressions that parse but can never fire, e.g. "0 0 31 2 *"
+            CronExpression(payload.cron or "").next_after(datetime.now(timezone.utc))
+        except ValueError as exc:
+            raise _invalid(str(exc))
+
+
+def _get_owned(db: Session, schedule_id: int, user: User) -> StreamSchedule:
+    schedule = db.query(StreamSchedule).filter(StreamSchedule.id == schedule_id, StreamSchedule.user_id == user.id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+
+@router.get("/", response_model=List[ScheduleOut])
+def list_schedules(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return (
+        db.query(StreamSchedule)
+        .filter(StreamSchedule.user_id == current_user.id)
+        .order_by(StreamSchedule.next_run_at.asc())
+        .all()
+    )
+
+
+@router.post("/", response_model=ScheduleOut)
+def create_schedule(payload: ScheduleCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    _validate(payload)
+    schedule = StreamSchedule(user_id=current_user.id, **payload.dict())
+    schedule.next_run_at = compute_next_run(schedule, datetime.now(timezone.utc))
+    if schedule.next_run_at is None:
+        raise _invalid("Schedule has no future run")
+    db.add(schedule)
+    db.add(Log(user_id=current_user.id, action="create_schedule", details=payload.name))
+    db.commit()
+    db.refresh(schedule)
+    scheduler.upsert(schedule)
+    return schedule
+
+
+@router.post("/{schedule_id}/enabled/{enabled}", response_model=ScheduleOut)
+def set_enabled(schedule_id: int, enabled: bool, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    schedule = _get_owned(db, schedule_id, current_user)
+    schedule.enabled = enabled
+    if enabled:
+        schedule.next_run_at = compute_next_run(schedule, datetime.now(timezone.utc))
+    db.commit()
+    db.refresh(schedule)
+    scheduler.upsert(schedule)
+    return schedule
+
+
+@router.get("/{schedule_id}/prewarm")
+def prewarm_status(schedule_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    _get_owned(db, schedule_id, current_user)
+    return scheduler.warm.get(schedule_id) or {"ok": None}
+
+
+@router.delete("/{schedule_id}")
+def delete_schedule(schedule_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    schedule = _get_owned(db, schedule_id, current_user)
+    db.delete(schedule)
+    db.commit()
+    scheduler.remove(schedule_id)
+    return {"status": "deleted"}
@@ -1,15 +1,45 @@
 import asyncio
+import json
+from contextlib import nullcontext
+from dataclasses import asdict
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
+from ..config import settings
 from ..database import get_db
-from ..dependencies import get_current_user
-from ..models import StreamSession, StreamStatus, User, UserRole
-from ..schemas import StreamStartRequest, StreamStatusOut
+from ..dependencies import get_current_admin, get_current_user
+from ..models import StreamSession, StreamStatus, StreamType, User, UserRole
+from ..schemas import (
+    BatchItemResult,
+    OverlayLayer,
+    PreflightRequest,
+    PreflightResultOut,
+    StreamBatchSelect,
+    StreamBatchStartRequest,
+    StreamGroupStartRequest,
+    StreamStartRequest,
+    StreamStatusOut,
+    StreamSwitchRequest,
+)
 from ..services.websocket_manager import ws_manager
-from ..services.ffmpeg_runner import start_ffmpeg, stop_ffmpeg
+from ..services.ffmpeg_runner import (
+    batched_writes,
+    begin_drain,
+    drain_stop_all,
+    is_draining,
+    release_for_restart,
+    start_ffmpeg,
+    stop_session,
+    stop_sessions,
+    switch_source,
+    watched_sessions,
+)
+from ..services.overlays import overlay_image_path
+from ..services.preflight import PreflightError, preflight
+from ..services.profiles import LOW_BANDWIDTH_PROFILE, PROFILES
+from ..services.quotas import QuotaExceeded, quotas
 
 
 router = APIRouter()
@@ -23,43 +53,295 @@ def get_status(session_id: int, db: Session = Depends(get_db), current_user: Use
     return session
 
 
-@router.post("/start", response_model=StreamStatusOut)
-async def start_stream(payload: StreamStartRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    session = StreamSession(
-        user_id=current_user.id,
+def _reserve_quota(user: User, count: int = 1):
+    # held until the `with` block ends; starts that never acquire give their slot back
+    try:
+        return quotas.reserve(user, count)
+    except QuotaExceeded as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
+
+
+async def _start_or_release(db: Session, session: StreamSession) -> None:
+    quotas.acquire(session.user_id, session.id)
+    try:
+        await start_ffmpeg(db, session)
+    except Exception:
+        quotas.release(session.id)
+        session.status = StreamStatus.stopped
+        db.commit()
+        raise
+
+
+def _overlays_json(layers: Optional[List[OverlayLayer]], user: User) -> Optional[str]:
+    if not layers:
+        return None
+    for layer in layers:
+        if layer.image and not overlay_image_path(user.id, layer.image).exists():
+            raise HTTPException(status_code=400, detail=f"Overlay image not found: {layer.image}")
+    return json.dumps([json.loads(layer.json(exclude_none=True)) for layer in layers], sort_keys=True)
+
+
+def _stream_type_fields(stream_type: StreamType, image: Optional[str], profile: Optional[str], user: User) -> dict:
+    if image and not overlay_image_path(user.id, image).exists():
+        raise HTTPException(status_code=400, detail=f"Image not found: {image}")
+    if stream_type == StreamType.low_bandwidth and profile is None:
+        profile = LOW_BANDWIDTH_PROFILE
+    return {"stream_type": stream_type, "image": image, "profile": profile}
+
+
+async def _preflight(destinations: List[str]) -> None:
+    # runs before the session is committed: a dead destination fails the request, not the stream
+    try:
+        await preflight.ensure_reachable(destinations)
+    except PreflightError as exc:
+        status = 400 if all(r.stage == "url" for r in exc.results) else 502
+        raise HTTPException(status_code=status, detail=str(exc))
+
+
+def _check_profile(profile: Optional[str]) -> None:
+    if profile is not None and profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile, expected one of: {', '.join(PROFILES)}")
+
+
+def _new_session(payload: StreamStartRequest, user: User, tag: Optional[str] = None) -> StreamSession:
+    return StreamSession(
+        user_id=user.id,
         source_type=payload.source_type,
         source_id=payload.source_id,
         destination=payload.destination,
         mode=payload.mode,
+        hls_mode=payload.hls,
+        overlays=_overlays_json(payload.overlays, user),
+        **_stream_type_fields(payload.type, payload.image, payload.profile, user),
+        switchable=payload.switchable,
+        tag=payload.tag or tag,
         status=StreamStatus.running,
     )
-    db.add(session)
+
+
+@router.post("/start", response_model=StreamStatusOut)
+async def start_stream(payload: StreamStartRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if is_draining():
+        raise HTTPException(status_code=503, detail="Server is draining, try again shortly")
+    _check_profile(payload.profile)
+    with _reserve_quota(current_user):
+        await _preflight([payload.destination])
+        session = _new_session(payload, current_user)
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+
+        await _start_or_release(db, session)
+        db.refresh(session)
+        return session
+
+
+@router.post("/start/group", response_model=List[StreamStatusOut])
+async def start_stream_group(payload: StreamGroupStartRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # one source to several destinations / profiles: started together so they share one decode
+    if is_draining():
+        raise HTTPException(status_code=503, detail="Server is draining, try again shortly")
+    if not payload.outputs:
+        raise HTTPException(status_code=400, detail="No outputs")
+    for output in payload.outputs:
+        _check_profile(output.profile)
+    with _reserve_quota(current_user, len(payload.outputs)):
+        await _preflight([output.destination for output in payload.outputs])
+        overlays = _overlays_json(payload.overlays, current_user)
+        sessions = [
+            StreamSession(
+                user_id=current_user.id,
+                source_type=payload.source_type,
+                source_id=payload.source_id,
+                destination=output.destination,
+                mode=payload.mode,
+                hls_mode=output.hls,
+                overlays=overlays,
+                **_stream_type_fields(payload.type, payload.image, output.profile, current_user),
+                tag=payload.tag,
+                status=StreamStatus.running,
+            )
+            for output in payload.outputs
+        ]
+        db.add_all(sessions)
+        db.commit()
+
+        await asyncio.gather(*(_start_or_release(db, session) for session in sessions))
+        for session in sessions:
+            db.refresh(session)
+        return sessions
+
+
+@router.post("/preflight", response_model=List[PreflightResultOut])
+async def preflight_destinations(payload: PreflightRequest, current_user: User = Depends(get_current_user)):
+    # the same check a start runs, without starting anything
+    return [asdict(result) for result in await preflight.check_all(payload.destinations)]
+
+
+async def _preflight_each(destinations: List[str]) -> List[Optional[str]]:
+    # per-item variant of _preflight for batches: the error for each destination, or None
+    if not settings.preflight_enabled:
+        return [None] * len(destinations)
+    return [None if r.ok else r.error for r in await preflight.check_all(destinations)]
+
+
+def _select_sessions(db: Session, selection: StreamBatchSelect, user: User) -> List[StreamSession]:
+    if selection.session_ids is None and selection.user_id is None and selection.tag is None:
+        raise HTTPException(status_code=400, detail="Select sessions by session_ids, user_id or tag")
+    query = db.query(StreamSession)
+    if user.role != UserRole.admin:
+        query = query.filter(StreamSession.user_id == user.id)
+    if selection.session_ids is not None:
+        query = query.filter(StreamSession.id.in_(selection.session_ids))
+    if selection.user_id is not None:
+        query = query.filter(StreamSession.user_id == selection.user_id)
+    if selection.tag is not None:
+        query = query.filter(StreamSession.tag == selection.tag)
+    return query.order_by(StreamSession.id.asc()).all()
+
+
+async def _spawn_all(db: Session, sessions: List[StreamSession], results: List[BatchItemResult]) -> None:
+    # parallel under BATCH_CONCURRENCY; starts of the same source still share a decode
+    limit = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def spawn(session: StreamSession, result: BatchItemResult) -> None:
+        async with limit:
+            quotas.acquire(session.user_id, session.id)
+            try:
+                await start_ffmpeg(db, session)
+                result.ok, result.status = True, StreamStatus.running
+            except Exception as exc:
+                quotas.release(session.id)
+                session.status = StreamStatus.stopped
+                result.status, result.error = StreamStatus.stopped, str(exc) or exc.__class__.__name__
+
+    with batched_writes():
+        await asyncio.gather(*(spawn(session, result) for session, result in zip(sessions, results)))
+    # failed starts, in one transaction
     db.commit()
-    db.refresh(session)
 
-    await start_ffmpeg(db, session)
+
+@router.post("/batch/start", response_model=List[BatchItemResult])
+async def batch_start(payload: StreamBatchStartRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if is_draining():
+        raise HTTPException(status_code=503, detail="Server is draining, try again shortly")
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="No items")
+    with _reserve_quota(current_user, len(payload.items)):
+        results = [BatchItemResult(index=i) for i in range(len(payload.items))]
+        errors = await _preflight_each([item.destination for item in payload.items])
+        created = []
+        for item, result, error in zip(payload.items, results, errors):
+            try:
+                if error:
+                    raise HTTPException(status_code=502, detail=error)
+                _check_profile(item.profile)
+                created.append((_new_session(item, current_user, payload.tag), result))
+            except HTTPException as exc:
+                result.error = exc.detail
+        # every session row in one transaction
+        db.add_all([session for session, _ in created])
+        db.commit()
+        for session, result in created:
+            result.session_id = session.id
+        await _spawn_all(db, [s for s, _ in created], [r for _, r in created])
+        return results
+
+
+@router.post("/batch/stop", response_model=List[BatchItemResult])
+async def batch_stop(payload: StreamBatchSelect, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    sessions = _select_sessions(db, payload, current_user)
+    running = [s for s in sessions if s.status == StreamStatus.running]
+    with batched_writes():
+        errors = await stop_sessions(db, running)
+    for session in running:
+        session.status = StreamStatus.stopped
+        session.pid = None
+        quotas.release(session.id)
+    db.commit()
+    return [
+        BatchItemResult(session_id=s.id, ok=s.id not in errors, status=StreamStatus.stopped, error=errors.get(s.id))
+        for s in sessions
+    ]
+
+
+@router.post("/batch/restart", response_model=List[BatchItemResult])
+async def batch_restart(payload: StreamBatchSelect, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # running sessions are restarted from the top, stopped ones started again (same id and tag)
+    if is_draining():
+        raise HTTPException(status_code=503, detail="Server is draining, try again shortly")
+    sessions = _select_sessions(db, payload, current_user)
+    starting = sum(1 for s in sessions if s.status != StreamStatus.running)
+    with _reserve_quota(current_user, starting) if starting else nullcontext():
+        results = [BatchItemResult(session_id=s.id, status=s.status) for s in sessions]
+        errors = await _preflight_each([s.destination for s in sessions])
+        for result, error in zip(results, errors):
+            result.error = error
+        ready = [(s, r) for s, r in zip(sessions, results) if r.error is None]
+        with batched_writes():
+            await release_for_restart(db, [s for s, _ in ready if s.status == StreamStatus.running])
+        for session, _ in ready:
+            session.status = StreamStatus.running
+            session.pid = None
+            session.worker_id = None
+            session.group_id = None
+            session.start_time = None
+            session.end_time = None
+            session.retry_count = 0
+        db.commit()
+        await _spawn_all(db, [s for s, _ in ready], [r for _, r in ready])
+        return results
+
+
+@router.post("/{session_id}/switch", response_model=StreamStatusOut)
+async def switch_stream_source(
+    session_id: int,
+    payload: StreamSwitchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    # replace (or interrupt with a clip) what a running switchable session plays, keeping
+    # its encoder and RTMP connection
+    session = db.query(StreamSession).filter(StreamSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if current_user.role != UserRole.admin and session.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not your session")
+    if not session.switchable:
+        raise HTTPException(status_code=400, detail="Session was not started as switchable")
+    try:
+        await switch_source(db, session, payload.source_type, payload.source_id, payload.mode or session.mode, payload.insert)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     db.refresh(session)
     return session
 
 
 @router.post("/stop/{session_id}")
-def stop_stream(session_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def stop_stream(session_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     session = db.query(StreamSession).filter(StreamSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Not found")
     if session.pid:
-        stop_ffmpeg(session.pid)
+        await stop_session(db, session)
         session.status = StreamStatus.stopped
         session.pid = None
+    quotas.release(session.id)
     db.commit()
     return {"status": "stopped"}
 
 
 @router.get("/active", response_model=List[StreamStatusOut])
-def list_active_streams(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def list_active_streams(
+    tag: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
     query = db.query(StreamSession).filter(StreamSession.status == StreamStatus.running)
     if current_user.role != UserRole.admin:
         query = query.filter(StreamSession.user_id == current_user.id)
+    if tag is not None:
+        query = query.filter(StreamSession.tag == tag)
     sessions = query.order_by(StreamSession.start_time.desc()).all()
     # enrich with last stats via response_model (pydantic will ignore extras)
     for s in sessions:
@@ -67,3 +349,11 @@ def list_active_streams(db: Session = Depends(get_db), current_user: User = Depe
     return sessions
 
 
+@router.post("/drain")
+async def drain(stop: bool = False, current_user: User = Depends(get_current_admin)):
+    # handoff (default): refuse new starts and leave running ffmpeg detached for the next instance;
+    # stop=true: additionally terminate all local streams gracefully (host decommission)
+    begin_drain()
+    sessions = watched_sessions()
+    stopped = await drain_stop_all() if stop else 0
+    return {"draining": True, "sessions": sessions, "stopped": stopped}
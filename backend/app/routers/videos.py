@@ -2,7 +2,7 @@ import os
 from pathlib import Path
 from typing import List
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile, status
 from sqlalchemy.orm import Session
 
 from ..config import settings
@@ -10,6 +10,11 @@ from ..database import get_db
 from ..dependencies import get_current_user
 from ..models import Log, User, Video
 from ..schemas import VideoOut
+from ..services.media_probe import analyze_video_by_id
+from ..services.overlays import overlay_image_path
+from ..services.quotas import QuotaExceeded, quotas
+from ..services.segments import drop_segments
+from ..services.source_cache import source_cache
 
 
 router = APIRouter()
@@ -22,18 +27,25 @@ def list_videos(db: Session = Depends(get_db), current_user: User = Depends(get_
 
 @router.post("/upload", response_model=VideoOut)
 async def upload_video(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     if not file.filename.lower().endswith(".mp4"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only .mp4 files are allowed")
+    try:
+        quotas.check_storage(current_user, 0)
+    except QuotaExceeded as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
     target_dir = Path(settings.videos_dir)
     target_dir.mkdir(parents=True, exist_ok=True)
     safe_name = os.path.basename(file.filename)
     dest_path = target_dir / safe_name
     idx = 1
-    while dest_path.exists():
+    # names are shared between the hot and cold tier directories
+    cold_dir = settings.cold_videos_dir
+    while dest_path.exists() or (cold_dir is not None and (cold_dir / dest_path.name).exists()):
         stem = Path(safe_name).stem
         dest_path = target_dir / f"{stem}_{idx}.mp4"
         idx += 1
@@ -45,14 +57,42 @@ async def upload_video(
                 break
             f.write(chunk)
 
-    video = Video(filename=dest_path.name, filepath=str(dest_path), uploaded_by=current_user.id)
+    size = dest_path.stat().st_size
+    try:
+        quotas.check_storage(current_user, size)
+    except QuotaExceeded as exc:
+        dest_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    quotas.add_storage(current_user.id, size)
+
+    video = Video(filename=dest_path.name, filepath=str(dest_path), size_bytes=size, uploaded_by=current_user.id)
     db.add(video)
     db.add(Log(user_id=current_user.id, action="upload_video", details=dest_path.name))
     db.commit()
     db.refresh(video)
+    background_tasks.add_task(analyze_video_by_id, video.id)
     return video
 
 
+@router.post("/overlays")
+async def upload_overlay_image(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+    # logo / graphic files for stream overlays; referenced by name in overlay layers
+    if not file.filename.lower().endswith((".png", ".jpg", ".jpeg")):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only .png/.jpg files are allowed")
+    try:
+        dest_path = overlay_image_path(current_user.id, os.path.basename(file.filename).replace(" ", "_"))
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(dest_path, "wb") as f:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+    return {"image": dest_path.name}
+
+
 @router.delete("/{video_id}")
 def delete_video(video_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     video = db.query(Video).filter(Video.id == video_id).first()
@@ -64,9 +104,12 @@ def delete_video(video_id: int, db: Session = Depends(get_db), current_user: Use
     except Exception:
         # Ignore file delete errors; proceed to DB delete
         pass
+    quotas.add_storage(video.uploaded_by, -(video.size_bytes or 0))
     db.delete(video)
     db.add(Log(user_id=current_user.id, action="delete_video", details=str(video_id)))
     db.commit()
+    source_cache.invalidate_video(video_id)
+    drop_segments(video_id)
     return {"status": "deleted"}
 
 
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..dependencies import get_current_admin, require_worker_token
+from ..models import User, WorkerNode
+from ..schemas import WorkerEvents, WorkerHeartbeat, WorkerOut, WorkerRegister
+from ..services.workers import ingest_events
+
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[WorkerOut])
+def list_workers(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin)):
+    return db.query(WorkerNode).order_by(WorkerNode.name.asc()).all()
+
+
+@router.post("/register", response_model=WorkerOut, dependencies=[Depends(require_worker_token)])
+def register_worker(payload: WorkerRegister, db: Session = Depends(get_db)):
+    worker = db.query(WorkerNode).filter(WorkerNode.name == payload.name).first()
+    if worker is None:
+        worker = WorkerNode(name=payload.name)
+        db.add(worker)
+    worker.url = payload.url.rstrip("/")
+    worker.capacity = payload.capacity
+    worker.last_heartbeat = datetime.now(timezone.utc)
+    db.commit()
+    db.refresh(worker)
+    return worker
+
+
+@router.post("/{worker_id}/heartbeat", dependencies=[Depends(require_worker_token)])
+def worker_heartbeat(worker_id: int, payload: WorkerHeartbeat, db: Session = Depends(get_db)):
+    worker = db.query(WorkerNode).filter(WorkerNode.id == worker_id).first()
+    if not worker:
+        raise HTTPException(status_code=404, detail="Worker not registered")
+    worker.active_sessions = payload.active_sessions
+    worker.load = payload.load
+    worker.last_heartbeat = datetime.now(timezone.utc)
+    db.commit()
+    return {"status": "ok"}
+
+
+@router.post("/{worker_id}/events", dependencies=[Depends(require_worker_token)])
+async def worker_events(worker_id: int, payload: WorkerEvents, db: Session = Depends(get_db)):
+    worker = db.query(WorkerNode).filter(WorkerNode.id == worker_id).first()
+    if not worker:
+        raise HTTPException(status_code=404, detail="Worker not registered")
+    await ingest_events(db, worker, [e.dict() for e in payload.events])
+    return {"status": "ok"}
@@ -1,9 +1,9 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, confloat, conint, constr, root_validator
 
-from .models import StreamMode, StreamSourceType, StreamStatus, UserRole
+from .models import HlsMode, OverlayType, ScheduleKind, StreamMode, StreamType, StreamSourceType, StreamStatus, UserRole
 
 
 class UserCreate(BaseModel):
@@ -37,6 +37,9 @@ class VideoOut(BaseModel):
     id: int
     filename: str
     filepath: str
+    size_bytes: Optional[int] = None
+    tier: Optional[str] = None
+    last_streamed_at: Optional[datetime] = None
     uploaded_by: Optional[int]
     created_at: datetime
 
@@ -68,11 +71,108 @@ class PlaylistOut(BaseModel):
         orm_mode = True
 
 
+class OverlayLayer(BaseModel):
+    type: OverlayType
+    x: conint(ge=0) = 10
+    y: conint(ge=0) = 10
+    text: Optional[constr(max_length=500)] = None
+    # name of one of the requesting user's images (POST /api/videos/overlays)
+    image: Optional[constr(regex=r"^[\w.-]+$")] = None
+    width: Optional[conint(gt=0)] = None
+    opacity: confloat(ge=0, le=1) = 1.0
+    size: conint(gt=0, le=400) = 24
+    # ffmpeg color name or hex, optionally with @alpha
+    color: constr(regex=r"^#?[\w]+(@[\d.]+)?$") = "white"
+    box: bool = False
+    # clock: strftime format
+    format: Optional[constr(regex=r"^[%\w :./-]+$")] = None
+    # ticker: pixels per second
+    speed: conint(gt=0, le=2000) = 100
+
+    @root_validator(skip_on_failure=True)
+    def check_fields(cls, values):
+        kind = values["type"]
+        if kind == OverlayType.image and not values.get("image"):
+            raise ValueError("image layer needs an image")
+        if kind in (OverlayType.text, OverlayType.ticker) and not values.get("text"):
+            raise ValueError(f"{kind.value} layer needs text")
+        return values
+
+
 class StreamStartRequest(BaseModel):
     source_type: StreamSourceType
     source_id: int
     destination: str
     mode: StreamMode
+    hls: Optional[HlsMode] = None
+    profile: Optional[str] = None
+    overlays: Optional[List[OverlayLayer]] = None
+    type: StreamType = StreamType.standard
+    # audio_only: cover picture uploaded via POST /api/videos/overlays
+    image: Optional[constr(regex=r"^[\w.-]+$")] = None
+    # allow POST /api/streams/{id}/switch (source fed through a long-lived encoder)
+    switchable: bool = False
+    tag: Optional[constr(max_length=64)] = None
+
+
+class StreamSwitchRequest(BaseModel):
+    source_type: StreamSourceType
+    source_id: int
+    mode: Optional[StreamMode] = None
+    # play the source once, then resume the current one where it was cut
+    insert: bool = False
+
+
+class PreflightRequest(BaseModel):
+    destinations: List[str]
+
+
+class PreflightResultOut(BaseModel):
+    destination: str
+    ok: bool
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+    cached: bool = False
+
+
+class StreamOutput(BaseModel):
+    destination: str
+    profile: Optional[str] = None
+    hls: Optional[HlsMode] = None
+
+
+class StreamGroupStartRequest(BaseModel):
+    source_type: StreamSourceType
+    source_id: int
+    mode: StreamMode
+    outputs: List[StreamOutput]
+    overlays: Optional[List[OverlayLayer]] = None
+    type: StreamType = StreamType.standard
+    image: Optional[constr(regex=r"^[\w.-]+$")] = None
+    tag: Optional[constr(max_length=64)] = None
+
+
+class StreamBatchStartRequest(BaseModel):
+    items: List[StreamStartRequest]
+    # applied to items that do not set their own tag
+    tag: Optional[constr(max_length=64)] = None
+
+
+class StreamBatchSelect(BaseModel):
+    # criteria are combined; at least one is required
+    session_ids: Optional[List[int]] = None
+    user_id: Optional[int] = None
+    tag: Optional[str] = None
+
+
+class BatchItemResult(BaseModel):
+    # index into the request items (start) or None (stop / restart)
+    index: Optional[int] = None
+    session_id: Optional[int] = None
+    ok: bool = False
+    status: Optional[StreamStatus] = None
+    error: Optional[str] = None
 
 
 class StreamStatusOut(BaseModel):
@@ -82,6 +182,18 @@ class StreamStatusOut(BaseModel):
     start_time: Optional[datetime]
     end_time: Optional[datetime]
     avg_bitrate: Optional[str]
+    worker_id: Optional[int] = None
+    hls_mode: Optional[HlsMode] = None
+    hls_url: Optional[str] = None
+    stream_type: Optional[StreamType] = None
+    switchable: Optional[bool] = None
+    profile: Optional[str] = None
+    active_profile: Optional[str] = None
+    group_id: Optional[str] = None
+    failure_class: Optional[str] = None
+    failure_detail: Optional[str] = None
+    retry_count: Optional[int] = None
+    tag: Optional[str] = None
     # optional stats fields (enriched via WS cache)
     rtmp_url: Optional[str] = None
     bitrate: Optional[str] = None
@@ -92,6 +204,93 @@ class StreamStatusOut(BaseModel):
         orm_mode = True
 
 
+class ScheduleCreate(BaseModel):
+    name: str
+    source_type: StreamSourceType
+    source_id: int
+    destination: str
+    mode: StreamMode
+    kind: ScheduleKind
+    run_at: Optional[datetime] = None
+    interval_seconds: Optional[int] = None
+    cron: Optional[str] = None
+    duration_seconds: Optional[int] = None
+    enabled: bool = True
+
+
+class ScheduleOut(BaseModel):
+    id: int
+    name: str
+    source_type: StreamSourceType
+    source_id: int
+    destination: str
+    mode: StreamMode
+    kind: ScheduleKind
+    run_at: Optional[datetime]
+    interval_seconds: Optional[int]
+    cron: Optional[str]
+    duration_seconds: Optional[int]
+    next_run_at: Optional[datetime]
+    last_run_at: Optional[datetime]
+    last_session_id: Optional[int]
+    enabled: bool
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class WorkerRegister(BaseModel):
+    name: str
+    url: str
+    capacity: int
+
+
+class WorkerHeartbeat(BaseModel):
+    active_sessions: int
+    load: Optional[str] = None
+
+
+class WorkerEvent(BaseModel):
+    session_id: int
+    # process the event came from; events of a replaced process are ignored
+    pid: Optional[int] = None
+    message: dict
+
+
+class WorkerEvents(BaseModel):
+    events: List[WorkerEvent]
+
+
+class WorkerOut(BaseModel):
+    id: int
+    name: str
+    url: str
+    capacity: int
+    active_sessions: int
+    load: Optional[str]
+    last_heartbeat: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class QuotaUpdate(BaseModel):
+    max_streams: Optional[int] = None
+    max_encode_seconds: Optional[int] = None
+    max_storage_bytes: Optional[int] = None
+
+
+class QuotaUsageOut(BaseModel):
+    user_id: int
+    streams: int
+    encode_seconds: int
+    storage_bytes: int
+    max_streams: int
+    max_encode_seconds: int
+    max_storage_bytes: int
+
+
 class LogOut(BaseModel):
     id: int
     action: str
@@ -0,0 +1,86 @@
+import time
+from typing import Optional
+
+from ..config import settings
+from .profiles import PROFILES, StreamProfile, get_profile
+
+
+# profiles ordered from the highest to the lowest bitrate
+LADDER = sorted(PROFILES.values(), key=lambda p: p.video_bitrate, reverse=True)
+
+
+def step_down(name: Optional[str]) -> Optional[StreamProfile]:
+    current = get_profile(name)
+    lower = [p for p in LADDER if p.video_bitrate < current.video_bitrate]
+    return lower[0] if lower else None
+
+
+def step_up(name: Optional[str], ceiling: Optional[str]) -> Optional[StreamProfile]:
+    current = get_profile(name)
+    limit = get_profile(ceiling)
+    higher = [p for p in LADDER if current.video_bitrate < p.video_bitrate <= limit.video_bitrate]
+    return higher[-1] if higher else None
+
+
+class AbrController:
+    """Watches ffmpeg progress for one process and decides when to change the profile.
+
+    Speed is smoothed with an EWMA; with `-re` input it drops below 1x both when the
+    encoder runs out of CPU and when the RTMP socket backs up. New dropped frames count
+    as pressure too, unless the output runs at a reduced -r (still / low-motion pacing),
+    where ffmpeg drops frames on purpose and only speed is judged. Decisions need the
+    condition to hold for a while, and nothing is decided during the hold period after
+    a (re)start while ffmpeg ramps up.
+    """
+
+    def __init__(self, count_drops: bool = True) -> None:
+        self.count_drops = count_drops
+        self.speed: Optional[float] = None
+        self.last_drop: Optional[int] = None
+        self.last_dup: Optional[int] = None
+        self.hold_until = time.monotonic() + settings.abr_hold_seconds
+        self.bad_since: Optional[float] = None
+        self.good_since: Optional[float] = None
+
+    def observe(self, speed: Optional[str], dropped: Optional[str], dup: Optional[str]) -> Optional[str]:
+        now = time.monotonic()
+        try:
+            sample = float(speed) if speed else None
+        except ValueError:
+            sample = None
+        if sample is not None:
+            self.speed = sample if self.speed is None else self.speed * 0.8 + sample * 0.2
+
+        new_drops = 0
+        if dropped is not None:
+            drop = int(dropped)
+            new_drops = drop - self.last_drop if self.last_drop is not None else 0
+            self.last_drop = drop
+        if not self.count_drops:
+            new_drops = 0
+        new_dups = 0
+        if dup is not None:
+            count = int(dup)
+            new_dups = count - self.last_dup if self.last_dup is not None else 0
+            self.last_dup = count
+
+        if now < self.hold_until or self.speed is None:
+            return None
+
+        behind = self.speed < settings.abr_down_speed or new_drops > 0
+        # duplicated frames alone are normal with a reduced -r, so they only block stepping up
+        healthy = self.speed >= settings.abr_up_speed and new_drops == 0 and new_dups == 0
+        if behind:
+            self.good_since = None
+            self.bad_since = self.bad_since or now
+            if now - self.bad_since >= settings.abr_down_seconds:
+                return "down"
+        elif healthy:
+            self.bad_since = None
+            self.good_since = self.good_since or now
+            if now - self.good_since >= settings.abr_up_seconds:
+                return "up"
+        else:
+            self.bad_since = None
+            self.good_since = None
+        return None
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import Set
+
+
+# minute, hour, day of month, month, day of week (0 or 7 = Sunday)
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_field(raw: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in raw.split(","):
+        step = 1
+        if "/" in part:
+            part, step_raw = part.split("/", 1)
+            step = int(step_raw)
+            if step <= 0:
+                raise ValueError("Cron step must be positive")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = high if step != 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value out of range: {raw}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    def __init__(self, expr: str) -> None:
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression must have 5 fields")
+        parsed = [_parse_field(f, lo, hi) for f, (lo, hi) in zip(fields, FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.weekdays
+        # classic cron: when both fields are restricted either one may match
+        if not self.any_day and not self.any_weekday:
+            return dom or dow
+        return dom and dow
+
+    def next_after(self, dt: datetime) -> datetime:
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+                continue
+            if t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+                continue
+            return t
+        raise ValueError("Cron expression never matches")
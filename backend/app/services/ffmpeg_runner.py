@@ -1,81 +1,471 @@
 import asyncio
+import hashlib
+import math
 import os
 import re
+import shutil
 import signal
-import tempfile
-from dataclasses import dataclass
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import AsyncIterator, List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.orm import Session
 
 from ..config import settings
-from ..models import PlaylistItem, StreamMode, StreamSession, StreamSourceType, StreamStatus, Video
+from ..database import SessionLocal
+from ..models import HlsMode, StreamMode, StreamSession, StreamSourceType, StreamStatus, StreamType, Video
+from .media_probe import analyze_video, media_info, probe_media, schedule_analysis
+from .overlays import dynamic_filters, ensure_static_overlay, overlay_image_path, parse_overlays
+from .pacing import ensure_image_segment, ensure_still_segment
+from .abr import AbrController, step_down, step_up
+from .health import (
+    RETRY_POLICIES,
+    UNKNOWN,
+    StderrRing,
+    classify_failure,
+    failure_detail,
+    lines_mentioning,
+    retry_delay,
+)
+from .profiles import DEFAULT_PROFILE, StreamProfile, get_profile
+from .profiling import approx_size, now_ms, profiler
+from .quotas import quotas
+from .segments import load_segments, prepare_segments
+from .source_cache import CachedVideo, source_cache
+from .source_feeder import SourceFeeder
+from .storage import HOT, ensure_hot, mark_streamed
 from .websocket_manager import ws_manager
+from .workers import WorkerError, assign_session, pick_worker, release_session, remote_session_alive
 
 
 PROGRESS_REGEX = re.compile(
     r"fps=\s*(?P<fps>[\d\.]+).*?bitrate=\s*(?P<bitrate>\S+)", re.IGNORECASE
 )
 DROP_REGEX = re.compile(r"drop=\s*(?P<dropped>\d+)", re.IGNORECASE)
+DUP_REGEX = re.compile(r"dup=\s*(?P<dup>\d+)", re.IGNORECASE)
+SPEED_REGEX = re.compile(r"speed=\s*(?P<speed>[\d\.]+)x", re.IGNORECASE)
+TIME_REGEX = re.compile(r"time=\s*(?P<h>\d+):(?P<m>\d+):(?P<s>[\d\.]+)")
 
 
-@dataclass
+# set for planned shutdowns: no new streams are spawned, running ones are left
+# detached for the next backend instance to adopt
+draining = False
+
+_watched: Dict[int, "_Run"] = {}
+# starts for the same source arriving within the shared-decode window, keyed by source
+_pending_starts: Dict[tuple, List[tuple]] = {}
+# sessions waiting out a retry delay after a failure -> the task that will relaunch them
+_retrying: Dict[int, asyncio.Task] = {}
+
+
+class _WriteBatch:
+    def __init__(self) -> None:
+        # session id -> column values, merged in write order
+        self.rows: Dict[int, dict] = {}
+        self.open = True
+
+
+# set inside batched_writes(); tasks started there inherit it, hence the open flag
+_write_batch: ContextVar[Optional[_WriteBatch]] = ContextVar("stream_write_batch", default=None)
+
+
+@dataclass(slots=True)
 class FfmpegStats:
     bitrate: Optional[str] = None
     fps: Optional[str] = None
     dropped_frames: Optional[str] = None
+    dup_frames: Optional[str] = None
+    speed: Optional[str] = None
+    out_time: Optional[float] = None
+
+
+@dataclass
+class FfmpegPlan:
+    input_args: List[str]
+    video_map: str = "0:v:0?"
+    audio_map: str = "0:a:0?"
+    output_flags: List[str] = field(default_factory=list)
+    video_copy: bool = False
+    audio_copy: bool = False
+    # input is the segment cache, already in the output's encoding
+    segmented: bool = False
+    has_video: bool = True
+    fps: Optional[int] = None
+    # media length, used to wrap seek offsets for looping sources
+    duration: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    audio_gain_db: Optional[float] = None
+    cover_segment: Optional[Path] = None
+    # applied to the decoded source before overlays / split
+    video_filter: Optional[str] = None
 
 
-def _build_input_args(db: Session, source_type: StreamSourceType, source_id: int, mode: StreamMode) -> List[str]:
+async def _build_plan(
+    db: Session,
+    source_type: StreamSourceType,
+    source_id: int,
+    mode: StreamMode,
+    audio_only: bool = False,
+    cover: Optional[Path] = None,
+    use_segments: bool = False,
+) -> FfmpegPlan:
+    videos = [await _hot_video(db, v) for v in source_cache.resolve(db, source_type, source_id)]
+    mark_streamed(db, [v.id for v in videos])
+
+    if use_segments and not audio_only:
+        looped = mode == (StreamMode.loop_video if source_type == StreamSourceType.video else StreamMode.loop_playlist)
+        plan = _segment_plan(videos, looped)
+        if plan is not None:
+            return plan
+
     if source_type == StreamSourceType.video:
-        video: Video | None = db.query(Video).filter(Video.id == source_id).first()
-        if not video:
-            raise ValueError("Video not found")
+        video = videos[0]
         loop_arg = []
         if mode == StreamMode.loop_video:
             loop_arg = ["-stream_loop", "-1"]
-        return ["-re", *loop_arg, "-i", video.filepath]
-
-    # playlist
-    items = (
-        db.query(PlaylistItem)
-        .filter(PlaylistItem.playlist_id == source_id)
-        .order_by(PlaylistItem.order_index.asc())
-        .all()
+        plan = FfmpegPlan(["-re", *loop_arg, "-i", video.filepath])
+        infos = [await _media_info(db, video)]
+        plan.duration = infos[0].get("duration")
+        content = infos[0].get("content", "normal")
+        plan.width, plan.height = _frame_size(infos[0])
+        if audio_only and (cover or content == "audio_only"):
+            _loop_cover(plan, await ensure_image_segment(cover))
+        elif audio_only or content == "still":
+            # loop a pre-encoded low-fps segment of the picture and only encode the audio
+            _loop_picture(plan, await ensure_still_segment(video))
+        elif content == "low_motion":
+            plan.fps = settings.low_motion_fps
+        elif content == "audio_only":
+            plan.has_video = False
+    else:
+        playlist_lines = [f"file '{v.filepath}'" for v in videos]
+        input_args = ["-re", "-f", "concat", "-safe", "0", "-i", str(_write_concat_list(playlist_lines))]
+        if mode == StreamMode.loop_playlist:
+            # emulate loop by using -stream_loop on concat is unsupported; instead restart on end externally
+            pass
+        plan = FfmpegPlan(input_args)
+        infos = [await _media_info(db, v) for v in videos]
+        contents = {info.get("content", "normal") for info in infos}
+        plan.width, plan.height = _frame_size(infos[0])
+        if audio_only:
+            _loop_cover(plan, await ensure_image_segment(cover))
+        elif contents <= {"still", "low_motion"}:
+            plan.fps = settings.still_fps if contents == {"still"} else settings.low_motion_fps
+        durations = [info.get("duration") for info in infos]
+        if all(durations):
+            plan.duration = sum(durations)
+
+    plan.audio_gain_db = _loudness_gain(infos)
+    return plan
+
+
+async def _source_paths(db: Session, source_type: StreamSourceType, source_id: int) -> List[str]:
+    videos = [await _hot_video(db, v) for v in source_cache.resolve(db, source_type, source_id)]
+    mark_streamed(db, [v.id for v in videos])
+    return [v.filepath for v in videos]
+
+
+async def prewarm_source(db: Session, source_type: StreamSourceType, source_id: int) -> None:
+    # A start's groundwork ahead of time (hot copies, probes, segment cuts) without building
+    # a command: no streamed mark for tiering and no output or HLS directory touched
+    for video in source_cache.resolve(db, source_type, source_id):
+        video = await _hot_video(db, video)
+        await _media_info(db, video)
+        prepare_segments(video, media_info(video) or {})
+
+
+def _segment_plan(videos: List[CachedVideo], looped: bool) -> Optional[FfmpegPlan]:
+    # Every item cut into keyframe-aligned segments at ingest: order, loop and resume point
+    # are assembled from them by the concat demuxer and -ss lands on a segment boundary.
+    # Only used when all items share size and frame rate, since the output is a plain copy
+    if not settings.segment_cache_enabled:
+        return None
+    sets = []
+    for video in videos:
+        info = media_info(video) or {}
+        found = load_segments(video, info)
+        if found is None:
+            prepare_segments(video, info)
+        sets.append(found)
+    if not sets or any(s is None for s in sets) or len({s.format for s in sets}) > 1:
+        return None
+    lines: List[str] = []
+    for found in sets:
+        for segment in found.segments:
+            lines += [f"file '{segment.path}'", f"duration {segment.duration:.6f}"]
+    loop_arg = ["-stream_loop", "-1"] if looped else []
+    plan = FfmpegPlan(["-re", *loop_arg, "-f", "concat", "-safe", "0", "-i", str(_write_concat_list(lines))])
+    plan.segmented = plan.video_copy = plan.audio_copy = True
+    plan.duration = sum(found.duration for found in sets)
+    plan.width, plan.height = sets[0].width, sets[0].height
+    # loudness gain is already applied per item in the segments
+    return plan
+
+
+def _switchable_plan() -> FfmpegPlan:
+    # the encoder reads the feeder's MPEG-TS from stdin; sources can differ in size and rate,
+    # so frames are normalized to one canvas before encoding
+    width, height = (int(v) for v in settings.switch_canvas.split("x"))
+    plan = FfmpegPlan(["-fflags", "+genpts+discardcorrupt", "-thread_queue_size", "1024", "-f", "mpegts", "-i", "pipe:0"])
+    plan.video_map = "0:v:0"
+    plan.width, plan.height = width, height
+    plan.video_filter = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={settings.switch_fps}"
     )
-    if not items:
-        raise ValueError("Playlist is empty")
-    playlist_lines = [f"file '{db.query(Video).get(it.video_id).filepath}'" for it in items]
-    temp = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
-    temp.write("\n".join(playlist_lines))
-    temp.flush()
-    temp.close()
-    input_args = ["-re", "-f", "concat", "-safe", "0", "-i", temp.name]
-    if mode == StreamMode.loop_playlist:
-        # emulate loop by using -stream_loop on concat is unsupported; instead restart on end externally
-        pass
-    return input_args
+    return plan
+
+
+def _loop_picture(plan: FfmpegPlan, segment: Path) -> None:
+    # video comes from a looped pre-encoded still segment (copied, no encode); audio from the source
+    plan.input_args = ["-re", "-stream_loop", "-1", "-i", str(segment), *plan.input_args]
+    plan.video_map, plan.audio_map = "0:v:0", "1:a:0?"
+    plan.output_flags = ["-shortest"]
+    plan.video_copy = True
+    plan.has_video = True
+
+
+def _loop_cover(plan: FfmpegPlan, segment: Path) -> None:
+    _loop_picture(plan, segment)
+    # the picture is not the source's frame; its size is probed only if overlays need it
+    plan.width = plan.height = None
+    plan.cover_segment = segment
+
+
+def _loudness_gain(infos: List[dict]) -> Optional[float]:
+    # gain towards the loudness target from the measurements taken at ingest; a playlist
+    # uses its duration-weighted integrated loudness since concat cannot vary the gain
+    if not settings.loudnorm_enabled:
+        return None
+    measured = [(info.get("duration") or 1.0, info.get("loudness")) for info in infos]
+    if not measured or any(loudness is None for _, loudness in measured):
+        return None
+    total = sum(duration for duration, _ in measured)
+    energy = sum(duration * 10 ** (loudness["i"] / 10) for duration, loudness in measured) / total
+    gain = settings.loudnorm_target - 10 * math.log10(energy)
+    # never push the loudest item past the true-peak ceiling
+    gain = min(gain, settings.loudnorm_true_peak - max(loudness["tp"] for _, loudness in measured))
+    return round(gain, 1) if abs(gain) >= 0.5 else None
+
 
+def _frame_size(info: dict) -> tuple:
+    video = info.get("video") or {}
+    return video.get("width"), video.get("height")
 
-async def _read_stream_lines(stream: asyncio.StreamReader) -> AsyncIterator[str]:
+
+async def _hot_video(db: Session, video: CachedVideo) -> CachedVideo:
+    if video.tier == HOT:
+        return video
+    row = db.query(Video).filter(Video.id == video.id).first()
+    if row is None:
+        raise ValueError("Video not found")
+    await ensure_hot(db, row)
+    return CachedVideo.from_row(row)
+
+
+def _write_concat_list(lines: List[str]) -> Path:
+    # content-addressed under cache_dir (shared with worker nodes) instead of a per-start temp file
+    content = "\n".join(lines)
+    path = Path(settings.cache_dir) / "playlists" / f"{hashlib.sha1(content.encode()).hexdigest()[:16]}.txt"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(content)
+        os.replace(tmp, path)
+    return path
+
+
+async def _media_info(db: Session, video: CachedVideo) -> dict:
+    if settings.pacing_mode != "auto":
+        return {}
+    info = media_info(video)
+    if info is None:
+        row = db.query(Video).filter(Video.id == video.id).first()
+        if row is None:
+            return {}
+        try:
+            # never analyzed (ingest hook lost, e.g. by a restart): probe now, and measure
+            # loudness, which decodes the whole file, without holding up the start
+            info = await analyze_video(db, row, loudness=False)
+        except (ValueError, OSError):
+            return {}
+        if info.get("audio"):
+            schedule_analysis(row.id)
+    return info
+
+
+def _session_log_path(session_id: int) -> Path:
+    return Path(settings.runtime_dir) / f"session_{session_id}.log"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            state = f.read().rsplit(")", 1)[1].split()[0]
+        return state != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+def _proc_argv(pid: int) -> List[str]:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return [a.decode(errors="ignore") for a in f.read().split(b"\0") if a]
+    except OSError:
+        return []
+
+
+def _is_session_process(pid: int, session: StreamSession) -> bool:
+    argv = _proc_argv(pid)
+    # the destination is its own argument, or part of a tee muxer spec
+    return bool(argv) and os.path.basename(argv[0]) == "ffmpeg" and any(session.destination in a for a in argv)
+
+
+class _Run:
+    # one ffmpeg process and the sessions it serves (several for a shared-decode group)
+    def __init__(self, handle: "_ProcessHandle", log_id: int, members: List[StreamSession], group_id: Optional[str] = None, base_offset: float = 0.0) -> None:
+        self.handle = handle
+        self.log_id = log_id
+        self.members = members  # detached StreamSession copies, see _detach
+        self.group_id = group_id
+        self.base_offset = base_offset
+        self.position = base_offset
+        # set when the process is replaced on purpose; its exit then does not stop the sessions
+        self.superseded = False
+        self.abr: Optional[AbrController] = None
+        self.switching = False
+        self.feeder: Optional[SourceFeeder] = None
+        self.ring = StderrRing()
+        self.started = time.monotonic()
+        # set when the sessions are stopped on request; the exit is then not a failure
+        self.stopping = False
+
+    def enable_abr(self, cmd: List[str]) -> None:
+        # only processes that actually encode video can trade quality for speed
+        if settings.abr_enabled and "libx264" in cmd:
+            # a reduced output rate (-r) drops source frames by design; those are not pressure
+            self.abr = AbrController(count_drops="-r" not in cmd)
+
+
+class _ProcessHandle:
+    # wraps either a child we spawned or a detached ffmpeg adopted after a restart
+    def __init__(self, pid: int, process: Optional[asyncio.subprocess.Process] = None) -> None:
+        self.pid = pid
+        self.process = process
+
+    def alive(self) -> bool:
+        if self.process is not None:
+            return self.process.returncode is None
+        return _pid_alive(self.pid)
+
+    def returncode(self) -> Optional[int]:
+        # unknown for adopted processes, which are not our children
+        return self.process.returncode if self.process is not None else None
+
+    async def wait(self) -> None:
+        if self.process is not None:
+            await self.process.wait()
+            return
+        while _pid_alive(self.pid):
+            await asyncio.sleep(settings.stream_log_poll_interval)
+
+
+def _detach(session: StreamSession) -> StreamSession:
+    # Runs outlive the request or task that started them; they keep a plain copy of the
+    # row instead of an ORM object bound to (and holding on to) the caller's DB session.
+    return StreamSession(**{attr.key: getattr(session, attr.key) for attr in sa_inspect(StreamSession).column_attrs})
+
+
+def _save(session: StreamSession, **values) -> None:
+    # one short-lived DB session per write, released right after the commit
+    for key, value in values.items():
+        setattr(session, key, value)
+    batch = _write_batch.get()
+    if batch is not None and batch.open:
+        batch.rows.setdefault(session.id, {}).update(values)
+        return
+    t_commit = now_ms()
+    db = SessionLocal()
+    try:
+        db.query(StreamSession).filter(StreamSession.id == session.id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if profiler.enabled:
+        profiler.record(session.id, "db_commit", now_ms() - t_commit)
+
+
+@contextmanager
+def batched_writes() -> Iterator[None]:
+    # session row updates made by runner calls inside the block go out in one transaction
+    # when it ends, instead of one commit per spawned or stopped process
+    batch = _WriteBatch()
+    token = _write_batch.set(batch)
+    try:
+        yield
+    finally:
+        _write_batch.reset(token)
+        batch.open = False
+        if batch.rows:
+            db = SessionLocal()
+            try:
+                db.bulk_update_mappings(StreamSession, [{"id": sid, **values} for sid, values in batch.rows.items()])
+                db.commit()
+            finally:
+                db.close()
+
+
+def _split_lines(buffer: str) -> tuple[List[str], str]:
+    parts = re.split(r"[\r\n]+", buffer)
+    rest = parts.pop()  # last incomplete
+    return [p for p in parts if p], rest
+
+
+async def _tail_lines(path: Path, handle: _ProcessHandle, from_end: bool = False) -> AsyncIterator[str]:
+    # ffmpeg writes stderr to a file (not a pipe) so it survives the backend going away;
+    # the file is opened O_APPEND by ffmpeg, which makes truncating it here safe.
+    offset = path.stat().st_size if from_end and path.exists() else 0
     buffer = ""
     while True:
-        chunk = await stream.read(1024)
-        if not chunk:
-            # flush remaining buffer
+        alive = handle.alive()
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size < offset:
+            offset = 0
+        chunk = b""
+        if size > offset:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(64 * 1024)
+            offset += len(chunk)
+        if chunk:
+            buffer += chunk.decode(errors="ignore")
+            lines, buffer = _split_lines(buffer)
+            for line in lines:
+                yield line
+            if offset >= settings.stream_log_max_bytes and alive:
+                os.truncate(path, 0)
+                offset = 0
+            continue
+        if not alive:
             if buffer:
-                for part in re.split(r"[\r\n]+", buffer):
-                    if part:
-                        yield part
-            break
-        buffer += chunk.decode(errors="ignore")
-        parts = re.split(r"[\r\n]+", buffer)
-        buffer = parts.pop()  # last incomplete
-        for part in parts:
-            if part:
-                yield part
+                yield buffer
+            return
+        await asyncio.sleep(settings.stream_log_poll_interval)
 
 
 def _parse_stats(line: str) -> FfmpegStats | None:
@@ -86,37 +476,164 @@ def _parse_stats(line: str) -> FfmpegStats | None:
     d = DROP_REGEX.search(line)
     if d:
         dropped = d.group("dropped")
+    dup = None
+    du = DUP_REGEX.search(line)
+    if du:
+        dup = du.group("dup")
+    speed = None
+    sp = SPEED_REGEX.search(line)
+    if sp:
+        speed = sp.group("speed")
+    out_time = None
+    t = TIME_REGEX.search(line)
+    if t:
+        out_time = int(t.group("h")) * 3600 + int(t.group("m")) * 60 + float(t.group("s"))
     return FfmpegStats(
         bitrate=match.group("bitrate"),
         fps=match.group("fps"),
         dropped_frames=dropped,
+        dup_frames=dup,
+        speed=speed,
+        out_time=out_time,
     )
 
 
-async def start_ffmpeg(db: Session, session: StreamSession) -> int:
-    input_args = _build_input_args(db, session.source_type, session.source_id, session.mode)
-
-    output_args = [
-        "-c:v",
-        "libx264",
-        "-preset",
-        "veryfast",
-        "-tune",
-        "zerolatency",
-        "-b:v",
-        "3000k",
-        "-maxrate",
-        "3000k",
-        "-bufsize",
-        "6000k",
-        "-c:a",
-        "aac",
-        "-f",
-        "flv",
-        session.destination,
+def _hls_dir(session_id: int) -> Path:
+    return Path(settings.hls_dir) / str(session_id)
+
+
+def _hls_output(session: StreamSession) -> str:
+    # local monitoring / fallback playback: a second mux of the already encoded stream
+    out_dir = _hls_dir(session.id)
+    if session.hls_mode == HlsMode.cmaf:
+        # low-latency CMAF: chunked fMP4 via the dash muxer, which also writes an LL-HLS playlist
+        options = [
+            "f=dash",
+            f"seg_duration={settings.hls_segment_seconds}",
+            f"window_size={settings.hls_list_size}",
+            "extra_window_size=0",
+            "remove_at_exit=1",
+            "streaming=1",
+            "ldash=1",
+            "lhls=1",
+            "hls_playlist=1",
+            "use_template=1",
+            "use_timeline=0",
+            "onfail=ignore",
+        ]
+        return f"[{':'.join(options)}]{out_dir / 'manifest.mpd'}"
+    options = [
+        "f=hls",
+        f"hls_time={settings.hls_segment_seconds}",
+        f"hls_list_size={settings.hls_list_size}",
+        "hls_flags=delete_segments+independent_segments+omit_endlist",
+        f"hls_segment_filename={out_dir / 'seg_%05d.ts'}",
+        "onfail=ignore",
     ]
+    return f"[{':'.join(options)}]{out_dir / 'index.m3u8'}"
+
+
+def _effective_profile(session: StreamSession) -> StreamProfile:
+    # the ABR controller may run a session below the profile it asked for
+    return get_profile(session.active_profile or session.profile)
+
+
+def _output_args(session: StreamSession, plan: FfmpegPlan, video_label: Optional[str] = None) -> List[str]:
+    profile = _effective_profile(session)
+    if plan.video_copy:
+        args = ["-map", plan.video_map, "-c:v", "copy"]
+    elif video_label:
+        args = ["-map", f"[{video_label}]", *profile.video_args(plan.fps)]
+    else:
+        args = ["-map", plan.video_map, *profile.video_args(plan.fps)]
+        if profile.scale_filter() and plan.has_video:
+            args += ["-vf", profile.scale_filter()]
+    audio_args = ["-c:a", "copy"] if plan.audio_copy else profile.audio_args()
+    args += ["-map", plan.audio_map, *audio_args, *plan.output_flags]
+    if plan.audio_gain_db is not None:
+        args += ["-af", f"volume={plan.audio_gain_db}dB"]
+
+    if session.hls_mode:
+        shutil.rmtree(_hls_dir(session.id), ignore_errors=True)
+        _hls_dir(session.id).mkdir(parents=True, exist_ok=True)
+        return [
+            *args,
+            "-flags",
+            "+global_header",
+            "-f",
+            "tee",
+            f"[f=flv]{session.destination}|{_hls_output(session)}",
+        ]
+    return [*args, "-f", "flv", session.destination]
+
+
+def _with_seek(input_args: List[str], offset: float) -> List[str]:
+    # seek the main (last) input; earlier inputs are looped helper streams
+    idx = len(input_args) - 1 - input_args[::-1].index("-i")
+    return [*input_args[:idx], "-ss", f"{offset:.3f}", *input_args[idx:]]
+
+
+async def build_group_command(db: Session, sessions: List[StreamSession], offset: Optional[float] = None) -> List[str]:
+    lead = sessions[0]
+    cover = overlay_image_path(lead.user_id, lead.image) if lead.image else None
+    audio_only = lead.stream_type == StreamType.audio_only
+    if lead.switchable:
+        plan = _switchable_plan()
+    else:
+        # the segments are the default profile's encoding at source size: usable as they are
+        # by default-profile outputs without overlays, and for nothing else
+        use_segments = not parse_overlays(lead.overlays) and all(
+            _effective_profile(s).name == DEFAULT_PROFILE for s in sessions
+        )
+        plan = await _build_plan(db, lead.source_type, lead.source_id, lead.mode, audio_only, cover, use_segments)
+
+    input_args = plan.input_args
+    if offset and not lead.switchable:
+        if plan.duration and lead.mode != StreamMode.once:
+            offset %= plan.duration
+        input_args = _with_seek(input_args, offset)
+
+    layers = parse_overlays(lead.overlays) if plan.has_video else []
+    if layers and plan.video_copy:
+        # burned-in graphics need the frames decoded; still sources fall back to low-fps encoding
+        plan.video_copy = False
+        plan.fps = plan.fps or settings.still_fps
+
+    chains: List[str] = []
+    source = plan.video_map.rstrip("?")
+    if plan.video_filter:
+        chains.append(f"[{source}]{plan.video_filter}[norm]")
+        source = "norm"
+    if layers:
+        if plan.width is None and plan.cover_segment is not None:
+            plan.width, plan.height = _frame_size(await probe_media(str(plan.cover_segment)))
+        image = await ensure_static_overlay(layers, lead.user_id, plan.width, plan.height)
+        if image is not None:
+            idx = input_args.count("-i")
+            input_args = [*input_args, "-i", str(image)]
+            chains.append(f"[{source}][{idx}:v]overlay=0:0:format=auto[ovs]")
+            source = "ovs"
+        dynamic = dynamic_filters(layers)
+        if dynamic:
+            chains.append(f"[{source}]{','.join(dynamic)}[ovd]")
+            source = "ovd"
+
+    labels: List[Optional[str]] = [None] * len(sessions)
+    if (len(sessions) > 1 or layers or plan.video_filter) and plan.has_video and not plan.video_copy:
+        # decode once (and composite once), then one scaler + encoder per output
+        n = len(sessions)
+        if n > 1:
+            chains.append(f"[{source}]split={n}" + "".join(f"[s{i}]" for i in range(n)))
+        for i, session in enumerate(sessions):
+            chains.append(f"[{'s' + str(i) if n > 1 else source}]{_effective_profile(session).scale_filter() or 'null'}[v{i}]")
+            labels[i] = f"v{i}"
+    filter_args = ["-filter_complex", ";".join(chains)] if chains else []
 
-    cmd = [
+    output_args: List[str] = []
+    for session, label in zip(sessions, labels):
+        output_args += _output_args(session, plan, label)
+
+    return [
         "ffmpeg",
         "-hide_banner",
         "-loglevel",
@@ -124,76 +641,543 @@ async def start_ffmpeg(db: Session, session: StreamSession) -> int:
         "-stats",
         *input_args,
         "-y",
+        *filter_args,
         *output_args,
     ]
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.DEVNULL,
-        stderr=asyncio.subprocess.PIPE,
-    )
 
-    session.pid = process.pid
-    session.status = StreamStatus.running
-    session.start_time = datetime.now(timezone.utc)
-    db.commit()
+async def build_command(db: Session, session: StreamSession) -> List[str]:
+    return await build_group_command(db, [session])
 
-    # send initial status so client can show running immediately
-    await ws_manager.broadcast(
-        session.id,
-        {
-            "type": "status",
-            "status": session.status.value,
-            "rtmp_url": session.destination,
-        },
+
+async def spawn_ffmpeg(session_id: int, cmd: List[str], stdin_pipe: bool = False) -> asyncio.subprocess.Process:
+    log_path = _session_log_path(session_id)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    log_path.write_bytes(b"")
+    with open(log_path, "ab") as log:
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_pipe else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=log,
+            # own process group: a backend restart or deploy does not take ffmpeg down with it
+            start_new_session=settings.detach_streams,
+        )
+
+
+async def start_ffmpeg(db: Session, session: StreamSession) -> int:
+    if settings.shared_decode_window_ms <= 0 or session.switchable:
+        return await _launch([session], db=db)
+    # Sessions of one user for the same source started within the window (one request with
+    # several destinations, a batch, a schedule slot, boot recovery) share one ffmpeg process.
+    # Never across users: a failing or slow destination takes the whole process with it.
+    # Groups only form at launch; a later start for that source gets its own process.
+    key = (
+        session.user_id, session.source_type, session.source_id, session.mode,
+        session.overlays, session.stream_type, session.image,
     )
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    pending = _pending_starts.get(key)
+    if pending is None:
+        pending = _pending_starts[key] = []
+        loop.call_later(settings.shared_decode_window_ms / 1000, lambda: asyncio.create_task(_flush_pending(key)))
+    pending.append((db, session, future))
+    return await future
+
+
+async def _flush_pending(key: tuple) -> None:
+    pending = _pending_starts.pop(key, [])
+    try:
+        # every caller is awaiting its future, so the first one's DB session stays open
+        pid = await _launch([session for _, session, _ in pending], db=pending[0][0])
+    except Exception as exc:
+        for _, _, future in pending:
+            future.set_exception(exc)
+        return
+    for _, _, future in pending:
+        future.set_result(pid)
+
+
+async def _launch(sessions: List[StreamSession], offset: Optional[float] = None, db: Optional[Session] = None) -> int:
+    if db is None:
+        # relaunches (ABR, retries, group changes) only need a DB session while building
+        db = SessionLocal()
+        try:
+            return await _launch(sessions, offset, db)
+        finally:
+            db.close()
+    sessions = [_detach(s) for s in sessions]
+    lead = sessions[0]
+    cmd = await build_group_command(db, sessions, offset)
+
+    if len(sessions) == 1 and not lead.switchable:
+        # HLS segments live on the API host's tmpfs, so those sessions are never placed remotely
+        worker = pick_worker(db) if settings.worker_token and not lead.hls_mode else None
+        pid = None
+        if worker is not None:
+            try:
+                pid = await assign_session(worker, lead.id, cmd)
+            except WorkerError:
+                # fall back to running it on the API host
+                pid = None
+        if pid is not None:
+            _save(
+                lead,
+                pid=pid,
+                worker_id=worker.id,
+                group_id=None,
+                status=StreamStatus.running,
+                start_time=datetime.now(timezone.utc),
+            )
+            # stats arrive through the worker events endpoint
+            await ws_manager.broadcast(
+                lead.id,
+                {
+                    "type": "status",
+                    "status": lead.status.value,
+                    "rtmp_url": lead.destination,
+                },
+            )
+            return pid
+
+    feeder = None
+    if lead.switchable:
+        # resolve before spawning so a bad source fails the start instead of a running encoder
+        items = await _source_paths(db, lead.source_type, lead.source_id)
+    process = await spawn_ffmpeg(lead.id, cmd, stdin_pipe=lead.switchable)
+    if lead.switchable:
+        feeder = SourceFeeder(process.stdin, lead.id)
+        feeder.start(items, lead.mode != StreamMode.once)
+
+    group_id = f"g{lead.id}" if len(sessions) > 1 else None
+    for session in sessions:
+        values = {"pid": process.pid, "worker_id": None, "group_id": group_id, "status": StreamStatus.running}
+        if offset is None or session.start_time is None:
+            values["start_time"] = datetime.now(timezone.utc)
+        _save(session, **values)
+
+    run = _Run(_ProcessHandle(process.pid, process), lead.id, sessions, group_id, offset or 0.0)
+    run.feeder = feeder
+    if feeder is None:
+        # an ABR relaunch would restart the feeder's source from the top
+        run.enable_abr(cmd)
+    await _watch(run)
+    return process.pid
 
-    async def _pump_and_wait():
-        last_stats: FfmpegStats | None = None
-        async for line in _read_stream_lines(process.stderr):
-            stats = _parse_stats(line)
-            if stats:
-                last_stats = stats
+
+async def adopt_ffmpeg(db: Session, session: StreamSession) -> bool:
+    # re-attach to a detached ffmpeg left running by a previous backend instance
+    if session.worker_id:
+        return await remote_session_alive(db, session)
+    if session.switchable:
+        # the feeder died with the previous backend, so the encoder is at EOF; start fresh
+        if session.pid and _pid_alive(session.pid) and _is_session_process(session.pid, session):
+            stop_ffmpeg(session.pid)
+        return False
+    if session.group_id:
+        run = next((r for r in _watched.values() if r.group_id == session.group_id), None)
+        if run is not None and run.handle.alive():
+            run.members.append(_detach(session))
+            _watched[session.id] = run
+            return True
+    if not session.pid or not _pid_alive(session.pid) or not _is_session_process(session.pid, session):
+        return False
+    log_id = int(session.group_id[1:]) if session.group_id else session.id
+    run = _Run(_ProcessHandle(session.pid), log_id, [_detach(session)], session.group_id)
+    run.enable_abr(_proc_argv(session.pid))
+    await _watch(run, from_end=True)
+    return True
+
+
+async def _watch(run: _Run, from_end: bool = False) -> None:
+    for session in run.members:
+        # send initial status so client can show running immediately
+        await ws_manager.broadcast(
+            session.id,
+            {
+                "type": "status",
+                "status": session.status.value,
+                "rtmp_url": session.destination,
+            },
+        )
+        _watched[session.id] = run
+    asyncio.create_task(_pump_and_wait(run, from_end))
+
+
+async def _pump_and_wait(run: _Run, from_end: bool) -> None:
+    last_stats: FfmpegStats | None = None
+    async for line in _tail_lines(_session_log_path(run.log_id), run.handle, from_end):
+        t_read = now_ms()
+        stats = _parse_stats(line)
+        if profiler.enabled:
+            profiler.record(run.log_id, "parse", now_ms() - t_read)
+        if not stats:
+            run.ring.add_line(line)
+        else:
+            last_stats = stats
+            run.ring.add_speed(stats.speed)
+            if stats.out_time is not None:
+                run.position = run.base_offset + stats.out_time
+            if run.abr is not None and not run.switching:
+                direction = run.abr.observe(stats.speed, stats.dropped_frames, stats.dup_frames)
+                if direction:
+                    run.switching = True
+                    asyncio.create_task(_switch_profile(run, direction))
+            for session in list(run.members):
                 msg = {
                     "type": "stats",
                     "bitrate": stats.bitrate,
                     "fps": stats.fps,
                     "dropped_frames": stats.dropped_frames,
+                    "speed": stats.speed,
                     "rtmp_url": session.destination,
                     "status": session.status.value,
+                    "server_time": int(time.time() * 1000),
                 }
                 ws_manager.update_last_stats(session.id, msg)
+                t_broadcast = now_ms()
                 await ws_manager.broadcast(
                     session.id,
                     msg,
                 )
-        # process finished
-        await process.wait()
-        session.status = StreamStatus.stopped
-        session.end_time = datetime.now(timezone.utc)
-        if last_stats and last_stats.bitrate:
-            session.avg_bitrate = last_stats.bitrate
-        db.commit()
-        final = {
-            "type": "status",
-            "status": session.status.value,
-            "rtmp_url": session.destination,
-            "avg_bitrate": session.avg_bitrate,
+                if profiler.enabled:
+                    t_done = now_ms()
+                    profiler.record(session.id, "broadcast", t_done - t_broadcast)
+                    profiler.record(session.id, "read_to_delivery", t_done - t_read)
+    # process finished
+    await run.handle.wait()
+    if run.feeder is not None:
+        run.feeder.stop()
+    for session in run.members:
+        if _watched.get(session.id) is run:
+            _watched.pop(session.id, None)
+    if run.superseded:
+        return
+    # a relaunch of these sessions truncates (or recreates) the log, so it can go now
+    _session_log_path(run.log_id).unlink(missing_ok=True)
+    members = run.members
+    failure = None if run.stopping or draining else _exit_failure(run)
+    if failure is not None:
+        members = await _handle_failure(run, failure)
+    for session in members:
+        await _mark_stopped(session, last_stats)
+
+
+def _exit_failure(run: _Run) -> Optional[str]:
+    # None when the source simply ended or someone stopped the process with a signal
+    code = run.handle.returncode()
+    lines = list(run.ring.lines)
+    if code == 0 or lines_mentioning(lines, "received signal"):
+        return None
+    failure = classify_failure(run.ring.final_lines(), run.ring.speeds)
+    if failure is None and code is not None:
+        return UNKNOWN
+    return failure
+
+
+async def _handle_failure(run: _Run, failure: str) -> List[StreamSession]:
+    # Record the failure on the sessions and schedule retries per the class policy.
+    # Returns the members that are not retried and have to be marked stopped.
+    policy = RETRY_POLICIES[failure]
+    lines = run.ring.final_lines() or list(run.ring.lines)
+    detail = failure_detail(lines, failure)
+    stable = time.monotonic() - run.started >= settings.health_stable_seconds
+    # in a group, an output whose URL shows up in the errors is the one that failed;
+    # the others only went down with the shared process and come straight back
+    culprits = {s.id for s in run.members if lines_mentioning(lines, s.destination)} if len(run.members) > 1 else set()
+    batches: Dict[float, List[StreamSession]] = {}
+    stopped = []
+    for session in run.members:
+        if culprits and session.id not in culprits:
+            batches.setdefault(0.0, []).append(session)
+            continue
+        attempt = 1 if stable else (session.retry_count or 0) + 1
+        delay = retry_delay(policy, attempt)
+        values = {
+            "failure_class": failure,
+            "failure_detail": detail,
+            "retry_count": attempt if delay is not None else 0,
         }
-        ws_manager.update_last_stats(session.id, final)
+        if delay is not None and policy.step_down:
+            lower = step_down(session.active_profile or session.profile)
+            if lower is not None:
+                values["active_profile"] = lower.name
+        _save(session, **values)
         await ws_manager.broadcast(
             session.id,
-            final,
+            {
+                "type": "failure",
+                "failure": failure,
+                "detail": detail,
+                "attempt": attempt,
+                "retry_in": delay,
+                "rtmp_url": session.destination,
+            },
         )
+        if delay is None:
+            stopped.append(session)
+        else:
+            batches.setdefault(delay, []).append(session)
+    for delay, members in batches.items():
+        task = asyncio.create_task(_retry(members, run.position if policy.resume else None, delay))
+        for session in members:
+            _retrying[session.id] = task
+    return stopped
 
-    asyncio.create_task(_pump_and_wait())
-    return process.pid
+
+async def _retry(members: List[StreamSession], offset: Optional[float], delay: float) -> None:
+    await asyncio.sleep(delay)
+    task = asyncio.current_task()
+    # members stopped while waiting were taken out of _retrying
+    members = [s for s in members if _retrying.get(s.id) is task]
+    for session in members:
+        _retrying.pop(session.id, None)
+    if not members or draining:
+        # a draining instance leaves them to the next one's boot recovery
+        return
+    try:
+        await _launch(members, offset)
+    except Exception:
+        for session in members:
+            await _mark_stopped(session)
+
+
+async def _mark_stopped(session: StreamSession, last_stats: Optional[FfmpegStats] = None) -> None:
+    if session.hls_mode:
+        shutil.rmtree(_hls_dir(session.id), ignore_errors=True)
+    quotas.release(session.id)
+    values = {"status": StreamStatus.stopped, "end_time": datetime.now(timezone.utc)}
+    if last_stats and last_stats.bitrate:
+        values["avg_bitrate"] = last_stats.bitrate
+    _save(session, **values)
+    ws_manager.forget(session.id)
+    profiler.forget(session.id)
+    final = {
+        "type": "status",
+        "status": session.status.value,
+        "rtmp_url": session.destination,
+        "avg_bitrate": session.avg_bitrate,
+    }
+    await ws_manager.broadcast(
+        session.id,
+        final,
+    )
+
+
+async def _replace_run(run: _Run, members: List[StreamSession], offset: float) -> None:
+    # stop the current process without ending its sessions, then relaunch them at offset
+    run.superseded = True
+    stop_ffmpeg(run.handle.pid)
+    try:
+        await asyncio.wait_for(run.handle.wait(), timeout=10)
+    except asyncio.TimeoutError:
+        pass
+    if members:
+        await _launch(members, offset)
+
+
+async def _switch_profile(run: _Run, direction: str) -> None:
+    # ABR step: every output of the process moves one rung, bounded by its requested profile
+    changed = []
+    for session in run.members:
+        if direction == "down":
+            target = step_down(session.active_profile or session.profile)
+        else:
+            target = step_up(session.active_profile or session.profile, session.profile)
+        if target is not None:
+            changed.append((session, target.name))
+    if not changed or run.superseded:
+        run.switching = False
+        if run.abr is not None:
+            # nothing left to step to; wait a full hold period before checking again
+            run.abr = AbrController(run.abr.count_drops)
+        return
+    for session, name in changed:
+        _save(session, active_profile=None if name == (session.profile or DEFAULT_PROFILE) else name)
+        await ws_manager.broadcast(
+            session.id,
+            {"type": "profile", "profile": name, "direction": direction, "rtmp_url": session.destination},
+        )
+    # restart at the current position with the new encoder settings
+    await _replace_run(run, list(run.members), run.position)
+
+
+async def switch_source(
+    db: Session,
+    session: StreamSession,
+    source_type: StreamSourceType,
+    source_id: int,
+    mode: StreamMode,
+    insert: bool = False,
+) -> None:
+    run = _watched.get(session.id)
+    if run is None or run.feeder is None or run.feeder.closed:
+        raise ValueError("Session is not a running switchable stream")
+    items = await _source_paths(db, source_type, source_id)
+    run.feeder.switch(items, mode != StreamMode.once, insert=insert)
+    if not insert:
+        session.source_type, session.source_id, session.mode = source_type, source_id, mode
+        db.commit()
+        for member in run.members:
+            # keep the run's copy in step for a retry after a failure
+            member.source_type, member.source_id, member.mode = source_type, source_id, mode
+    await ws_manager.broadcast(
+        session.id,
+        {
+            "type": "source",
+            "source_type": source_type.value,
+            "source_id": source_id,
+            "insert": insert,
+            "rtmp_url": session.destination,
+        },
+    )
 
 
 def stop_ffmpeg(pid: int) -> None:
     try:
-        os.kill(pid, signal.SIGTERM)
+        if os.getpgid(pid) == pid:
+            # detached ffmpeg leads its own process group (start_new_session)
+            os.killpg(pid, signal.SIGTERM)
+        else:
+            os.kill(pid, signal.SIGTERM)
     except ProcessLookupError:
         return
 
 
+def _cancel_retry(session: StreamSession) -> bool:
+    task = _retrying.pop(session.id, None)
+    if task is None:
+        return False
+    if task not in _retrying.values():
+        task.cancel()
+    return True
+
+
+async def stop_session(db: Session, session: StreamSession) -> None:
+    if session.worker_id:
+        await release_session(db, session)
+        return
+    if _cancel_retry(session):
+        # between a failure and its retry there is no process to stop
+        await _mark_stopped(session)
+        return
+    run = _watched.get(session.id)
+    if run is not None and len(run.members) == 1:
+        run.stopping = True
+    if run is not None and run.feeder is not None:
+        run.feeder.stop()
+    if run is not None and len(run.members) > 1:
+        # leaving a shared-decode group: the other members are relaunched without this
+        # output, resuming at the group's current position (they see a brief reconnect)
+        remaining = [s for s in run.members if s.id != session.id]
+        await _replace_run(run, remaining, run.position)
+        if run.log_id == session.id:
+            # the relaunched group logs under its new lead
+            _session_log_path(session.id).unlink(missing_ok=True)
+        session.group_id = None
+        await _mark_stopped(session)
+        return
+    if session.pid:
+        stop_ffmpeg(session.pid)
+
+
+async def stop_sessions(db: Session, sessions: List[StreamSession]) -> Dict[int, str]:
+    # Batch stop: one termination per process, so a shared-decode group stopped as a whole is
+    # not relaunched for every member that leaves it. Returns errors by session id.
+    by_id = {s.id: s for s in sessions}
+    runs: Dict[int, _Run] = {}
+    singles = []
+    for session in sessions:
+        run = _watched.get(session.id)
+        if run is not None and len(run.members) > 1:
+            runs[id(run)] = run
+        else:
+            singles.append(session)
+    errors: Dict[int, str] = {}
+    limit = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def guarded(ids: List[int], job) -> None:
+        async with limit:
+            try:
+                await job
+            except Exception as exc:
+                for sid in ids:
+                    errors[sid] = str(exc) or exc.__class__.__name__
+
+    async def stop_group(run: _Run) -> None:
+        remaining = [m for m in run.members if m.id not in by_id]
+        if remaining:
+            await _replace_run(run, remaining, run.position)
+            for member in run.members:
+                if member.id in by_id:
+                    await _mark_stopped(by_id[member.id])
+        else:
+            run.stopping = True
+            stop_ffmpeg(run.handle.pid)
+
+    jobs = [guarded([m.id for m in run.members if m.id in by_id], stop_group(run)) for run in runs.values()]
+    jobs += [guarded([s.id], stop_session(db, s)) for s in singles]
+    await asyncio.gather(*jobs)
+    return errors
+
+
+async def release_for_restart(db: Session, sessions: List[StreamSession]) -> None:
+    # Take down the processes behind these sessions without ending the sessions, so they can
+    # be started again; group members that are not restarted resume at the group position.
+    selected = {s.id for s in sessions}
+    runs: Dict[int, _Run] = {}
+    for session in sessions:
+        if _cancel_retry(session):
+            continue
+        run = _watched.get(session.id)
+        if run is not None:
+            runs[id(run)] = run
+        elif session.worker_id:
+            await release_session(db, session)
+        elif session.pid and _pid_alive(session.pid) and _is_session_process(session.pid, session):
+            stop_ffmpeg(session.pid)
+    limit = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def replace(run: _Run) -> None:
+        async with limit:
+            await _replace_run(run, [m for m in run.members if m.id not in selected], run.position)
+
+    await asyncio.gather(*(replace(run) for run in runs.values()))
+
+
+def begin_drain() -> None:
+    global draining
+    draining = True
+
+
+def is_draining() -> bool:
+    return draining
+
+
+def watched_sessions() -> List[int]:
+    return list(_watched.keys())
+
+
+def runtime_stats() -> dict:
+    runs = list({id(r): r for r in _watched.values()}.values())
+    return {
+        "sessions": len(_watched),
+        "runs": len(runs),
+        "stderr_lines": sum(len(run.ring.lines) for run in runs),
+        "stderr_bytes": sum(approx_size(run.ring.lines) for run in runs),
+        "retrying": len(_retrying),
+        "pending_starts": sum(len(p) for p in _pending_starts.values()),
+    }
+
+
+async def drain_stop_all(timeout: float = 10.0) -> int:
+    runs = list({id(r): r for r in _watched.values()}.values())
+    for run in runs:
+        run.stopping = True
+    handles = [run.handle for run in runs]
+    for handle in handles:
+        stop_ffmpeg(handle.pid)
+    if handles:
+        await asyncio.wait([asyncio.create_task(h.wait()) for h in handles], timeout=timeout)
+    return len(handles)
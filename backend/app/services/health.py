@@ -0,0 +1,118 @@
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional
+
+from ..config import settings
+
+
+AUTH_REJECTED = "auth_rejected"
+CONNECTION_RESET = "connection_reset"
+SOURCE_IO_ERROR = "source_io_error"
+ENCODER_TOO_SLOW = "encoder_too_slow"
+UNKNOWN = "unknown"
+
+# checked in order against the lines after the last progress line only (earlier decode
+# warnings say nothing about why the process died); a rejected key usually also shows
+# up as a closed connection
+PATTERNS = [
+    (AUTH_REJECTED, re.compile(
+        r"NetConnection\.Connect\.Rejected|NetStream\.Publish\.(BadName|Denied|Rejected)|"
+        r"authentication failed|Server returned 40[13]|HTTP error 40[13]|invalid (stream )?key",
+        re.IGNORECASE,
+    )),
+    (SOURCE_IO_ERROR, re.compile(
+        r"No such file or directory|Invalid data found when processing input|moov atom not found|"
+        r"Permission denied|Impossible to open|Error while decoding|Input/output error",
+        re.IGNORECASE,
+    )),
+    (CONNECTION_RESET, re.compile(
+        r"Connection reset by peer|Broken pipe|Connection refused|Connection timed out|"
+        r"Network is unreachable|No route to host|Failed to resolve hostname|"
+        r"Error (writing|in the pull function)|End of file|Cannot open connection",
+        re.IGNORECASE,
+    )),
+]
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    # resume at the last output position instead of the top of the source
+    resume: bool = True
+    # relaunch one profile lower
+    step_down: bool = False
+
+
+# a rejected key or a broken source will not fix itself; network drops usually do, fast
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    AUTH_REJECTED: RetryPolicy(0, 0, 0),
+    SOURCE_IO_ERROR: RetryPolicy(1, 10, 10),
+    CONNECTION_RESET: RetryPolicy(10, 1, 30),
+    ENCODER_TOO_SLOW: RetryPolicy(3, 5, 30, step_down=True),
+    UNKNOWN: RetryPolicy(3, 5, 60),
+}
+
+
+class StderrRing:
+    """Last lines of ffmpeg output that are not progress lines, for failure analysis."""
+
+    def __init__(self, size: Optional[int] = None) -> None:
+        self.lines: Deque[str] = deque(maxlen=size or settings.stderr_ring_lines)
+        self.speeds: Deque[float] = deque(maxlen=20)
+        # lines added since the last progress line
+        self.since_progress = 0
+
+    def add_line(self, line: str) -> None:
+        self.lines.append(line)
+        self.since_progress += 1
+
+    def add_speed(self, speed: Optional[str]) -> None:
+        # called for every progress line
+        self.since_progress = 0
+        try:
+            if speed:
+                self.speeds.append(float(speed))
+        except ValueError:
+            pass
+
+    def tail(self, count: int = 10) -> List[str]:
+        return list(self.lines)[-count:]
+
+    def final_lines(self) -> List[str]:
+        # what ffmpeg said after it stopped making progress: the fatal part
+        return self.tail(self.since_progress) if self.since_progress else []
+
+
+def classify_failure(lines: Iterable[str], speeds: Iterable[float] = ()) -> Optional[str]:
+    lines = list(lines)
+    for failure, pattern in PATTERNS:
+        if any(pattern.search(line) for line in lines):
+            return failure
+    speeds = list(speeds)
+    # ffmpeg fell steadily behind real time before it died
+    if len(speeds) >= 5 and sum(speeds) / len(speeds) < settings.health_slow_speed:
+        return ENCODER_TOO_SLOW
+    return None
+
+
+def retry_delay(policy: RetryPolicy, attempt: int) -> Optional[float]:
+    # attempt counts from 1; None once the policy is exhausted
+    if attempt > policy.max_attempts or not settings.health_retry_enabled:
+        return None
+    return min(policy.base_delay * (2 ** (attempt - 1)), policy.max_delay)
+
+
+def failure_detail(lines: Iterable[str], failure: str) -> Optional[str]:
+    # the last line that explains the failure, else the last thing ffmpeg said
+    lines = list(lines)
+    pattern = next((p for name, p in PATTERNS if name == failure), None)
+    matching = [line for line in lines if pattern is not None and pattern.search(line)]
+    detail = (matching or lines or [None])[-1]
+    return detail[:512] if detail else None
+
+
+def lines_mentioning(lines: Iterable[str], needle: str) -> bool:
+    return any(needle in line for line in lines)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import math
+import re
+from typing import Optional, Set
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Video
+from .segments import ensure_segments
+from .source_cache import CachedVideo, source_cache
+
+
+IMAGE_CODECS = {"mjpeg", "png", "bmp", "gif", "webp", "tiff"}
+FREEZE_DURATION_REGEX = re.compile(r"freeze_duration:\s*(?P<seconds>[\d\.]+)")
+LOUDNORM_JSON_REGEX = re.compile(r"\{[^{}]*\"input_i\"[^{}]*\}")
+
+# how much of the source the freeze analysis looks at; enough to tell a still
+# "radio" picture from real footage without decoding hours of media at ingest
+ANALYZE_SECONDS = 60
+
+
+async def _run(*cmd: str) -> tuple[int, str, str]:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    return proc.returncode, out.decode(errors="ignore"), err.decode(errors="ignore")
+
+
+def _parse_rate(rate: Optional[str]) -> Optional[float]:
+    if not rate or rate == "0/0":
+        return None
+    try:
+        num, _, den = rate.partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+async def probe_media(path: str) -> dict:
+    code, out, err = await _run(
+        "ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path,
+    )
+    if code != 0:
+        raise ValueError(f"ffprobe failed: {err.strip()[:200]}")
+    data = json.loads(out or "{}")
+    info: dict = {"duration": None, "video": None, "audio": None}
+    try:
+        info["duration"] = float(data.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        pass
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        if kind == "video" and info["video"] is None:
+            nb_frames = stream.get("nb_frames")
+            info["video"] = {
+                "codec": stream.get("codec_name"),
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+                "fps": _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate")),
+                "nb_frames": int(nb_frames) if nb_frames and nb_frames.isdigit() else None,
+                "attached_pic": bool(stream.get("disposition", {}).get("attached_pic")),
+            }
+        elif kind == "audio" and info["audio"] is None:
+            info["audio"] = {
+                "codec": stream.get("codec_name"),
+                "channels": stream.get("channels"),
+                "sample_rate": stream.get("sample_rate"),
+            }
+    return info
+
+
+async def frozen_fraction(path: str, duration: Optional[float] = None) -> Optional[float]:
+    # share of the analyzed window in which the picture does not change
+    seconds = min(ANALYZE_SECONDS, duration) if duration else ANALYZE_SECONDS
+    code, _, err = await _run(
+        "ffmpeg", "-hide_banner", "-nostats", "-t", str(seconds), "-i", path,
+        "-map", "0:v:0", "-vf", "freezedetect=n=-60dB:d=1", "-f", "null", "-",
+    )
+    if code != 0:
+        return None
+    frozen = sum(float(m.group("seconds")) for m in FREEZE_DURATION_REGEX.finditer(err))
+    return min(1.0, frozen / seconds) if seconds > 0 else None
+
+
+async def measure_loudness(path: str) -> Optional[dict]:
+    # first loudnorm pass, done once at ingest; streams apply the result as a plain gain
+    code, _, err = await _run(
+        "ffmpeg", "-hide_banner", "-nostats", "-i", path, "-map", "0:a:0", "-vn",
+        "-af", f"loudnorm=I={settings.loudnorm_target}:TP={settings.loudnorm_true_peak}:LRA=11:print_format=json",
+        "-f", "null", "-",
+    )
+    match = LOUDNORM_JSON_REGEX.search(err)
+    if code != 0 or not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+        measured = {
+            "i": float(data["input_i"]),
+            "tp": float(data["input_tp"]),
+            "lra": float(data["input_lra"]),
+            "thresh": float(data["input_thresh"]),
+        }
+    except (KeyError, ValueError):
+        return None
+    # silent audio measures as -inf
+    return measured if all(math.isfinite(v) for v in measured.values()) else None
+
+
+def classify_content(info: dict) -> str:
+    video = info.get("video")
+    if video is None:
+        return "audio_only"
+    if video.get("attached_pic") or video.get("codec") in IMAGE_CODECS or (video.get("nb_frames") or 2) <= 1:
+        return "still"
+    frozen = info.get("frozen_fraction")
+    if frozen is not None:
+        if frozen >= 0.95:
+            return "still"
+        if frozen >= 0.6:
+            return "low_motion"
+    fps = video.get("fps")
+    if fps is not None and fps <= 5:
+        return "low_motion"
+    return "normal"
+
+
+async def analyze_video(db: Session, video: Video, loudness: bool = True) -> dict:
+    # loudness=False skips the full-file loudness decode; callers waiting on the result
+    # (a stream start) use that and leave the measurement to schedule_analysis
+    info = await probe_media(video.filepath)
+    if info["video"] and not info["video"]["attached_pic"] and info["video"]["codec"] not in IMAGE_CODECS:
+        info["frozen_fraction"] = await frozen_fraction(video.filepath, info["duration"])
+    info["content"] = classify_content(info)
+    if info["audio"] and loudness:
+        info["loudness"] = await measure_loudness(video.filepath)
+    video.media_info = json.dumps(info)
+    db.commit()
+    source_cache.invalidate_video(video.id)
+    return info
+
+
+async def analyze_video_by_id(video_id: int) -> None:
+    # ingest hook: runs after the upload response with its own DB session
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        video = db.query(Video).filter(Video.id == video_id).first()
+        if video is None:
+            return
+        try:
+            info = await analyze_video(db, video)
+        except (ValueError, OSError):
+            return
+        source = CachedVideo.from_row(video)
+    finally:
+        db.close()
+    # cut once here so streams of this video only copy; the DB session is not held for it
+    try:
+        await ensure_segments(source, info)
+    except (RuntimeError, OSError):
+        pass
+
+
+_analyzing: Set[int] = set()
+
+
+def schedule_analysis(video_id: int) -> None:
+    # full analysis (loudness, segment cut) in the background, once per video at a time
+    if video_id in _analyzing:
+        return
+    _analyzing.add(video_id)
+    task = asyncio.ensure_future(analyze_video_by_id(video_id))
+    task.add_done_callback(lambda _: _analyzing.discard(video_id))
+
+
+def media_info(video) -> Optional[dict]:
+    # accepts a Video row or a cached source entry
+    if not video.media_info:
+        return None
+    try:
+        return json.loads(video.media_info)
+    except ValueError:
+        return None
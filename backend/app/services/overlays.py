@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..config import settings
+from ..models import OverlayType
+from .pacing import _ffmpeg
+
+
+STATIC_TYPES = {OverlayType.image.value, OverlayType.text.value}
+
+_render_locks: Dict[str, asyncio.Lock] = {}
+
+
+def parse_overlays(raw: Optional[str]) -> List[dict]:
+    if not raw:
+        return []
+    try:
+        layers = json.loads(raw)
+    except ValueError:
+        return []
+    return layers if isinstance(layers, list) else []
+
+
+def overlay_image_path(owner_id: int, name: str) -> Path:
+    # images are referenced by file name inside their uploader's folder of overlays_dir,
+    # so a layer can only use (and an upload only replace) its owner's own images
+    if not name or os.path.basename(name) != name:
+        raise ValueError("Invalid overlay image name")
+    return Path(settings.overlays_dir) / str(owner_id) / name
+
+
+def _option_value(value: str) -> str:
+    # drawtext option level: the option parser splits on ':' and strips quotes and backslashes
+    # (text layers use expansion=none, so '%' needs no escaping)
+    return value.replace("\\", "\\\\").replace("'", "\\'").replace(":", "\\:")
+
+
+def _graph_value(value: str) -> str:
+    # filtergraph level, applied on top: -filter_complex removes one level of escaping
+    return re.sub(r"([\\'\[\],;])", r"\\\1", value)
+
+
+def _drawtext(layer: dict, text: str, expansion: str = "none", x: Optional[str] = None) -> str:
+    # text and x arrive escaped for the option level; the whole option string is then
+    # escaped once more for the filtergraph it is embedded in
+    opts = [
+        f"fontfile={_option_value(settings.overlay_font)}",
+        f"text={text}",
+        f"expansion={expansion}",
+        f"x={x or layer.get('x', 10)}",
+        f"y={layer.get('y', 10)}",
+        f"fontsize={layer.get('size', 24)}",
+        f"fontcolor={layer.get('color', 'white')}",
+    ]
+    if layer.get("box"):
+        opts += ["box=1", "boxcolor=black@0.5", "boxborderw=6"]
+    return "drawtext=" + _graph_value(":".join(opts))
+
+
+def dynamic_filters(layers: List[dict]) -> List[str]:
+    # per-frame work is limited to the text that actually changes
+    filters = []
+    for layer in layers:
+        if layer.get("type") == OverlayType.clock.value:
+            fmt = layer.get("format") or "%H:%M:%S"
+            filters.append(_drawtext(layer, "%{localtime\\:" + fmt.replace(":", "\\:") + "}", expansion="normal"))
+        elif layer.get("type") == OverlayType.ticker.value:
+            speed = int(layer.get("speed") or 100)
+            filters.append(_drawtext(layer, _option_value(layer.get("text") or ""), x=f"w-mod(t*{speed},w+tw)"))
+    return filters
+
+
+def _static_key(layers: List[dict], owner_id: int, width: int, height: int) -> str:
+    parts = [json.dumps(layers, sort_keys=True), f"{width}x{height}", settings.overlay_font]
+    for layer in layers:
+        if layer.get("type") == OverlayType.image.value:
+            st = os.stat(overlay_image_path(owner_id, layer.get("image") or ""))
+            parts.append(f"{owner_id}/{layer['image']}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()[:16]
+
+
+async def ensure_static_overlay(
+    layers: List[dict], owner_id: int, width: Optional[int], height: Optional[int]
+) -> Optional[Path]:
+    # Logos and fixed text are composited once into a transparent frame-sized PNG keyed by
+    # content hash; the stream overlays that single image instead of re-rasterizing per frame.
+    static = [layer for layer in layers if layer.get("type") in STATIC_TYPES]
+    if not static:
+        return None
+    if not width or not height:
+        raise ValueError("Source resolution unknown, cannot place overlays")
+    width, height = width - width % 2, height - height % 2
+    key = _static_key(static, owner_id, width, height)
+    target = Path(settings.cache_dir) / "overlays" / f"{key}.png"
+    if target.exists():
+        os.utime(target)
+        return target
+    lock = _render_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        if target.exists():
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        inputs = ["-f", "lavfi", "-i", f"color=c=black@0.0:s={width}x{height}:d=1,format=rgba"]
+        chains = []
+        current = "0:v"
+        for i, layer in enumerate(static):
+            label = f"l{i}"
+            if layer["type"] == OverlayType.image.value:
+                idx = inputs.count("-i")
+                inputs += ["-i", str(overlay_image_path(owner_id, layer.get("image") or ""))]
+                prep = "format=rgba"
+                if layer.get("width"):
+                    prep = f"scale={int(layer['width'])}:-1," + prep
+                opacity = float(layer.get("opacity", 1.0))
+                if opacity < 1.0:
+                    prep += f",colorchannelmixer=aa={opacity:.2f}"
+                chains.append(f"[{idx}:v]{prep}[img{i}]")
+                chains.append(f"[{current}][img{i}]overlay={layer.get('x', 10)}:{layer.get('y', 10)}:format=auto[{label}]")
+            else:
+                chains.append(f"[{current}]{_drawtext(layer, _option_value(layer.get('text') or ''))}[{label}]")
+            current = label
+        tmp = target.with_suffix(".tmp.png")
+        try:
+            await _ffmpeg(
+                *inputs,
+                "-filter_complex", ";".join(chains),
+                "-map", f"[{current}]", "-frames:v", "1", "-f", "image2", str(tmp),
+            )
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+    _render_locks.pop(key, None)
+    return target
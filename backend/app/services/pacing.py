@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..config import settings
+from ..models import Video
+
+
+_segment_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _segment_key(video: Video) -> str:
+    stat = os.stat(video.filepath)
+    raw = f"{video.filepath}:{stat.st_size}:{stat.st_mtime_ns}:{settings.still_fps}:{settings.still_segment_seconds}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+async def _ffmpeg(*args: str) -> None:
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode(errors='ignore').strip()[:200]}")
+
+
+async def _encode_still(frame_args: List[str], target: Path) -> None:
+    # one picture -> short low-fps H.264 segment, looped by the stream with -c:v copy
+    target.parent.mkdir(parents=True, exist_ok=True)
+    frame = target.with_suffix(".png")
+    tmp = target.with_suffix(".tmp.mp4")
+    try:
+        await _ffmpeg(*frame_args, "-frames:v", "1", str(frame))
+        fps = settings.still_fps
+        await _ffmpeg(
+            "-loop", "1", "-framerate", str(fps), "-i", str(frame),
+            "-t", str(settings.still_segment_seconds),
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage",
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", "-pix_fmt", "yuv420p",
+            "-g", str(fps * 2), "-b:v", "500k",
+            "-f", "mp4", str(tmp),
+        )
+        os.replace(tmp, target)
+    finally:
+        for p in (frame, tmp):
+            p.unlink(missing_ok=True)
+
+
+async def _cached_segment(key: str, target: Path, frame_args: List[str]) -> Path:
+    if target.exists():
+        # mtime doubles as last-use time for the cache LRU
+        os.utime(target)
+        return target
+    lock = _segment_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        if not target.exists():
+            await _encode_still(frame_args, target)
+    _segment_locks.pop(key, None)
+    return target
+
+
+async def ensure_still_segment(video: Video) -> Path:
+    # Encode the first frame once into a short low-fps H.264 segment; the stream then
+    # loops it with -c:v copy so the video side costs no encode at all.
+    key = _segment_key(video)
+    target = Path(settings.cache_dir) / "still" / f"{video.id}_{key}.mp4"
+    return await _cached_segment(key, target, ["-i", video.filepath, "-map", "0:v:0"])
+
+
+async def ensure_image_segment(image: Optional[Path]) -> Path:
+    # cover picture for audio-only streams; without one a black 720p frame is used
+    if image is None:
+        frame_args = ["-f", "lavfi", "-i", "color=c=black:s=1280x720"]
+        raw = "black:1280x720"
+    else:
+        stat = os.stat(image)
+        frame_args = ["-i", str(image)]
+        raw = f"{image}:{stat.st_size}:{stat.st_mtime_ns}"
+    raw += f":{settings.still_fps}:{settings.still_segment_seconds}"
+    key = hashlib.sha1(raw.encode()).hexdigest()[:16]
+    target = Path(settings.cache_dir) / "still" / f"image_{key}.mp4"
+    return await _cached_segment(key, target, frame_args)
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import socket
+import ssl
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from ..config import settings
+
+
+DEFAULT_PORTS = {"rtmp": 1935, "rtmps": 443}
+# RTMP simple handshake: C0/S0 version byte, C1/S1 1536-byte blocks
+RTMP_VERSION = 3
+HANDSHAKE_SIZE = 1536
+
+
+class PreflightError(ValueError):
+    def __init__(self, message: str, results: List["PreflightResult"]) -> None:
+        super().__init__(message)
+        self.results = results
+
+
+@dataclass
+class PreflightResult:
+    destination: str
+    ok: bool
+    # where it failed: "url", "dns", "connect" or "handshake"; "skipped" (ok) when not RTMP
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+    cached: bool = False
+
+
+Endpoint = Tuple[str, str, int]
+
+
+def _scheme(url: str) -> str:
+    try:
+        return urlparse(url).scheme.lower()
+    except ValueError:
+        return ""
+
+
+def _endpoint(url: str) -> Optional[Endpoint]:
+    try:
+        parsed = urlparse(url)
+        # .port raises for a non-numeric or out-of-range port
+        port = parsed.port
+    except ValueError:
+        return None
+    scheme = parsed.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parsed.hostname:
+        return None
+    return scheme, parsed.hostname, port or DEFAULT_PORTS[scheme]
+
+
+class DestinationPreflight:
+    """Checks that an RTMP destination accepts connections before a stream is started.
+
+    DNS answers and results are cached per host:port (the stream key plays no part
+    in reachability), and concurrent checks of the same endpoint share one probe.
+    Destinations with other schemes are passed to ffmpeg unchecked.
+    """
+
+    def __init__(self) -> None:
+        self._dns: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._results: Dict[Endpoint, Tuple[float, PreflightResult]] = {}
+        self._inflight: Dict[Endpoint, asyncio.Future] = {}
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        cached = self._dns.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._dns[key] = (time.monotonic() + settings.preflight_dns_ttl, addresses)
+        return addresses
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        c1 = struct.pack(">II", int(time.monotonic() * 1000) & 0xFFFFFFFF, 0) + os.urandom(HANDSHAKE_SIZE - 8)
+        writer.write(bytes([RTMP_VERSION]) + c1)
+        await writer.drain()
+        s0s1 = await reader.readexactly(1 + HANDSHAKE_SIZE)
+        if s0s1[0] != RTMP_VERSION:
+            raise ValueError(f"unexpected RTMP version {s0s1[0]}")
+        # C2 echoes S1; the server's S2 is not needed to know it speaks RTMP
+        writer.write(s0s1[1:])
+        await writer.drain()
+
+    async def _probe(self, url: str, endpoint: Endpoint) -> PreflightResult:
+        scheme, host, port = endpoint
+        started = time.perf_counter()
+        result = PreflightResult(url, ok=False)
+        timeout = settings.preflight_timeout
+        try:
+            result.stage = "dns"
+            addresses = await asyncio.wait_for(self._resolve(host, port), timeout)
+            result.stage = "connect"
+            tls = ssl.create_default_context() if scheme == "rtmps" else None
+            last_exc: Optional[BaseException] = None
+            for address in addresses:
+                try:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(address, port, ssl=tls, server_hostname=host if tls else None),
+                        timeout,
+                    )
+                    break
+                except (OSError, asyncio.TimeoutError) as exc:
+                    last_exc = exc
+            else:
+                raise last_exc or OSError("no address")
+            try:
+                if settings.preflight_handshake:
+                    result.stage = "handshake"
+                    await asyncio.wait_for(self._handshake(reader, writer), timeout)
+            finally:
+                writer.close()
+            result.ok, result.stage = True, None
+        except asyncio.TimeoutError:
+            result.error = f"{result.stage} timed out after {timeout:g}s ({host}:{port})"
+        except asyncio.IncompleteReadError:
+            result.error = f"{host}:{port} closed the connection during the RTMP handshake"
+        except (OSError, ValueError, ssl.SSLError) as exc:
+            result.error = f"{result.stage} failed for {host}:{port}: {exc}"
+        result.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def check(self, url: str) -> PreflightResult:
+        if _scheme(url) not in DEFAULT_PORTS:
+            # other outputs ffmpeg can write to (srt://, udp://, files, ...) go through unchecked
+            return PreflightResult(url, ok=True, stage="skipped")
+        endpoint = _endpoint(url)
+        if endpoint is None:
+            return PreflightResult(url, ok=False, stage="url", error="Invalid RTMP URL: a host and a port in 1-65535 are required")
+        cached = self._results.get(endpoint)
+        if cached is not None and cached[0] > time.monotonic():
+            hit = cached[1]
+            return PreflightResult(url, hit.ok, hit.stage, hit.error, hit.latency_ms, cached=True)
+        pending = self._inflight.get(endpoint)
+        if pending is None:
+            pending = self._inflight[endpoint] = asyncio.ensure_future(self._probe(url, endpoint))
+            pending.add_done_callback(lambda _: self._inflight.pop(endpoint, None))
+        result = await asyncio.shield(pending)
+        now = time.monotonic()
+        if len(self._results) > 1024:
+            self._results = {k: v for k, v in self._results.items() if v[0] > now}
+        self._results[endpoint] = (now + settings.preflight_cache_seconds, result)
+        return PreflightResult(url, result.ok, result.stage, result.error, result.latency_ms)
+
+    async def check_all(self, urls: Iterable[str]) -> List[PreflightResult]:
+        return list(await asyncio.gather(*(self.check(url) for url in urls)))
+
+    async def ensure_reachable(self, urls: Iterable[str]) -> List[PreflightResult]:
+        urls = list(urls)
+        if not settings.preflight_enabled:
+            return []
+        results = await self.check_all(urls)
+        failed = [r for r in results if not r.ok]
+        if failed:
+            # errors name host:port only, never the stream key
+            raise PreflightError("Destination unreachable: " + "; ".join(r.error or "" for r in failed), failed)
+        return results
+
+    def stats(self) -> dict:
+        return {"dns": len(self._dns), "results": len(self._results), "inflight": len(self._inflight)}
+
+
+preflight = DestinationPreflight()
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class StreamProfile:
+    name: str
+    video_bitrate: int  # kbit/s
+    height: Optional[int] = None  # None keeps the source resolution
+    audio_bitrate: Optional[int] = None  # kbit/s, None leaves the encoder default
+
+    def video_args(self, fps: Optional[int] = None) -> List[str]:
+        args = [
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-tune",
+            "zerolatency",
+            "-b:v",
+            f"{self.video_bitrate}k",
+            "-maxrate",
+            f"{self.video_bitrate}k",
+            "-bufsize",
+            f"{self.video_bitrate * 2}k",
+        ]
+        if fps:
+            args += ["-r", str(fps), "-g", str(fps * 2)]
+        return args
+
+    def scale_filter(self) -> Optional[str]:
+        return f"scale=-2:{self.height}" if self.height else None
+
+    def audio_args(self) -> List[str]:
+        args = ["-c:a", "aac"]
+        if self.audio_bitrate:
+            args += ["-b:a", f"{self.audio_bitrate}k"]
+        return args
+
+
+DEFAULT_PROFILE = "default"
+# used by low_bandwidth streams unless they ask for a profile
+LOW_BANDWIDTH_PROFILE = "480p"
+
+PROFILES: Dict[str, StreamProfile] = {
+    p.name: p
+    for p in [
+        StreamProfile("1080p", 4500, 1080, 160),
+        StreamProfile(DEFAULT_PROFILE, 3000),
+        StreamProfile("720p", 2500, 720, 128),
+        StreamProfile("540p", 1500, 540, 128),
+        StreamProfile(LOW_BANDWIDTH_PROFILE, 800, 480, 64),
+        StreamProfile("360p", 700, 360, 64),
+    ]
+}
+
+
+def get_profile(name: Optional[str]) -> StreamProfile:
+    return PROFILES.get(name or DEFAULT_PROFILE, PROFILES[DEFAULT_PROFILE])
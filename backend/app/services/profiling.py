@@ -0,0 +1,201 @@
+import asyncio
+import cProfile
+import dataclasses
+import io
+import logging
+import os
+import pstats
+import re
+import resource
+import shutil
+import sys
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ..config import settings
+
+
+SLOW_CALLBACK_REGEX = re.compile(r"Executing (?P<handle>.+) took (?P<seconds>[\d\.]+) seconds")
+
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(values) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": _percentile(ordered, 50),
+        "p95": _percentile(ordered, 95),
+        "p99": _percentile(ordered, 99),
+        "max": ordered[-1] if ordered else None,
+    }
+
+
+class _SlowCallbackHandler(logging.Handler):
+    def __init__(self, sink: Deque[dict]) -> None:
+        super().__init__(level=logging.WARNING)
+        self.sink = sink
+
+    def emit(self, record: logging.LogRecord) -> None:
+        match = SLOW_CALLBACK_REGEX.search(record.getMessage())
+        if match:
+            self.sink.append({
+                "at": record.created,
+                "handle": match.group("handle")[:300],
+                "ms": float(match.group("seconds")) * 1000,
+            })
+
+
+class Profiler:
+    """Opt-in latency instrumentation for the event loop and stats pumps."""
+
+    def __init__(self, window: int = 512) -> None:
+        self.enabled = False
+        self.window = window
+        self.loop_lag_ms: Deque[float] = deque(maxlen=window)
+        self.slow_callbacks: Deque[dict] = deque(maxlen=100)
+        self.stages: Dict[int, Dict[str, Deque[float]]] = {}
+        self._lag_task: Optional[asyncio.Task] = None
+        self._handler: Optional[_SlowCallbackHandler] = None
+
+    def start(self) -> None:
+        if self.enabled:
+            return
+        self.enabled = True
+        loop = asyncio.get_running_loop()
+        if settings.slow_callback_ms > 0:
+            loop.set_debug(True)
+            loop.slow_callback_duration = settings.slow_callback_ms / 1000
+            self._handler = _SlowCallbackHandler(self.slow_callbacks)
+            logging.getLogger("asyncio").addHandler(self._handler)
+        self._lag_task = asyncio.create_task(self._sample_loop_lag(settings.loop_lag_interval_ms / 1000))
+
+    def stop(self) -> None:
+        self.enabled = False
+        if self._lag_task:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._handler:
+            logging.getLogger("asyncio").removeHandler(self._handler)
+            self._handler = None
+            asyncio.get_running_loop().set_debug(False)
+
+    async def _sample_loop_lag(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag_ms.append(max(0.0, (loop.time() - before - interval) * 1000))
+
+    def record(self, session_id: int, stage: str, ms: float) -> None:
+        per_session = self.stages.setdefault(session_id, {})
+        per_session.setdefault(stage, deque(maxlen=self.window)).append(ms)
+
+    def forget(self, session_id: int) -> None:
+        self.stages.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.stages),
+            "samples": sum(len(v) for stages in self.stages.values() for v in stages.values()),
+            "bytes": approx_size(self.stages),
+        }
+
+    def report(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loop_lag_ms": summarize(self.loop_lag_ms),
+            "slow_callbacks": list(self.slow_callbacks)[-20:],
+            "sessions": {
+                sid: {stage: summarize(values) for stage, values in stages.items()}
+                for sid, stages in self.stages.items()
+            },
+        }
+
+
+async def profile_event_loop(seconds: float, limit: int = 30) -> str:
+    # cProfile hooks sys.setprofile on the calling thread, which is the loop thread,
+    # so everything the loop runs during the window is captured.
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+async def dump_stacks() -> dict:
+    py_spy = shutil.which("py-spy")
+    if py_spy:
+        proc = await asyncio.create_subprocess_exec(
+            py_spy, "dump", "--pid", str(os.getpid()),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        out, _ = await proc.communicate()
+        if proc.returncode == 0:
+            return {"source": "py-spy", "dump": out.decode(errors="ignore")}
+    threads = {
+        str(thread_id): "".join(traceback.format_stack(frame))
+        for thread_id, frame in sys._current_frames().items()
+    }
+    tasks = {}
+    for task in asyncio.all_tasks():
+        buf = io.StringIO()
+        task.print_stack(limit=10, file=buf)
+        tasks[task.get_name()] = buf.getvalue()
+    return {"source": "python", "threads": threads, "tasks": tasks}
+
+
+def approx_size(obj: Any) -> int:
+    # Deep sys.getsizeof over containers and data records (dataclasses, __slots__ classes),
+    # counting shared objects once. Anything else is counted shallow, so a reference to a
+    # socket or an ORM object does not drag the whole app into the total.
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif dataclasses.is_dataclass(item) and not isinstance(item, type):
+            stack.extend(getattr(item, f.name, None) for f in dataclasses.fields(item))
+    return total
+
+
+def process_memory() -> dict:
+    # resident and peak resident set size in bytes
+    info = {"max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    info["rss" if key == "VmRSS" else "max_rss"] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return info
+
+
+def now_ms() -> float:
+    return time.perf_counter() * 1000
+
+
+profiler = Profiler()
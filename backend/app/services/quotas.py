@@ -0,0 +1,255 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import StreamSession, StreamStatus, User, UserQuota, UserRole, Video
+from .profiling import approx_size
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+@dataclass
+class QuotaLimits:
+    max_streams: int = 0
+    max_encode_seconds: int = 0
+    max_storage_bytes: int = 0
+
+
+@dataclass(slots=True)
+class _Usage:
+    streams: Set[int] = field(default_factory=set)
+    encode_seconds: float = 0.0
+    storage_bytes: int = 0
+    # sum of the accrual start times of the running streams, so their accrued time is
+    # len(streams) * now - running_since without walking them
+    running_since: float = 0.0
+    # slots held by starts between their check and acquire
+    reserved: int = 0
+
+
+class _Reservation:
+    """Stream slots taken at check time. acquire() inside the `with` block consumes them;
+    whatever is left (failed or skipped starts) is given back on exit."""
+
+    __slots__ = ("manager", "user_id", "remaining", "_token")
+
+    def __init__(self, manager: "QuotaManager", user_id: int, count: int) -> None:
+        self.manager = manager
+        self.user_id = user_id
+        self.remaining = count
+        self._token = None
+
+    def __enter__(self) -> "_Reservation":
+        self._token = _reservation.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _reservation.reset(self._token)
+        self.manager._unreserve(self)
+
+
+# the reservation of the start in progress; tasks started inside its block inherit it
+_reservation: ContextVar[Optional[_Reservation]] = ContextVar("quota_reservation", default=None)
+
+
+def role_limits(role: UserRole) -> QuotaLimits:
+    if role == UserRole.admin:
+        return QuotaLimits(settings.quota_admin_streams, settings.quota_admin_encode_seconds, settings.quota_admin_storage_bytes)
+    return QuotaLimits(settings.quota_user_streams, settings.quota_user_encode_seconds, settings.quota_user_storage_bytes)
+
+
+class QuotaManager:
+    """In-memory usage counters so start checks never hit the DB.
+
+    The counters are rebuilt from the DB at startup and reconciled periodically: running
+    sessions are re-counted (catching stops the runner did not see) and accrued encode
+    time is flushed to user_quotas.
+    """
+
+    def __init__(self) -> None:
+        self._usage: Dict[int, _Usage] = {}
+        # user id -> limit overrides (None values keep the role default)
+        self._overrides: Dict[int, dict] = {}
+        # session id -> (user id, monotonic time encode seconds were last accrued)
+        self._sessions: Dict[int, tuple] = {}
+        self._reserved = 0
+
+    def _get(self, user_id: int) -> _Usage:
+        usage = self._usage.get(user_id)
+        if usage is None:
+            usage = self._usage[user_id] = _Usage()
+        return usage
+
+    def limits_for(self, user: User) -> QuotaLimits:
+        limits = role_limits(user.role)
+        for name, value in self._overrides.get(user.id, {}).items():
+            if value is not None:
+                setattr(limits, name, value)
+        return limits
+
+    def active_streams(self) -> int:
+        return len(self._sessions)
+
+    def check_start(self, user: User, count: int = 1) -> None:
+        limits = self.limits_for(user)
+        usage = self._get(user.id)
+        if settings.host_max_streams and len(self._sessions) + self._reserved + count > settings.host_max_streams:
+            raise QuotaExceeded("Server is at its stream capacity")
+        if limits.max_streams and len(usage.streams) + usage.reserved + count > limits.max_streams:
+            raise QuotaExceeded(f"Concurrent stream limit reached ({limits.max_streams})")
+        if limits.max_encode_seconds and self._encode_seconds(user.id) >= limits.max_encode_seconds:
+            raise QuotaExceeded("Encode time quota used up")
+
+    def reserve(self, user: User, count: int = 1) -> _Reservation:
+        # check and hold the slots in one step, so concurrent starts awaiting their
+        # preflight cannot all pass the same limit
+        self.check_start(user, count)
+        self._get(user.id).reserved += count
+        self._reserved += count
+        return _Reservation(self, user.id, count)
+
+    def _unreserve(self, reservation: _Reservation) -> None:
+        self._get(reservation.user_id).reserved -= reservation.remaining
+        self._reserved -= reservation.remaining
+        reservation.remaining = 0
+
+    def check_storage(self, user: User, extra_bytes: int) -> None:
+        limits = self.limits_for(user)
+        if limits.max_storage_bytes and self._get(user.id).storage_bytes + extra_bytes > limits.max_storage_bytes:
+            raise QuotaExceeded("Storage quota exceeded")
+
+    def acquire(self, user_id: Optional[int], session_id: int) -> None:
+        if user_id is None or session_id in self._sessions:
+            return
+        now = time.monotonic()
+        usage = self._get(user_id)
+        usage.streams.add(session_id)
+        usage.running_since += now
+        self._sessions[session_id] = (user_id, now)
+        reservation = _reservation.get()
+        if reservation is not None and reservation.user_id == user_id and reservation.remaining > 0:
+            reservation.remaining -= 1
+            usage.reserved -= 1
+            self._reserved -= 1
+
+    def release(self, session_id: int) -> None:
+        entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return
+        user_id, since = entry
+        usage = self._get(user_id)
+        usage.streams.discard(session_id)
+        usage.running_since -= since
+        usage.encode_seconds += time.monotonic() - since
+
+    def add_storage(self, user_id: Optional[int], delta: int) -> None:
+        if user_id is not None:
+            usage = self._get(user_id)
+            usage.storage_bytes = max(0, usage.storage_bytes + delta)
+
+    def _encode_seconds(self, user_id: int) -> float:
+        usage = self._get(user_id)
+        return usage.encode_seconds + len(usage.streams) * time.monotonic() - usage.running_since
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._usage),
+            "sessions": len(self._sessions),
+            "reserved": self._reserved,
+            "overrides": len(self._overrides),
+            "bytes": approx_size(self._usage) + approx_size(self._sessions) + approx_size(self._overrides),
+        }
+
+    def usage(self, user: User) -> dict:
+        usage = self._get(user.id)
+        limits = self.limits_for(user)
+        return {
+            "user_id": user.id,
+            "streams": len(usage.streams),
+            "encode_seconds": int(self._encode_seconds(user.id)),
+            "storage_bytes": usage.storage_bytes,
+            "max_streams": limits.max_streams,
+            "max_encode_seconds": limits.max_encode_seconds,
+            "max_storage_bytes": limits.max_storage_bytes,
+        }
+
+    def set_override(self, quota: UserQuota) -> None:
+        self._overrides[quota.user_id] = {
+            "max_streams": quota.max_streams,
+            "max_encode_seconds": quota.max_encode_seconds,
+            "max_storage_bytes": quota.max_storage_bytes,
+        }
+
+    def load(self, db: Session) -> None:
+        self._usage.clear()
+        self._sessions.clear()
+        self._overrides.clear()
+        self._reserved = 0
+        for quota in db.query(UserQuota).all():
+            self.set_override(quota)
+            self._get(quota.user_id).encode_seconds = quota.encode_seconds_used or 0.0
+        # sizes of videos uploaded before sizes were recorded
+        for video in db.query(Video).filter(Video.size_bytes.is_(None)).all():
+            try:
+                video.size_bytes = Path(video.filepath).stat().st_size
+            except OSError:
+                video.size_bytes = 0
+        db.commit()
+        for user_id, total in (
+            db.query(Video.uploaded_by, func.sum(Video.size_bytes)).group_by(Video.uploaded_by).all()
+        ):
+            self.add_storage(user_id, int(total or 0))
+        for session_id, user_id in (
+            db.query(StreamSession.id, StreamSession.user_id).filter(StreamSession.status == StreamStatus.running).all()
+        ):
+            self.acquire(user_id, session_id)
+
+    def reconcile(self, db: Session) -> None:
+        running = dict(
+            db.query(StreamSession.id, StreamSession.user_id).filter(StreamSession.status == StreamStatus.running).all()
+        )
+        for session_id in list(self._sessions):
+            if session_id not in running:
+                self.release(session_id)
+        for session_id, user_id in running.items():
+            self.acquire(user_id, session_id)
+
+        # move accrued time of running sessions into the totals, then persist the totals
+        now = time.monotonic()
+        for session_id, (user_id, since) in list(self._sessions.items()):
+            usage = self._get(user_id)
+            usage.encode_seconds += now - since
+            usage.running_since += now - since
+            self._sessions[session_id] = (user_id, now)
+        rows = {q.user_id: q for q in db.query(UserQuota).all()}
+        known_users = {uid for (uid,) in db.query(User.id).all()}
+        for user_id, usage in self._usage.items():
+            if user_id not in known_users or not usage.encode_seconds:
+                continue
+            row = rows.get(user_id)
+            if row is None:
+                row = UserQuota(user_id=user_id)
+                db.add(row)
+            row.encode_seconds_used = usage.encode_seconds
+        db.commit()
+
+    async def reconcile_loop(self, session_factory) -> None:
+        while True:
+            await asyncio.sleep(settings.quota_reconcile_interval)
+            db = session_factory()
+            try:
+                self.reconcile(db)
+            finally:
+                db.close()
+
+
+quotas = QuotaManager()
@@ -0,0 +1,243 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Log, ScheduleKind, StreamSchedule, StreamSession, StreamStatus, User
+from .cron import CronExpression
+from .preflight import PreflightError, preflight
+from .quotas import QuotaExceeded, quotas
+
+
+logger = logging.getLogger(__name__)
+
+
+def _aware(when: Optional[datetime]) -> Optional[datetime]:
+    # some backends (SQLite) hand timestamps back naive; they are stored as UTC
+    if when is not None and when.tzinfo is None:
+        return when.replace(tzinfo=timezone.utc)
+    return when
+
+
+def compute_next_run(schedule: StreamSchedule, after: datetime) -> Optional[datetime]:
+    run_at, after = _aware(schedule.run_at), _aware(after)
+    if schedule.kind == ScheduleKind.once:
+        return run_at if run_at and run_at > after else None
+    if schedule.kind == ScheduleKind.recurring:
+        if not run_at or not schedule.interval_seconds or schedule.interval_seconds <= 0:
+            return None
+        if run_at > after:
+            return run_at
+        periods = int((after - run_at).total_seconds() // schedule.interval_seconds) + 1
+        return run_at + timedelta(seconds=periods * schedule.interval_seconds)
+    return CronExpression(schedule.cron).next_after(after)
+
+
+class StreamScheduler:
+    """Heap-based timer: sleeps until the earliest due action instead of polling the DB."""
+
+    def __init__(self, session_factory) -> None:
+        self.session_factory = session_factory
+        self._heap: List[Tuple[datetime, int, str, int, int]] = []
+        self._seq = itertools.count()
+        # bumped on every change so stale heap entries are skipped lazily
+        self._versions: Dict[int, int] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.warm: Dict[int, dict] = {}
+
+    def _push(self, when: datetime, action: str, schedule_id: int) -> None:
+        version = self._versions.get(schedule_id, 0)
+        heapq.heappush(self._heap, (_aware(when), next(self._seq), action, schedule_id, version))
+        self._wake.set()
+
+    def upsert(self, schedule: StreamSchedule) -> None:
+        self._versions[schedule.id] = self._versions.get(schedule.id, 0) + 1
+        self.warm.pop(schedule.id, None)
+        if not schedule.enabled or schedule.next_run_at is None:
+            return
+        self._push(schedule.next_run_at - timedelta(seconds=settings.schedule_prewarm_seconds), "prewarm", schedule.id)
+        self._push(schedule.next_run_at, "start", schedule.id)
+
+    def remove(self, schedule_id: int) -> None:
+        self._versions[schedule_id] = self._versions.get(schedule_id, 0) + 1
+        self.warm.pop(schedule_id, None)
+        self._wake.set()
+
+    def start(self) -> None:
+        db = self.session_factory()
+        try:
+            now = datetime.now(timezone.utc)
+            for schedule in db.query(StreamSchedule).filter(StreamSchedule.enabled.is_(True)).all():
+                due = _aware(schedule.next_run_at)
+                grace = timedelta(seconds=settings.schedule_missed_grace_seconds)
+                if due is not None and due < now - grace:
+                    # missed while the backend was down: skip to the next slot
+                    schedule.next_run_at = compute_next_run(schedule, now)
+                    schedule.enabled = schedule.next_run_at is not None
+                self.upsert(schedule)
+                # re-arm the end of a timed slot that is still on air
+                session = schedule.last_session_id and db.query(StreamSession).filter(
+                    StreamSession.id == schedule.last_session_id, StreamSession.status == StreamStatus.running
+                ).first()
+                if session and schedule.duration_seconds and session.start_time:
+                    self._push(_aware(session.start_time) + timedelta(seconds=schedule.duration_seconds), "stop", session.id)
+            db.commit()
+        finally:
+            db.close()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._step()
+            except Exception:
+                # one bad entry must not take the whole scheduler down
+                logger.exception("scheduler step failed")
+                await asyncio.sleep(1)
+
+    async def _step(self) -> None:
+        self._wake.clear()
+        if not self._heap:
+            await self._wake.wait()
+            return
+        delay = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            return
+        _, _, action, schedule_id, version = heapq.heappop(self._heap)
+        if action != "stop" and self._versions.get(schedule_id, 0) != version:
+            return
+        handler = {"prewarm": self._prewarm, "start": self._start, "stop": self._stop}[action]
+        asyncio.create_task(self._guarded(handler, action, schedule_id))
+
+    async def _guarded(self, handler, action: str, target: int) -> None:
+        try:
+            await handler(target)
+        except Exception:
+            logger.exception("scheduled %s of %s failed", action, target)
+
+    async def _prewarm(self, schedule_id: int) -> None:
+        # probe the source (and build cached segments) and check the RTMP endpoint ahead of time
+        from .ffmpeg_runner import prewarm_source
+
+        db = self.session_factory()
+        try:
+            schedule = db.query(StreamSchedule).filter(StreamSchedule.id == schedule_id).first()
+            if not schedule:
+                return
+            result: dict = {"at": datetime.now(timezone.utc).isoformat()}
+            try:
+                await prewarm_source(db, schedule.source_type, schedule.source_id)
+                await preflight.ensure_reachable([schedule.destination])
+                result["ok"] = True
+            except (ValueError, RuntimeError, OSError, asyncio.TimeoutError) as exc:
+                result.update(ok=False, error=str(exc))
+            self.warm[schedule_id] = result
+        finally:
+            db.close()
+
+    async def _start(self, schedule_id: int) -> None:
+        from .ffmpeg_runner import is_draining, start_ffmpeg
+
+        db = self.session_factory()
+        schedule: Optional[StreamSchedule] = None
+        now = datetime.now(timezone.utc)
+        try:
+            schedule = db.query(StreamSchedule).filter(StreamSchedule.id == schedule_id).first()
+            if not schedule or not schedule.enabled:
+                schedule = None
+                return
+            owner = db.query(User).filter(User.id == schedule.user_id).first()
+            reservation = nullcontext()
+            try:
+                if owner is not None:
+                    reservation = quotas.reserve(owner)
+                allowed = True
+            except QuotaExceeded as exc:
+                allowed = False
+                db.add(Log(user_id=schedule.user_id, action="scheduled_start_failed", details=f"{schedule.name}: {exc}"))
+            with reservation:
+                if allowed:
+                    # a dead destination would only cost an encode slot until ffmpeg gives up
+                    try:
+                        await preflight.ensure_reachable([schedule.destination])
+                    except PreflightError as exc:
+                        allowed = False
+                        db.add(Log(user_id=schedule.user_id, action="scheduled_start_failed", details=f"{schedule.name}: {exc}"))
+                if allowed and not is_draining():
+                    session = StreamSession(
+                        user_id=schedule.user_id,
+                        source_type=schedule.source_type,
+                        source_id=schedule.source_id,
+                        destination=schedule.destination,
+                        mode=schedule.mode,
+                        status=StreamStatus.running,
+                    )
+                    db.add(session)
+                    db.commit()
+                    quotas.acquire(session.user_id, session.id)
+                    try:
+                        await start_ffmpeg(db, session)
+                        schedule.last_session_id = session.id
+                        db.add(Log(user_id=schedule.user_id, action="scheduled_start", details=f"{schedule.name} -> session {session.id}"))
+                        if schedule.duration_seconds:
+                            self._push(now + timedelta(seconds=schedule.duration_seconds), "stop", session.id)
+                    except Exception as exc:
+                        if not isinstance(exc, (ValueError, RuntimeError, OSError)):
+                            logger.exception("scheduled start of %s failed", schedule_id)
+                        quotas.release(session.id)
+                        session.status = StreamStatus.stopped
+                        session.end_time = now
+                        db.add(Log(user_id=schedule.user_id, action="scheduled_start_failed", details=f"{schedule.name}: {exc}"))
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            # whatever happened above, the slot is used up; without this the schedule
+            # would silently never fire again (its heap entry is already gone)
+            try:
+                if schedule is not None:
+                    schedule.last_run_at = now
+                    schedule.next_run_at = compute_next_run(schedule, now)
+                    if schedule.next_run_at is None:
+                        schedule.enabled = False
+                    db.commit()
+                    self.upsert(schedule)
+            except Exception:
+                db.rollback()
+                logger.exception("could not advance schedule %s", schedule_id)
+            finally:
+                db.close()
+
+    async def _stop(self, session_id: int) -> None:
+        from .ffmpeg_runner import stop_session
+
+        db = self.session_factory()
+        try:
+            session = db.query(StreamSession).filter(StreamSession.id == session_id).first()
+            if session and session.status == StreamStatus.running:
+                await stop_session(db, session)
+                session.status = StreamStatus.stopped
+                session.pid = None
+                db.commit()
+        finally:
+            db.close()
+
+    def pending(self) -> List[dict]:
+        return [
+            {"at": when.isoformat(), "action": action, "id": target}
+            for when, _, action, target, version in sorted(self._heap)
+            if action == "stop" or self._versions.get(target, 0) == version
+        ]
+
+
+scheduler = StreamScheduler(SessionLocal)
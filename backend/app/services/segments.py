@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from ..config import settings
+from .pacing import _ffmpeg
+from .profiles import DEFAULT_PROFILE, get_profile
+
+
+MANIFEST = "manifest.json"
+# part of the set key: bump when the segment layout changes so old sets are rebuilt
+LAYOUT_VERSION = 2
+# segments probed after a cut (first, last and evenly spaced ones in between)
+VERIFY_SAMPLES = 5
+
+_building: Dict[str, asyncio.Task] = {}
+# sets whose cut failed; not retried on every start, only at the next ingest
+_failed: Set[str] = set()
+_encode_slots: Optional[asyncio.Semaphore] = None
+
+
+@dataclass(slots=True)
+class Segment:
+    path: Path
+    duration: float
+
+
+@dataclass(slots=True)
+class SegmentSet:
+    segments: List[Segment]
+    duration: float
+    width: int
+    height: int
+    fps: float
+
+    @property
+    def format(self) -> tuple:
+        # sets join with -c copy only when this matches
+        return self.width, self.height, self.fps
+
+
+def _source_fps(info: dict) -> float:
+    return round(float((info.get("video") or {}).get("fps") or 30), 2)
+
+
+def audio_gain(info: dict) -> Optional[float]:
+    # the single-item case of the runner's loudness gain, baked into the segments
+    loudness = info.get("loudness")
+    if not settings.loudnorm_enabled or not loudness:
+        return None
+    gain = min(settings.loudnorm_target - loudness["i"], settings.loudnorm_true_peak - loudness["tp"])
+    return round(gain, 1) if abs(gain) >= 0.5 else None
+
+
+def segmentable(info: dict) -> bool:
+    # stills and audio-only sources already have their own copy paths (services.pacing)
+    return bool(
+        settings.segment_cache_enabled
+        and info.get("duration")
+        and info.get("video")
+        and info.get("content", "normal") in ("normal", "low_motion")
+    )
+
+
+def _set_dir(video, info: dict) -> Path:
+    stat = os.stat(video.filepath)
+    raw = (
+        f"{LAYOUT_VERSION}:{stat.st_size}:{settings.segment_seconds}:"
+        f"{get_profile(DEFAULT_PROFILE).video_bitrate}:{audio_gain(info)}"
+    )
+    return Path(settings.cache_dir) / "segments" / f"{video.id}_{hashlib.sha1(raw.encode()).hexdigest()[:16]}"
+
+
+def load_segments(video, info: dict) -> Optional[SegmentSet]:
+    # accepts a Video row or a cached source entry; None until the set is complete
+    if not segmentable(info):
+        return None
+    try:
+        manifest_path = _set_dir(video, info) / MANIFEST
+        manifest = json.loads(manifest_path.read_text())
+        # mtime doubles as last-use time for the cache LRU, which evicts a set as a whole
+        os.utime(manifest_path)
+    except (OSError, ValueError):
+        return None
+    root = manifest_path.parent
+    return SegmentSet(
+        [Segment(root / s["file"], s["duration"]) for s in manifest["segments"]],
+        manifest["duration"],
+        manifest["width"],
+        manifest["height"],
+        manifest["fps"],
+    )
+
+
+async def _probe(path: Path) -> dict:
+    # stream formats plus the first video frame of one segment
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-print_format", "json", "-show_streams",
+        "-show_entries", "frame=key_frame,media_type", "-read_intervals", "%+#2", str(path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {path.name}: {err.decode(errors='ignore').strip()[:200]}")
+    return json.loads(out or b"{}")
+
+
+async def verify_segments(root: Path, manifest: dict, source_duration: Optional[float]) -> None:
+    # The manifest must cover the source and sampled segments must be what a copy join
+    # expects: H.264 of the recorded size starting on a keyframe, and AAC audio
+    names = [s["file"] for s in manifest["segments"]]
+    missing = [name for name in names if not (root / name).is_file()]
+    if missing:
+        raise RuntimeError(f"segment set is missing {len(missing)} file(s), e.g. {missing[0]}")
+    if source_duration and abs(manifest["duration"] - source_duration) > manifest["segment_seconds"]:
+        raise RuntimeError(f"segments cover {manifest['duration']:.1f}s of a {source_duration:.1f}s source")
+    step = max(1, (len(names) - 1) // max(1, VERIFY_SAMPLES - 1))
+    for name in dict.fromkeys(names[::step] + names[-1:]):
+        data = await _probe(root / name)
+        streams = {st.get("codec_type"): st for st in data.get("streams", [])}
+        video, audio = streams.get("video"), streams.get("audio")
+        if not video or video.get("codec_name") != "h264":
+            raise RuntimeError(f"{name}: no H.264 video stream")
+        if (video.get("width"), video.get("height")) != (manifest["width"], manifest["height"]):
+            raise RuntimeError(f"{name}: {video.get('width')}x{video.get('height')} instead of {manifest['width']}x{manifest['height']}")
+        if not audio or audio.get("codec_name") != "aac":
+            raise RuntimeError(f"{name}: no AAC audio stream")
+        frames = [f for f in data.get("frames", []) if f.get("media_type") == "video"]
+        if not frames or not frames[0].get("key_frame"):
+            raise RuntimeError(f"{name}: does not start on a keyframe")
+
+
+async def _cut(video, info: dict, root: Path) -> None:
+    # One encode in the default profile's format at the source's own size and frame rate,
+    # keyframes forced onto every segment boundary, so segments concatenate (and seek)
+    # with -c copy in any order - across videos too, when they share size and rate
+    fps, seconds = _source_fps(info), settings.segment_seconds
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    inputs = ["-i", video.filepath]
+    audio_map = "0:a:0"
+    if not info.get("audio"):
+        # a join between files with and without audio breaks the copy, so add silence
+        inputs += ["-f", "lavfi", "-i", "anullsrc=r=48000:cl=stereo"]
+        audio_map = "1:a:0"
+    gain = audio_gain(info)
+    gop = str(max(1, round(fps * seconds)))
+    listing = root / "segments.csv"
+    await _ffmpeg(
+        *inputs,
+        "-map", "0:v:0", "-map", audio_map, "-shortest",
+        "-vf", f"scale=trunc(iw/2)*2:trunc(ih/2)*2,setsar=1,fps={fps}",
+        *get_profile(DEFAULT_PROFILE).video_args(),
+        "-pix_fmt", "yuv420p",
+        "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+        "-force_key_frames", f"expr:gte(t,n_forced*{seconds})",
+        *(["-af", f"volume={gain}dB"] if gain is not None else []),
+        "-c:a", "aac", "-b:a", "128k", "-ar", "48000", "-ac", "2",
+        "-f", "segment", "-segment_time", str(seconds), "-segment_format", "mpegts",
+        "-reset_timestamps", "1", "-segment_list", str(listing), "-segment_list_type", "csv",
+        str(root / "seg_%05d.ts"),
+    )
+    segments = []
+    for line in listing.read_text().splitlines():
+        name, start, end = line.rsplit(",", 2)
+        segments.append({"file": name, "duration": round(float(end) - float(start), 6)})
+    listing.unlink()
+    if not segments:
+        raise RuntimeError("segmenter produced no output")
+    first = await _probe(root / segments[0]["file"])
+    picture = next((st for st in first.get("streams", []) if st.get("codec_type") == "video"), {})
+    manifest = {
+        "version": LAYOUT_VERSION,
+        "segment_seconds": seconds,
+        "fps": fps,
+        "width": picture.get("width"),
+        "height": picture.get("height"),
+        "duration": round(sum(s["duration"] for s in segments), 6),
+        "segments": segments,
+    }
+    await verify_segments(root, manifest, info.get("duration"))
+    # written last: a set without a manifest is incomplete and never read
+    tmp = root / "manifest.tmp.json"
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, root / MANIFEST)
+
+
+async def _build(video, info: dict, root: Path) -> None:
+    global _encode_slots
+    if _encode_slots is None:
+        _encode_slots = asyncio.Semaphore(max(1, settings.segment_concurrency))
+    async with _encode_slots:
+        try:
+            await _cut(video, info, root)
+        except BaseException:
+            shutil.rmtree(root, ignore_errors=True)
+            _failed.add(str(root))
+            raise
+        _failed.discard(str(root))
+
+
+async def ensure_segments(video, info: dict) -> Optional[SegmentSet]:
+    if not segmentable(info):
+        return None
+    ready = load_segments(video, info)
+    if ready is not None:
+        return ready
+    root = _set_dir(video, info)
+    key = str(root)
+    task = _building.get(key)
+    if task is None:
+        task = _building[key] = asyncio.ensure_future(_build(video, info, root))
+        task.add_done_callback(lambda _: _building.pop(key, None))
+    await asyncio.shield(task)
+    return load_segments(video, info)
+
+
+async def _ensure_quietly(video, info: dict) -> None:
+    try:
+        await ensure_segments(video, info)
+    except (RuntimeError, OSError):
+        pass
+
+
+def prepare_segments(video, info: dict) -> None:
+    # sources ingested before the cache existed (or evicted from it) are cut in the
+    # background; the stream asking for them decodes the original meanwhile
+    if not segmentable(info):
+        return
+    if settings.loudnorm_enabled and info.get("audio") and "loudness" not in info:
+        # the gain is baked into the segments; the pending full analysis cuts them
+        return
+    try:
+        if str(_set_dir(video, info)) in _failed:
+            return
+    except OSError:
+        return
+    asyncio.ensure_future(_ensure_quietly(video, info))
+
+
+def drop_segments(video_id: int) -> None:
+    root = Path(settings.cache_dir) / "segments"
+    if root.exists():
+        for path in root.glob(f"{video_id}_*"):
+            shutil.rmtree(path, ignore_errors=True)
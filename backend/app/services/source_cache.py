@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..models import PlaylistItem, StreamSourceType, Video
+from .profiling import approx_size
+
+
+@dataclass(frozen=True, slots=True)
+class CachedVideo:
+    id: int
+    filename: str
+    filepath: str
+    tier: str
+    media_info: Optional[str]
+
+    @classmethod
+    def from_row(cls, video: Video) -> "CachedVideo":
+        return cls(video.id, video.filename, video.filepath, video.tier, video.media_info)
+
+
+SourceKey = Tuple[StreamSourceType, int]
+
+
+class SourceCache:
+    """Resolved stream sources: a video or a playlist -> its ordered videos.
+
+    Every key has a version that invalidation bumps; a resolution only stores its
+    result if the version did not move while it was loading, so an edit racing a
+    lookup never leaves a stale entry behind.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[SourceKey, List[CachedVideo]] = {}
+        self._versions: Dict[SourceKey, int] = {}
+        # video id -> keys whose entry contains it
+        self._by_video: Dict[int, Set[SourceKey]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, key: SourceKey, version: int, videos: List[CachedVideo]) -> None:
+        if not videos or self._versions.get(key, 0) != version:
+            return
+        self._entries[key] = videos
+        for video in videos:
+            self._by_video.setdefault(video.id, set()).add(key)
+
+    def resolve(self, db: Session, source_type: StreamSourceType, source_id: int) -> List[CachedVideo]:
+        key = (source_type, source_id)
+        cached = self._entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        version = self._versions.get(key, 0)
+        if source_type == StreamSourceType.video:
+            video = db.query(Video).filter(Video.id == source_id).first()
+            if not video:
+                raise ValueError("Video not found")
+            videos = [CachedVideo.from_row(video)]
+        else:
+            rows = (
+                db.query(Video)
+                .join(PlaylistItem, PlaylistItem.video_id == Video.id)
+                .filter(PlaylistItem.playlist_id == source_id)
+                .order_by(PlaylistItem.order_index.asc())
+                .all()
+            )
+            if not rows:
+                raise ValueError("Playlist is empty")
+            videos = [CachedVideo.from_row(v) for v in rows]
+        self._store(key, version, videos)
+        return videos
+
+    def preload(self, db: Session, sources: Iterable[SourceKey]) -> None:
+        # two queries for any number of sources (used by mass restarts at boot)
+        missing = {key for key in sources if key not in self._entries}
+        versions = {key: self._versions.get(key, 0) for key in missing}
+        video_ids = [sid for kind, sid in missing if kind == StreamSourceType.video]
+        playlist_ids = [sid for kind, sid in missing if kind == StreamSourceType.playlist]
+        if video_ids:
+            for video in db.query(Video).filter(Video.id.in_(video_ids)).all():
+                key = (StreamSourceType.video, video.id)
+                self._store(key, versions[key], [CachedVideo.from_row(video)])
+        if playlist_ids:
+            grouped: Dict[int, List[CachedVideo]] = {}
+            rows = (
+                db.query(PlaylistItem.playlist_id, Video)
+                .join(Video, PlaylistItem.video_id == Video.id)
+                .filter(PlaylistItem.playlist_id.in_(playlist_ids))
+                .order_by(PlaylistItem.playlist_id.asc(), PlaylistItem.order_index.asc())
+                .all()
+            )
+            for playlist_id, video in rows:
+                grouped.setdefault(playlist_id, []).append(CachedVideo.from_row(video))
+            for playlist_id, videos in grouped.items():
+                key = (StreamSourceType.playlist, playlist_id)
+                self._store(key, versions[key], videos)
+
+    def _invalidate(self, key: SourceKey) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        for video in self._entries.pop(key, []):
+            keys = self._by_video.get(video.id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    self._by_video.pop(video.id, None)
+
+    def invalidate_playlist(self, playlist_id: int) -> None:
+        self._invalidate((StreamSourceType.playlist, playlist_id))
+
+    def invalidate_video(self, video_id: int) -> None:
+        # the video itself and every playlist that contains it
+        self._invalidate((StreamSourceType.video, video_id))
+        for key in list(self._by_video.get(video_id, ())):
+            self._invalidate(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes": approx_size(self._entries) + approx_size(self._by_video) + approx_size(self._versions),
+        }
+
+
+source_cache = SourceCache()
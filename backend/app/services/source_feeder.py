@@ -0,0 +1,152 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+
+# MPEG-TS packets are 188 bytes; copy whole packets where possible
+CHUNK_SIZE = 188 * 348
+# added between items so output timestamps of consecutive readers never overlap
+GAP_SECONDS = 0.05
+# pause after a failed item, doubled per consecutive failure
+FAILURE_BACKOFF = 0.5
+FAILURE_BACKOFF_MAX = 5.0
+
+
+class SourceFeeder:
+    """Feeds a long-lived encoder's stdin with MPEG-TS remuxed from the current source.
+
+    Each item is read by a small `-c copy` ffmpeg at real time (-re) with its timestamps
+    shifted by the feeder clock (-output_ts_offset), so the encoder sees one continuous
+    stream. Switching only replaces the reader: encoder, RTMP connection and HLS output
+    stay up.
+    """
+
+    def __init__(self, stdin: asyncio.StreamWriter, session_id: int) -> None:
+        self.stdin = stdin
+        self.session_id = session_id
+        self.items: List[str] = []
+        self.loop = False
+        self.index = 0
+        self.offset = 0.0
+        # source to go back to after a one-off clip: (items, index, offset, loop)
+        self.resume: Optional[Tuple[List[str], int, float, bool]] = None
+        self.clock = 0.0
+        self.closed = False
+        self._reader: Optional[asyncio.subprocess.Process] = None
+        self._item_started: Optional[float] = None
+        self._switched = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, items: List[str], loop: bool, offset: float = 0.0) -> None:
+        self.items, self.loop, self.index, self.offset = items, loop, 0, offset
+        self._task = asyncio.create_task(self._run())
+
+    def switch(self, items: List[str], loop: bool, insert: bool = False) -> None:
+        if insert:
+            # play the clip now, then continue the current source where it was cut
+            if self.resume is None:
+                self.resume = (self.items, self.index, self.offset + self._elapsed(), self.loop)
+            self.items, self.loop = items, False
+        else:
+            self.resume = None
+            self.items, self.loop = items, loop
+        self.index, self.offset = 0, 0.0
+        self._switched = True
+        self._kill_reader()
+
+    def stop(self) -> None:
+        self.closed = True
+        self._kill_reader()
+        if self._task is not None:
+            self._task.cancel()
+
+    def current(self) -> Optional[str]:
+        return self.items[self.index] if self.index < len(self.items) else None
+
+    def _elapsed(self) -> float:
+        return time.monotonic() - self._item_started if self._item_started is not None else 0.0
+
+    def _kill_reader(self) -> None:
+        if self._reader is not None and self._reader.returncode is None:
+            try:
+                self._reader.kill()
+            except ProcessLookupError:
+                pass
+
+    def _advance(self) -> bool:
+        self.index, self.offset = self.index + 1, 0.0
+        if self.index < len(self.items):
+            return True
+        if self.loop and self.items:
+            self.index = 0
+            return True
+        if self.resume is not None:
+            self.items, self.index, self.offset, self.loop = self.resume
+            self.resume = None
+            return self.index < len(self.items)
+        return False
+
+    async def _run(self) -> None:
+        failures = 0
+        try:
+            while not self.closed:
+                path = self.current()
+                if path is None:
+                    break
+                failed = not await self._play(path, self.offset)
+                if self._switched:
+                    self._switched, failures = False, 0
+                    continue
+                if failed:
+                    if not self.loop and self.resume is None:
+                        break
+                    failures += 1
+                    # a whole pass over the list without one playable item: the files are
+                    # gone or unreadable, and looping would only respawn readers forever
+                    if failures >= len(self.items):
+                        break
+                    await asyncio.sleep(min(FAILURE_BACKOFF * 2 ** (failures - 1), FAILURE_BACKOFF_MAX))
+                    if self._switched:
+                        self._switched, failures = False, 0
+                        continue
+                else:
+                    failures = 0
+                if not self._advance():
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            # encoder exited; the run's pump handles the session state
+            pass
+        finally:
+            self._kill_reader()
+            try:
+                self.stdin.close()
+            except (BrokenPipeError, ConnectionResetError, RuntimeError):
+                pass
+
+    async def _play(self, path: str, offset: float) -> bool:
+        seek = ["-ss", f"{offset:.3f}"] if offset > 0 else []
+        self._reader = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+            "-re", *seek, "-i", path,
+            "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+            "-output_ts_offset", f"{self.clock:.3f}",
+            "-f", "mpegts", "pipe:1",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._item_started = time.monotonic()
+        wrote = False
+        try:
+            while True:
+                chunk = await self._reader.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.stdin.write(chunk)
+                await self.stdin.drain()
+                wrote = True
+        finally:
+            self._kill_reader()
+            await self._reader.wait()
+            self.clock += self._elapsed() + GAP_SECONDS
+            self._item_started = None
+        return wrote and self._reader.returncode in (0, -9)
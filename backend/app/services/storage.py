@@ -0,0 +1,218 @@
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Set
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import PlaylistItem, StreamSession, StreamSourceType, StreamStatus, Video
+from .source_cache import source_cache
+
+
+HOT = "hot"
+COLD = "cold"
+
+_fetch_locks: Dict[int, asyncio.Lock] = {}
+
+
+def _tier_path(video: Video, tier: str) -> Path:
+    base = settings.videos_dir if tier == HOT else settings.cold_videos_dir
+    return Path(base) / video.filename
+
+
+def _copy_then_replace(src: Path, dest: Path) -> None:
+    # copy under a temp name so a half-copied file is never picked up as the media
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.part")
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dest)
+    src.unlink()
+
+
+async def _move(db: Session, video: Video, tier: str) -> None:
+    src = Path(video.filepath)
+    dest = _tier_path(video, tier)
+    if src != dest:
+        await asyncio.to_thread(_copy_then_replace, src, dest)
+    video.filepath = str(dest)
+    video.tier = tier
+    db.commit()
+    source_cache.invalidate_video(video.id)
+
+
+async def ensure_hot(db: Session, video: Video) -> None:
+    # fetch a cold video back to the local disk before it is probed or streamed
+    if video.tier != COLD:
+        return
+    lock = _fetch_locks.setdefault(video.id, asyncio.Lock())
+    async with lock:
+        db.refresh(video)
+        if video.tier == COLD:
+            await _move(db, video, HOT)
+    _fetch_locks.pop(video.id, None)
+
+
+def mark_streamed(db: Session, video_ids: List[int]) -> None:
+    db.query(Video).filter(Video.id.in_(video_ids)).update(
+        {Video.last_streamed_at: datetime.now(timezone.utc)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _videos_in_use(db: Session) -> Set[int]:
+    in_use: Set[int] = set()
+    running = db.query(StreamSession.source_type, StreamSession.source_id).filter(
+        StreamSession.status == StreamStatus.running
+    ).all()
+    playlist_ids = [sid for kind, sid in running if kind == StreamSourceType.playlist]
+    in_use.update(sid for kind, sid in running if kind == StreamSourceType.video)
+    if playlist_ids:
+        in_use.update(
+            vid for (vid,) in db.query(PlaylistItem.video_id).filter(PlaylistItem.playlist_id.in_(playlist_ids)).all()
+        )
+    return in_use
+
+
+async def demote_idle(db: Session) -> int:
+    if settings.cold_videos_dir is None:
+        return 0
+    in_use = _videos_in_use(db)
+    hot = [v for v in db.query(Video).filter(Video.tier == HOT).all() if v.id not in in_use]
+    # least recently streamed first; never-streamed videos count from their upload
+    hot.sort(key=lambda v: v.last_streamed_at or v.created_at)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.cold_after_days)
+    hot_bytes = sum(v.size_bytes or 0 for v in db.query(Video).filter(Video.tier == HOT).all())
+    moved = 0
+    for video in hot:
+        last_used = video.last_streamed_at or video.created_at
+        if last_used.tzinfo is None:
+            last_used = last_used.replace(tzinfo=timezone.utc)
+        over_budget = settings.hot_tier_max_bytes and hot_bytes > settings.hot_tier_max_bytes
+        if last_used >= cutoff and not over_budget:
+            continue
+        try:
+            await _move(db, video, COLD)
+        except OSError:
+            db.rollback()
+            continue
+        hot_bytes -= video.size_bytes or 0
+        moved += 1
+    return moved
+
+
+def _concat_entries(list_path: str) -> List[str]:
+    # files named by a concat list in cache_dir (playlists, segment sets)
+    if not list_path.endswith(".txt") or not list_path.startswith(str(settings.cache_dir)):
+        return []
+    try:
+        lines = Path(list_path).read_text().splitlines()
+    except OSError:
+        return []
+    return [line[6:-1] for line in lines if line.startswith("file '") and line.endswith("'")]
+
+
+def _files_in_use() -> Set[str]:
+    # inputs of local ffmpeg processes, so a segment being looped is never evicted
+    from .ffmpeg_runner import _proc_argv, _watched
+
+    paths: Set[str] = set()
+    for run in {id(r): r for r in _watched.values()}.values():
+        for arg in _proc_argv(run.handle.pid):
+            paths.add(arg)
+            paths.update(_concat_entries(arg))
+    return paths
+
+
+def _cache_unit(root: Path, path: Path) -> Path:
+    # a segment set is only usable whole, so it is evicted whole
+    parts = path.relative_to(root).parts
+    if parts[0] == "segments" and len(parts) > 2:
+        return root / parts[0] / parts[1]
+    return path
+
+
+def evict_cache(in_use: Set[str] = frozenset()) -> int:
+    # LRU over derived files (still segments, concat lists, segment sets, ...) by mtime,
+    # which readers touch on every cache hit
+    if not settings.cache_max_bytes:
+        return 0
+    root = Path(settings.cache_dir)
+    if not root.exists():
+        return 0
+    # unit -> [last use, size, in use]
+    units: Dict[Path, list] = {}
+    total = 0
+    for path in root.rglob("*"):
+        try:
+            if path.is_file():
+                st = path.stat()
+                unit = units.setdefault(_cache_unit(root, path), [0.0, 0, False])
+                unit[0] = max(unit[0], st.st_mtime)
+                unit[1] += st.st_size
+                unit[2] = unit[2] or str(path) in in_use
+                total += st.st_size
+        except OSError:
+            continue
+    if total <= settings.cache_max_bytes:
+        return 0
+    removed = 0
+    for path, (_, size, busy) in sorted(units.items(), key=lambda item: item[1][0]):
+        if total <= settings.cache_max_bytes:
+            break
+        if busy:
+            continue
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _live_logs() -> Set[str]:
+    from .ffmpeg_runner import _session_log_path, _watched
+
+    return {str(_session_log_path(run.log_id)) for run in _watched.values()}
+
+
+def _is_partial(path: Path) -> bool:
+    # half-written outputs: "x.tmp.mp4" / "x.tmp.png" renders, "x.<pid>.tmp" lists, ".x.part" copies
+    return ".tmp" in path.suffixes or (path.name.startswith(".") and path.suffix == ".part")
+
+
+def sweep_temp_files(live_logs: Set[str] = frozenset()) -> int:
+    # leftovers of writes interrupted by a crash and logs of processes nobody tails any more
+    cutoff = time.time() - settings.temp_file_max_age
+    candidates: List[Path] = []
+    for root in (settings.cache_dir, settings.videos_dir, settings.cold_videos_dir):
+        if root is not None and Path(root).exists():
+            candidates += [p for p in Path(root).rglob("*") if _is_partial(p)]
+    runtime = Path(settings.runtime_dir)
+    if runtime.exists():
+        candidates += [p for p in runtime.glob("session_*.log") if str(p) not in live_logs]
+    removed = 0
+    for path in candidates:
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+async def storage_sweeper(session_factory) -> None:
+    while True:
+        await asyncio.sleep(settings.storage_sweep_interval)
+        db = session_factory()
+        try:
+            await demote_idle(db)
+        finally:
+            db.close()
+        await asyncio.to_thread(evict_cache, _files_in_use())
+        await asyncio.to_thread(sweep_temp_files, _live_logs())
@@ -1,12 +1,31 @@
+from dataclasses import asdict, dataclass, fields
 from typing import Dict, Optional, Set
 
 from fastapi import WebSocket
 
+from .profiling import approx_size
+
+
+@dataclass(slots=True)
+class LastStats:
+    # one per running session, updated in place on every progress line
+    type: Optional[str] = None
+    status: Optional[str] = None
+    rtmp_url: Optional[str] = None
+    bitrate: Optional[str] = None
+    fps: Optional[str] = None
+    dropped_frames: Optional[str] = None
+    speed: Optional[str] = None
+    server_time: Optional[int] = None
+
+
+_STATS_FIELDS = tuple(f.name for f in fields(LastStats))
+
 
 class SessionWebSocketManager:
     def __init__(self) -> None:
         self.session_to_clients: Dict[int, Set[WebSocket]] = {}
-        self.session_last_stats: Dict[int, dict] = {}
+        self.session_last_stats: Dict[int, LastStats] = {}
 
     async def connect(self, session_id: int, websocket: WebSocket) -> None:
         await websocket.accept()
@@ -28,12 +47,27 @@ class SessionWebSocketManager:
                 self.disconnect(session_id, ws)
 
     def update_last_stats(self, session_id: int, stats: dict) -> None:
-        self.session_last_stats[session_id] = stats
+        record = self.session_last_stats.get(session_id)
+        if record is None:
+            record = self.session_last_stats[session_id] = LastStats()
+        for name in _STATS_FIELDS:
+            setattr(record, name, stats.get(name))
 
     def get_last_stats(self, session_id: int) -> Optional[dict]:
-        return self.session_last_stats.get(session_id)
+        record = self.session_last_stats.get(session_id)
+        return asdict(record) if record is not None else None
 
+    def forget(self, session_id: int) -> None:
+        # finished sessions have no stats worth keeping
+        self.session_last_stats.pop(session_id, None)
 
-ws_manager = SessionWebSocketManager()
+    def stats(self) -> dict:
+        return {
+            "sessions_with_stats": len(self.session_last_stats),
+            "sessions_with_clients": len(self.session_to_clients),
+            "clients": sum(len(c) for c in self.session_to_clients.values()),
+            "bytes": approx_size(self.session_last_stats),
+        }
 
 
+ws_manager = SessionWebSocketManager()
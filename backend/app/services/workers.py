@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import StreamSession, StreamStatus, WorkerNode
+from .quotas import quotas
+from .websocket_manager import ws_manager
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def _request(method: str, url: str, payload: Optional[dict], timeout: float) -> dict:
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    req.add_header("X-Worker-Token", settings.worker_token)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+    except (urllib.error.URLError, OSError) as exc:
+        raise WorkerError(f"{method} {url} failed: {exc}") from exc
+    return json.loads(body) if body else {}
+
+
+async def call(method: str, url: str, payload: Optional[dict] = None, timeout: float = 5.0) -> dict:
+    # stdlib HTTP in a thread keeps the RPC dependency-free on both sides
+    return await asyncio.to_thread(_request, method, url, payload, timeout)
+
+
+def _alive_cutoff() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=settings.worker_heartbeat_timeout)
+
+
+def alive_workers(db: Session) -> List[WorkerNode]:
+    return db.query(WorkerNode).filter(WorkerNode.last_heartbeat >= _alive_cutoff()).all()
+
+
+def pick_worker(db: Session) -> Optional[WorkerNode]:
+    workers = alive_workers(db)
+    if not workers:
+        return None
+    # count assignments from the DB rather than the last heartbeat so that a burst of
+    # starts between two heartbeats is still spread out
+    assigned = dict(
+        db.query(StreamSession.worker_id, func.count(StreamSession.id))
+        .filter(StreamSession.status == StreamStatus.running, StreamSession.worker_id.isnot(None))
+        .group_by(StreamSession.worker_id)
+        .all()
+    )
+    best: Optional[WorkerNode] = None
+    best_load = 1.0
+    for worker in workers:
+        load = assigned.get(worker.id, 0) / max(worker.capacity, 1)
+        if load < best_load:
+            best, best_load = worker, load
+    return best
+
+
+async def assign_session(worker: WorkerNode, session_id: int, cmd: List[str]) -> int:
+    result = await call("POST", f"{worker.url}/sessions", {"session_id": session_id, "cmd": cmd})
+    return int(result["pid"])
+
+
+async def release_session(db: Session, session: StreamSession) -> None:
+    worker = db.query(WorkerNode).filter(WorkerNode.id == session.worker_id).first()
+    if worker is None:
+        return
+    try:
+        await call("DELETE", f"{worker.url}/sessions/{session.id}")
+    except WorkerError:
+        # an unreachable worker is failed over by the monitor; nothing to stop here
+        pass
+
+
+async def remote_session_alive(db: Session, session: StreamSession) -> bool:
+    worker = db.query(WorkerNode).filter(
+        WorkerNode.id == session.worker_id, WorkerNode.last_heartbeat >= _alive_cutoff()
+    ).first()
+    if worker is None:
+        return False
+    try:
+        result = await call("GET", f"{worker.url}/sessions/{session.id}")
+    except WorkerError:
+        return False
+    return bool(result.get("alive"))
+
+
+async def ingest_events(db: Session, worker: WorkerNode, events: List[dict]) -> None:
+    # worker stats go out through ws_manager exactly like locally pumped ones
+    ids = {int(event["session_id"]) for event in events}
+    sessions = {
+        s.id: s
+        for s in db.query(StreamSession).filter(StreamSession.id.in_(ids), StreamSession.worker_id == worker.id).all()
+    } if ids else {}
+    for event in events:
+        session_id = int(event["session_id"])
+        message = event["message"]
+        session = sessions.get(session_id)
+        # a late event of a process that was since replaced (restart, re-assign to the
+        # same worker) must not touch the bookkeeping of the new one
+        if session is None or (event.get("pid") and session.pid and session.pid != event["pid"]):
+            continue
+        if message.get("type") == "status" and message.get("status") == StreamStatus.stopped.value:
+            if session.status == StreamStatus.running:
+                session.status = StreamStatus.stopped
+                session.end_time = datetime.now(timezone.utc)
+                quotas.release(session.id)
+                if message.get("avg_bitrate"):
+                    session.avg_bitrate = message["avg_bitrate"]
+                db.commit()
+            ws_manager.forget(session_id)
+        else:
+            ws_manager.update_last_stats(session_id, message)
+        await ws_manager.broadcast(session_id, message)
+
+
+async def monitor_workers(session_factory) -> None:
+    # re-place running sessions whose worker stopped heartbeating
+    from .ffmpeg_runner import start_ffmpeg
+
+    while True:
+        await asyncio.sleep(settings.worker_heartbeat_timeout)
+        try:
+            await _fail_over(session_factory, start_ffmpeg)
+        except Exception:
+            # one bad pass must not end failover for good
+            logger.exception("worker monitor pass failed")
+
+
+async def _fail_over(session_factory, start_ffmpeg) -> None:
+    db = session_factory()
+    try:
+        orphaned = (
+            db.query(StreamSession)
+            .join(WorkerNode, WorkerNode.id == StreamSession.worker_id)
+            .filter(StreamSession.status == StreamStatus.running, WorkerNode.last_heartbeat < _alive_cutoff())
+            .all()
+        )
+        for session in orphaned:
+            session.pid = None
+            session.worker_id = None
+            db.commit()
+            try:
+                await start_ffmpeg(db, session)
+            except Exception as exc:
+                logger.warning("failover of session %s failed: %s", session.id, exc)
+                db.rollback()
+                session.status = StreamStatus.stopped
+                session.end_time = datetime.now(timezone.utc)
+                db.commit()
+    finally:
+        db.close()
@@ -0,0 +1 @@
+# Worker agent: runs ffmpeg sessions assigned by the API (python -m app.worker)
@@ -0,0 +1,7 @@
+import uvicorn
+
+from ..config import settings
+
+
+if __name__ == "__main__":
+    uvicorn.run("app.worker.agent:app", host="0.0.0.0", port=settings.worker_port)
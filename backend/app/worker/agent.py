@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from fastapi import Depends, FastAPI, HTTPException
+from pydantic import BaseModel
+
+from ..config import settings
+from ..dependencies import require_worker_token
+from ..services.ffmpeg_runner import (
+    _ProcessHandle,
+    _parse_stats,
+    _pid_alive,
+    _session_log_path,
+    _tail_lines,
+    spawn_ffmpeg,
+    stop_ffmpeg,
+)
+from ..services.workers import WorkerError, call
+
+
+class AssignRequest(BaseModel):
+    session_id: int
+    cmd: List[str]
+
+
+app = FastAPI(title=f"{settings.app_name} worker")
+
+worker_id: int | None = None
+_handles: Dict[int, _ProcessHandle] = {}
+_destinations: Dict[int, str] = {}
+# latest stats per session are coalesced between flushes; status events are all kept.
+# Every event carries the pid it came from so the API can drop late ones of a replaced process
+_pending_stats: Dict[int, dict] = {}
+_pending_events: List[dict] = []
+
+
+def _state_path() -> Path:
+    return Path(settings.runtime_dir) / "worker_sessions.json"
+
+
+def _save_state() -> None:
+    state = {str(sid): {"pid": h.pid, "destination": _destinations.get(sid)} for sid, h in _handles.items()}
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+async def _pump(session_id: int, handle: _ProcessHandle, destination: str, from_end: bool) -> None:
+    last_bitrate = None
+    async for line in _tail_lines(_session_log_path(session_id), handle, from_end):
+        stats = _parse_stats(line)
+        if stats and _handles.get(session_id) is handle:
+            last_bitrate = stats.bitrate
+            _pending_stats[session_id] = {
+                "pid": handle.pid,
+                "type": "stats",
+                "bitrate": stats.bitrate,
+                "fps": stats.fps,
+                "dropped_frames": stats.dropped_frames,
+                "speed": stats.speed,
+                "rtmp_url": destination,
+                "status": "running",
+            }
+    await handle.wait()
+    if _handles.get(session_id) is not handle:
+        # replaced by a newer process for the same session; its end is not the session's
+        return
+    _handles.pop(session_id, None)
+    _destinations.pop(session_id, None)
+    _save_state()
+    _session_log_path(session_id).unlink(missing_ok=True)
+    _pending_stats.pop(session_id, None)
+    _pending_events.append({
+        "session_id": session_id,
+        "pid": handle.pid,
+        "message": {"type": "status", "status": "stopped", "rtmp_url": destination, "avg_bitrate": last_bitrate},
+    })
+
+
+def _track(session_id: int, handle: _ProcessHandle, destination: str, from_end: bool = False) -> None:
+    _handles[session_id] = handle
+    _destinations[session_id] = destination
+    _save_state()
+    asyncio.create_task(_pump(session_id, handle, destination, from_end))
+
+
+async def _register() -> None:
+    global worker_id
+    while worker_id is None:
+        try:
+            result = await call("POST", f"{settings.api_url}/api/workers/register", {
+                "name": settings.worker_name,
+                "url": settings.worker_url,
+                "capacity": settings.worker_capacity,
+            })
+            worker_id = int(result["id"])
+        except WorkerError:
+            await asyncio.sleep(2)
+
+
+async def _heartbeat_loop() -> None:
+    interval = max(1.0, settings.worker_heartbeat_timeout / 3)
+    while True:
+        try:
+            await call("POST", f"{settings.api_url}/api/workers/{worker_id}/heartbeat", {
+                "active_sessions": len(_handles),
+                "load": f"{os.getloadavg()[0]:.2f}",
+            })
+        except WorkerError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.worker_flush_interval)
+        sent_events = _pending_events[:]
+        sent_stats = dict(_pending_stats)
+        events = sent_events + [
+            {"session_id": sid, "pid": msg["pid"], "message": {k: v for k, v in msg.items() if k != "pid"}}
+            for sid, msg in sent_stats.items()
+        ]
+        if not events:
+            continue
+        try:
+            await call("POST", f"{settings.api_url}/api/workers/{worker_id}/events", {"events": events})
+        except WorkerError:
+            # everything stays pending for the next attempt; newer stats simply replace older ones
+            continue
+        del _pending_events[:len(sent_events)]
+        for sid, msg in sent_stats.items():
+            if _pending_stats.get(sid) is msg:
+                _pending_stats.pop(sid, None)
+
+
+def _readopt() -> None:
+    try:
+        state = json.loads(_state_path().read_text())
+    except (OSError, ValueError):
+        return
+    for sid, entry in state.items():
+        pid, destination = entry.get("pid"), entry.get("destination")
+        if not pid or not destination or not _pid_alive(pid):
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if destination.encode() not in f.read():
+                    continue
+        except OSError:
+            continue
+        _track(int(sid), _ProcessHandle(pid), destination, from_end=True)
+
+
+@app.on_event("startup")
+async def _startup() -> None:
+    _readopt()
+    await _register()
+    asyncio.create_task(_heartbeat_loop())
+    asyncio.create_task(_flush_loop())
+
+
+@app.post("/sessions", dependencies=[Depends(require_worker_token)])
+async def assign(payload: AssignRequest):
+    if not payload.cmd or payload.cmd[0] != "ffmpeg":
+        raise HTTPException(status_code=400, detail="Only ffmpeg commands are accepted")
+    existing = _handles.get(payload.session_id)
+    if existing and existing.alive():
+        stop_ffmpeg(existing.pid)
+    if len(_handles) >= settings.worker_capacity:
+        raise HTTPException(status_code=503, detail="Worker at capacity")
+    process = await spawn_ffmpeg(payload.session_id, payload.cmd)
+    _track(payload.session_id, _ProcessHandle(process.pid, process), payload.cmd[-1])
+    return {"pid": process.pid}
+
+
+@app.get("/sessions", dependencies=[Depends(require_worker_token)])
+def list_sessions():
+    return {"sessions": {sid: {"pid": h.pid, "alive": h.alive()} for sid, h in _handles.items()}}
+
+
+@app.get("/sessions/{session_id}", dependencies=[Depends(require_worker_token)])
+def session_state(session_id: int):
+    handle = _handles.get(session_id)
+    return {"alive": bool(handle and handle.alive()), "pid": handle.pid if handle else None}
+
+
+@app.delete("/sessions/{session_id}", dependencies=[Depends(require_worker_token)])
+def stop(session_id: int):
+    handle = _handles.get(session_id)
+    if handle:
+        stop_ffmpeg(handle.pid)
+    return {"status": "stopped"}
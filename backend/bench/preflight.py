@@ -0,0 +1,115 @@
+"""Destination preflight check against local listeners.
+
+Starts a minimal RTMP handshake server plus a few misbehaving endpoints on
+127.0.0.1, runs the preflight against each of them and prints the results as
+JSON. Exits non-zero when a result does not match what the endpoint should
+produce. Pass ``--url`` to check real destinations instead, e.g. an
+``ffmpeg -listen 1 -i rtmp://127.0.0.1:1935/live/test`` sink or nginx-rtmp.
+
+Usage (from ``backend/``)::
+
+    python -m bench.preflight
+    python -m bench.preflight --url rtmp://127.0.0.1:1935/live/test
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from dataclasses import asdict
+from typing import List, Optional
+
+from app.config import settings
+from app.services.preflight import HANDSHAKE_SIZE, RTMP_VERSION, DestinationPreflight
+
+
+async def _rtmp_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # S0 + S1 + S2 (echo of C1), then wait for C2 like a real server would
+    try:
+        c0c1 = await reader.readexactly(1 + HANDSHAKE_SIZE)
+        s1 = (int(time.monotonic() * 1000) & 0xFFFFFFFF).to_bytes(4, "big") + bytes(4) + os.urandom(HANDSHAKE_SIZE - 8)
+        writer.write(bytes([RTMP_VERSION]) + s1 + c0c1[1:])
+        await writer.drain()
+        await reader.readexactly(HANDSHAKE_SIZE)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _silent_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # accepts and never answers: a port that is open but not RTMP (or a hung server)
+    await reader.read()
+    writer.close()
+
+
+async def _closing_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    writer.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _self_test() -> List[dict]:
+    servers = [await asyncio.start_server(handler, "127.0.0.1", 0) for handler in (_rtmp_server, _silent_server, _closing_server)]
+    rtmp, silent, closing = (s.sockets[0].getsockname()[1] for s in servers)
+    cases = [
+        (f"rtmp://127.0.0.1:{rtmp}/live/key", True, None),
+        (f"rtmp://127.0.0.1:{silent}/live/key", False, "handshake"),
+        (f"rtmp://127.0.0.1:{closing}/live/key", False, "handshake"),
+        (f"rtmp://127.0.0.1:{_free_port()}/live/key", False, "connect"),
+        ("rtmp://name.invalid/live/key", False, "dns"),
+        ("rtmp://127.0.0.1:99999/live/key", False, "url"),
+        ("srt://127.0.0.1:9000", True, "skipped"),
+    ]
+    checker = DestinationPreflight()
+    try:
+        results = await checker.check_all(url for url, _, _ in cases)
+        # a second pass within the cache window must not touch the network
+        again = await checker.check(cases[0][0])
+    finally:
+        for server in servers:
+            server.close()
+    report = []
+    for (url, ok, stage), result in zip(cases, results):
+        entry = asdict(result)
+        entry["expected"] = {"ok": ok, "stage": stage}
+        entry["pass"] = result.ok == ok and result.stage == stage
+        report.append(entry)
+    report.append({"destination": cases[0][0], "cached": again.cached, "pass": again.cached and again.ok})
+    return report
+
+
+async def _check_urls(urls: List[str]) -> List[dict]:
+    return [asdict(r) for r in await DestinationPreflight().check_all(urls)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", action="append", default=[], help="destination to check (repeatable)")
+    parser.add_argument("--no-handshake", action="store_true", help="TCP connect only")
+    parser.add_argument("--timeout", type=float, default=None)
+    args = parser.parse_args(argv)
+    if args.no_handshake:
+        settings.preflight_handshake = False
+    if args.timeout is not None:
+        settings.preflight_timeout = args.timeout
+    if args.url:
+        report = asyncio.run(_check_urls(args.url))
+        failed = [r for r in report if not r["ok"]]
+    else:
+        report = asyncio.run(_self_test())
+        failed = [r for r in report if not r["pass"]]
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
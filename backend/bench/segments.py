@@ -0,0 +1,104 @@
+"""Segment cache check on generated media.
+
+Renders two short test clips (one without audio), cuts them into the segment
+cache the way ingest does, and then stream-copies the joined sets the way a
+looped, resumed playlist would (``-stream_loop``, ``-ss``, ``-c copy``) into
+the null muxer. Prints manifest summaries and timings as JSON and exits
+non-zero when a cut fails verification or a copy join is rejected.
+
+Usage (from ``backend/``)::
+
+    python -m bench.segments
+    python -m bench.segments --seconds 20 --size 1920x1080
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional
+
+from app.config import settings
+
+
+def _render(path: Path, seconds: int, size: str, audio: bool) -> None:
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}"]
+    if audio:
+        args += ["-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}"]
+    args += ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p"]
+    if audio:
+        args += ["-c:a", "aac"]
+    subprocess.run([*args, str(path)], check=True)
+
+
+def _copy_join(segments: List[Path], extra: List[str], workdir: Path) -> Optional[str]:
+    listing = workdir / f"join_{len(extra)}.txt"
+    listing.write_text("\n".join(f"file '{p}'" for p in segments))
+    proc = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", *extra,
+         "-f", "concat", "-safe", "0", "-i", str(listing), "-c", "copy", "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    return None if proc.returncode == 0 else proc.stderr.strip()[:300]
+
+
+async def _run(seconds: int, size: str) -> dict:
+    from app.services.media_probe import probe_media
+    from app.services.segments import ensure_segments
+
+    report: dict = {"clips": [], "joins": []}
+    with tempfile.TemporaryDirectory(prefix="segbench_") as tmp:
+        workdir = Path(tmp)
+        settings.cache_dir = workdir / "cache"
+        sets = []
+        for idx, audio in enumerate((True, False), start=1):
+            clip = workdir / f"clip{idx}.mp4"
+            _render(clip, seconds + idx, size, audio)
+            info = await probe_media(str(clip))
+            info["content"] = "normal"
+            started = time.perf_counter()
+            error = None
+            try:
+                found = await ensure_segments(SimpleNamespace(id=idx, filepath=str(clip)), info)
+            except RuntimeError as exc:
+                found, error = None, str(exc)
+            report["clips"].append({
+                "error": error,
+                "source_duration": info["duration"],
+                "audio": audio,
+                "cut_seconds": round(time.perf_counter() - started, 2),
+                "segments": len(found.segments) if found else 0,
+                "duration": found.duration if found else None,
+                "format": found.format if found else None,
+            })
+            sets.append(found)
+        if any(found is None for found in sets):
+            report["ok"] = False
+            return report
+        paths = [seg.path for found in sets for seg in found.segments]
+        for name, extra in (("join", []), ("loop", ["-stream_loop", "1"]), ("resume", ["-ss", f"{seconds / 2:.3f}"])):
+            error = _copy_join(paths, extra, workdir)
+            report["joins"].append({"case": name, "ok": error is None, "error": error})
+    report["ok"] = all(j["ok"] for j in report["joins"])
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=int, default=10, help="length of the first clip")
+    parser.add_argument("--size", default="1280x720")
+    args = parser.parse_args(argv)
+    report = asyncio.run(_run(args.seconds, args.size))
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""Soak / load benchmark for the ffmpeg runner.
+
+Runs N concurrent ``start_ffmpeg`` sessions against local RTMP sinks
+(``ffmpeg -listen 1``) using generated test media and writes the measured
+numbers as JSON so runs can be compared between releases.
+
+Usage (from ``backend/``)::
+
+    python -m bench.soak --sessions 8 --duration 60 --output results.json
+    python -m bench.soak --sessions 8 --compare results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _summary(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def _cpu_ticks(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 (1-based) in proc(5)
+        return int(fields[11]) + int(fields[12])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def generate_media(path: Path, seconds: int, size: str, fps: int) -> None:
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+        "-f", "lavfi", "-i", "sine=frequency=1000:sample_rate=48000",
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps * 2), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k",
+        str(path),
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def start_sink(port: int) -> subprocess.Popen:
+    # stream copy into the null muxer so the sink itself costs next to no CPU
+    return subprocess.Popen(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-listen", "1", "-i", f"rtmp://127.0.0.1:{port}/live/bench",
+            "-c", "copy", "-f", "null", "-",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+class RecordingClient:
+    """Stand-in for a dashboard WebSocket; records delivery latency."""
+
+    def __init__(self) -> None:
+        self.latencies_ms: List[float] = []
+        self.speeds: List[float] = []
+        self.dropped: Optional[int] = None
+        self.messages = 0
+
+    async def accept(self) -> None:
+        return None
+
+    async def send_json(self, message: dict) -> None:
+        self.messages += 1
+        server_time = message.get("server_time")
+        if server_time is not None:
+            self.latencies_ms.append(time.time() * 1000 - server_time)
+        if message.get("speed"):
+            try:
+                self.speeds.append(float(message["speed"]))
+            except ValueError:
+                pass
+        if message.get("dropped_frames") is not None:
+            self.dropped = int(message["dropped_frames"])
+
+
+async def sample_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.1) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        before = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - before - interval) * 1000)
+
+
+async def _asgi_get(app, path: str, token: Optional[str]) -> int:
+    headers = [(b"host", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    status: Dict[str, int] = {}
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status.get("code", 0)
+
+
+async def drive_api(app, token: str, paths: List[str], rps: float, samples: Dict[str, List[float]], stop: asyncio.Event) -> None:
+    interval = 1.0 / rps if rps > 0 else 1.0
+    while not stop.is_set():
+        for path in paths:
+            t0 = time.perf_counter()
+            await _asgi_get(app, path, token)
+            samples.setdefault(path, []).append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="cloudrtmp-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir / 'bench.db'}?check_same_thread=false")
+    os.environ.setdefault("VIDEOS_DIR", str(workdir / "videos"))
+    for name in ("CACHE_DIR", "RUNTIME_DIR", "HLS_DIR"):
+        os.environ.setdefault(name, str(workdir / name.lower()))
+    os.environ["AUTO_RESTART_STREAMS"] = "0"
+    # one process per session so per-stream pid / CPU numbers stay comparable with the
+    # baseline; no background segment cuts competing for CPU during the run
+    os.environ["SHARED_DECODE_WINDOW_MS"] = "0"
+    os.environ["SEGMENT_CACHE_ENABLED"] = "0"
+
+    # imported late so the settings above are picked up
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.models import Base, StreamMode, StreamSession, StreamSourceType, StreamStatus, User, UserRole, Video
+    from app.services.ffmpeg_runner import start_ffmpeg, stop_ffmpeg
+    from app.services.websocket_manager import ws_manager
+    from app.utils.security import create_access_token
+
+    Base.metadata.create_all(bind=engine)
+
+    media = Path(args.media) if args.media else workdir / "bench.mp4"
+    if not media.exists():
+        generate_media(media, args.media_seconds, args.size, args.fps)
+
+    db = SessionLocal()
+    user = db.query(User).filter(User.username == "bench").first()
+    if not user:
+        user = User(username="bench", email="bench@example.com", password_hash="-", role=UserRole.admin)
+        db.add(user)
+    video = Video(filename=media.name, filepath=str(media), uploaded_by=None)
+    db.add(video)
+    db.commit()
+    token = create_access_token({"sub": user.username, "role": user.role.value})
+
+    sinks = [start_sink(args.base_port + i) for i in range(args.sessions)]
+    await asyncio.sleep(1.0)
+
+    clients: Dict[int, List[RecordingClient]] = {}
+    sessions: List[StreamSession] = []
+    for i in range(args.sessions):
+        s = StreamSession(
+            user_id=user.id,
+            source_type=StreamSourceType.video,
+            source_id=video.id,
+            destination=f"rtmp://127.0.0.1:{args.base_port + i}/live/bench",
+            mode=StreamMode.loop_video,
+            status=StreamStatus.running,
+        )
+        db.add(s)
+        db.commit()
+        clients[s.id] = [RecordingClient() for _ in range(args.ws_clients)]
+        for client in clients[s.id]:
+            await ws_manager.connect(s.id, client)
+        sessions.append(s)
+
+    stop = asyncio.Event()
+    lag_samples: List[float] = []
+    api_samples: Dict[str, List[float]] = {}
+    background = [asyncio.create_task(sample_loop_lag(lag_samples, stop))]
+    if args.api_rps > 0:
+        paths = ["/api/health", "/api/streams/active"]
+        background.append(asyncio.create_task(drive_api(app, token, paths, args.api_rps, api_samples, stop)))
+
+    t_spawn = time.perf_counter()
+    pids = await asyncio.gather(*(start_ffmpeg(db, s) for s in sessions))
+    spawn_ms = (time.perf_counter() - t_spawn) * 1000
+    cpu_start = {pid: _cpu_ticks(pid) for pid in pids}
+    t_start = time.monotonic()
+
+    await asyncio.sleep(args.duration)
+
+    elapsed = time.monotonic() - t_start
+    cpu_end = {pid: _cpu_ticks(pid) for pid in pids}
+    stop.set()
+    for pid in pids:
+        stop_ffmpeg(pid)
+    await asyncio.gather(*background, return_exceptions=True)
+    await asyncio.sleep(1.0)
+    for sink in sinks:
+        sink.terminate()
+    # read before close: closing detaches the rows and their attributes can no longer load
+    session_ids = [s.id for s in sessions]
+    db.close()
+
+    per_session = []
+    for session_id, pid in zip(session_ids, pids):
+        session_clients = clients[session_id]
+        cpu = None
+        if cpu_start.get(pid) is not None and cpu_end.get(pid) is not None:
+            cpu = (cpu_end[pid] - cpu_start[pid]) / CLK_TCK / elapsed * 100
+        per_session.append({
+            "session_id": session_id,
+            "pid": pid,
+            "cpu_percent": cpu,
+            "speed": _summary(session_clients[0].speeds),
+            "dropped_frames": session_clients[0].dropped,
+            "ws_messages": sum(c.messages for c in session_clients),
+            "ws_latency_ms": _summary([v for c in session_clients for v in c.latencies_ms]),
+        })
+
+    cpu_values = [p["cpu_percent"] for p in per_session if p["cpu_percent"] is not None]
+    speed_values = [v for cs in clients.values() for v in cs[0].speeds]
+    ws_values = [v for cs in clients.values() for c in cs for v in c.latencies_ms]
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_rev": _git_rev(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sessions": args.sessions,
+            "ws_clients_per_session": args.ws_clients,
+            "duration_s": round(elapsed, 2),
+            "media": str(media),
+        },
+        "summary": {
+            "spawn_all_ms": spawn_ms,
+            "cpu_percent_per_stream": _summary(cpu_values),
+            "speed_ratio": _summary(speed_values),
+            "dropped_frames_total": sum(p["dropped_frames"] or 0 for p in per_session),
+            "loop_lag_ms": _summary(lag_samples),
+            "ws_broadcast_latency_ms": _summary(ws_values),
+            "api_latency_ms": {path: _summary(v) for path, v in api_samples.items()},
+        },
+        "sessions": per_session,
+    }
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(prefix: str, value, out: Dict[str, float]) -> None:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = float(value)
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    cur: Dict[str, float] = {}
+    base: Dict[str, float] = {}
+    _flatten("", current.get("summary", {}), cur)
+    _flatten("", baseline.get("summary", {}), base)
+    lines = []
+    for key in sorted(cur.keys() & base.keys()):
+        if base[key] == 0:
+            continue
+        delta = (cur[key] - base[key]) / abs(base[key]) * 100
+        lines.append(f"{key:50s} {base[key]:12.3f} -> {cur[key]:12.3f} ({delta:+.1f}%)")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CloudRTMP soak benchmark")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep all sessions running")
+    parser.add_argument("--ws-clients", type=int, default=1, help="fake dashboard clients per session")
+    parser.add_argument("--api-rps", type=float, default=5.0, help="API probe rate while streaming (0 disables)")
+    parser.add_argument("--base-port", type=int, default=19350)
+    parser.add_argument("--media", help="existing media file; generated when omitted")
+    parser.add_argument("--media-seconds", type=int, default=20)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--workdir")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline JSON to diff the summary against")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        parser.error("ffmpeg not found on PATH")
+
+    result = asyncio.run(run(args))
+    Path(args.output).write_text(json.dumps(result, indent=2))
+    print(json.dumps(result["summary"], indent=2))
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        print("\n".join(compare(result, baseline)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from app.config import settings
+from app.services.overlays import _drawtext, _option_value, dynamic_filters
+
+
+def _token(s: str, i: int, terms: str):
+    # av_get_token(): backslash escapes one character, '...' is taken literally
+    out = []
+    while i < len(s) and s[i] not in terms:
+        if s[i] == "\\" and i + 1 < len(s):
+            out.append(s[i + 1])
+            i += 2
+        elif s[i] == "'":
+            end = s.index("'", i + 1)
+            out.append(s[i + 1:end])
+            i = end + 1
+        else:
+            out.append(s[i])
+            i += 1
+    return "".join(out), i
+
+
+def _drawtext_options(graph: str) -> dict:
+    # what ffmpeg hands to drawtext: filtergraph unescape, then key=value:key=value
+    assert graph.startswith("drawtext=")
+    args, end = _token(graph, len("drawtext="), "[],;")
+    assert end == len(graph)
+    opts, i = {}, 0
+    while i < len(args):
+        key, i = _token(args, i, "=:")
+        value, i = _token(args, i + 1, ":")
+        opts[key] = value
+        i += 1
+    return opts
+
+
+def test_text_survives_both_escaping_levels():
+    text = "Now playing: it's [live], 50% \\ done; ok"
+    opts = _drawtext_options(_drawtext({}, _option_value(text)))
+    assert opts["text"] == text
+    assert opts["expansion"] == "none"
+    assert opts["fontfile"] == settings.overlay_font
+
+
+def test_ticker_keeps_text_and_scroll_expression():
+    layer = {"type": "ticker", "text": "Breaking: it's here", "speed": 50}
+    opts = _drawtext_options(dynamic_filters([layer])[0])
+    assert opts["text"] == "Breaking: it's here"
+    assert opts["x"] == "w-mod(t*50,w+tw)"
+
+
+def test_clock_format_keeps_its_escaped_colons():
+    opts = _drawtext_options(dynamic_filters([{"type": "clock"}])[0])
+    assert opts["text"] == "%{localtime:%H:%M:%S}"
+    assert opts["expansion"] == "normal"
@@ -26,12 +26,31 @@ fi
 
 cd "$APP_DIR"
 
-docker compose pull || true
-docker compose build --no-cache
-docker compose up -d
-
-echo "Running alembic migrations..."
-docker compose exec -T backend bash -lc "alembic upgrade head" || true
+# The backend image only needs rebuilding when its Dockerfile or requirements change;
+# the code itself is bind-mounted. Otherwise restart uvicorn inside the running container:
+# ffmpeg runs detached there and is re-adopted by the new instance, so live streams are not cut.
+IMAGE_HASH_FILE="$APP_DIR/.backend_image_hash"
+IMAGE_HASH=$(cat backend/Dockerfile backend/requirements.txt | sha256sum | cut -d' ' -f1)
+BACKEND_RUNNING=$(docker compose ps --status running -q backend 2>/dev/null || true)
+
+# Migrations run before the new code starts so it never boots against the old schema.
+# Only the python process is signalled: the `sh -c` loop around it carries the same
+# command line, and if it died tini and the container (with every stream) would follow.
+if [[ -n "$BACKEND_RUNNING" ]] && [[ -f "$IMAGE_HASH_FILE" ]] && [[ "$(cat "$IMAGE_HASH_FILE")" == "$IMAGE_HASH" ]] && [[ -z "${FORCE_REBUILD:-}" ]]; then
+  echo "Running alembic migrations..."
+  docker compose exec -T backend sh -c "alembic upgrade head"
+  echo "Backend image unchanged, reloading uvicorn in place..."
+  docker compose exec -T backend sh -c "pkill -TERM -f '^python -m uvicorn uvicorn_app:app'" || true
+  docker compose up -d --no-deps frontend
+else
+  docker compose pull || true
+  docker compose build --no-cache
+  docker compose up -d db
+  echo "Running alembic migrations..."
+  docker compose run --rm -T backend alembic upgrade head
+  docker compose up -d
+  echo "$IMAGE_HASH" > "$IMAGE_HASH_FILE"
+fi
 
 echo "CloudRTMP deployed. Backend on port 8000, Frontend on 5173."
 